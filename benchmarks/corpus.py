@@ -0,0 +1,262 @@
+"""
+Generator of synthetic AWS Textract AnalyzeDocument results.
+
+All forms share one layout: each page has question groups in horizontal bands, every group consists of four options
+with check boxes and a text field. The groups alternate between single and multi selects. The selected options and
+text values are random per form, OCR noise changes characters of the labels, lowers the confidence and drops fields.
+The blocks are structured like real Textract results, so that the Textract Response Parser can parse them as well.
+
+    python -m benchmarks.corpus target_folder [--forms 100] [--pages 2] [--fields 40] [--noise 0.02] [--seed 0]
+"""
+import argparse
+import json
+import os
+import random
+import string
+import typing
+import uuid
+from dataclasses import dataclass
+
+from form_analyzer import FormField, FormFields
+from form_analyzer.filters import Location, Page
+from form_analyzer.selectors import MultiSelect, SingleSelect, TextField
+
+__ADJECTIVES = ['red', 'quick', 'daily', 'rarely', 'public', 'private', 'large', 'small', 'early', 'late', 'young',
+                'old', 'local', 'remote', 'weekly', 'never']
+__NOUNS = ['bicycle', 'train', 'garden', 'kitchen', 'office', 'school', 'doctor', 'market', 'holiday', 'weekend',
+           'family', 'neighbour', 'library', 'festival', 'harbour', 'village']
+
+OPTIONS_PER_GROUP = 4
+FIELDS_PER_GROUP = OPTIONS_PER_GROUP + 1
+
+
+@dataclass
+class CorpusSpec:
+    """
+    Scale and noise of a synthetic corpus.
+
+    :param forms: Number of forms
+    :param pages_per_form: Number of pages per form
+    :param fields_per_page: Number of fields per page, rounded down to whole question groups of five fields
+    :param noise: Probability of an OCR error per label character, also scales the dropped fields and low confidences
+    :param seed: Seed of the random number generator
+    """
+    forms: int = 100
+    pages_per_form: int = 2
+    fields_per_page: int = 40
+    noise: float = .02
+    seed: int = 0
+
+    @property
+    def groups_per_page(self) -> int:
+        return max(1, self.fields_per_page // FIELDS_PER_GROUP)
+
+
+@dataclass
+class _Group:
+    page: int
+    top: float
+    bottom: float
+    question: str
+    options: typing.List[str]
+    multi: bool
+
+
+def __layout(spec: CorpusSpec) -> typing.List[_Group]:
+    rng = random.Random(spec.seed)
+    groups = []
+    band_height = .9 / spec.groups_per_page
+    for page in range(spec.pages_per_form):
+        for index in range(spec.groups_per_page):
+            top = .05 + index * band_height
+            labels = rng.sample([f'{adjective} {noun}' for adjective in __ADJECTIVES for noun in __NOUNS],
+                                OPTIONS_PER_GROUP)
+            groups.append(_Group(page, top, top + band_height, f'Question {page + 1}.{index + 1} comment', labels,
+                                 index % 2 == 1))
+    return groups
+
+
+def keywords_per_page(spec: CorpusSpec) -> typing.List[typing.List[str]]:
+    return [[f'Synthetic form page {page + 1} of'] for page in range(spec.pages_per_form)]
+
+
+def form_fields(spec: CorpusSpec) -> FormFields:
+    """
+    Builds the form description of the corpus.
+    """
+    fields = []
+    for group in __layout(spec):
+        filter_ = Page(group.page) & Location(vertical=(group.top, group.bottom))
+        selector = MultiSelect(group.options, filter_) if group.multi else SingleSelect(group.options, filter_)
+        fields.append(FormField(group.question.replace(' comment', ''), selector))
+        fields.append(FormField(group.question, TextField(group.question, filter_)))
+    return fields
+
+
+class _PageBuilder:
+    """
+    Builds the blocks of a page like AWS Textract does.
+
+    The PAGE block has the LINE and KEY_VALUE_SET blocks as children, the WORD blocks of the lines are shared with the
+    keys and values. Every block has a geometry and a random UUID as ID.
+    """
+    def __init__(self, rng: random.Random):
+        self.__rng = rng
+        self.__page_children: typing.List[str] = []
+        self.blocks: typing.List[typing.Dict] = []
+        self.__add({'BlockType': 'PAGE', 'Geometry': self.__geometry(1, 1, 0, 0),
+                    'Relationships': [{'Type': 'CHILD', 'Ids': self.__page_children}]})
+
+    @staticmethod
+    def __geometry(width: float, height: float, left: float, top: float) -> typing.Dict:
+        return {'BoundingBox': {'Width': width, 'Height': height, 'Left': left, 'Top': top},
+                'Polygon': [{'X': left, 'Y': top}, {'X': left + width, 'Y': top},
+                            {'X': left + width, 'Y': top + height}, {'X': left, 'Y': top + height}]}
+
+    def __add(self, block: typing.Dict, page_child: bool = False) -> str:
+        block['Id'] = str(uuid.UUID(int=self.__rng.getrandbits(128), version=4))
+        self.blocks.append(block)
+        if page_child:
+            self.__page_children.append(block['Id'])
+        return block['Id']
+
+    def __add_line(self, text: str, confidence: float, width: float, left: float, top: float) -> typing.List[str]:
+        words = text.split()
+        if not words:
+            return []
+
+        line = {'BlockType': 'LINE', 'Text': ' '.join(words), 'Confidence': confidence,
+                'Geometry': self.__geometry(width, .02, left, top)}
+        self.__add(line, True)
+        # The words share the width of the line by their number of characters
+        character_width = width / len(line['Text'])
+        word_ids = []
+        for word in words:
+            word_ids.append(self.__add({'BlockType': 'WORD', 'Text': word, 'TextType': 'PRINTED', 'Confidence': confidence,
+                                        'Geometry': self.__geometry(len(word) * character_width, .02, left, top)}))
+            left += (len(word) + 1) * character_width
+        line['Relationships'] = [{'Type': 'CHILD', 'Ids': word_ids}]
+        return word_ids
+
+    def add_line(self, text: str, top: float):
+        self.__add_line(text, 99., .5, .1, top)
+
+    def add_field(self, key: str, value: typing.Union[str, bool], confidence: float, left: float, top: float):
+        key_children = self.__add_line(key, confidence, .15, left, top)
+        if isinstance(value, bool):
+            value_geometry = self.__geometry(.02, .02, left + .16, top)
+            value_children = [self.__add({'BlockType': 'SELECTION_ELEMENT', 'Confidence': confidence,
+                                          'SelectionStatus': 'SELECTED' if value else 'NOT_SELECTED',
+                                          'Geometry': value_geometry})]
+        else:
+            value_geometry = self.__geometry(.5, .02, left + .2, top)
+            value_children = self.__add_line(value, confidence, .5, left + .2, top)
+
+        # Textract leaves out relationships without IDs
+        value_block = {'BlockType': 'KEY_VALUE_SET', 'EntityTypes': ['VALUE'], 'Confidence': confidence,
+                       'Geometry': value_geometry}
+        if value_children:
+            value_block['Relationships'] = [{'Type': 'CHILD', 'Ids': value_children}]
+        value_id = self.__add(value_block, True)
+
+        key_relationships = [{'Type': 'VALUE', 'Ids': [value_id]}]
+        if key_children:
+            key_relationships.append({'Type': 'CHILD', 'Ids': key_children})
+        self.__add({'BlockType': 'KEY_VALUE_SET', 'EntityTypes': ['KEY'], 'Confidence': confidence,
+                    'Geometry': self.__geometry(.15, .02, left, top), 'Relationships': key_relationships}, True)
+
+
+def __ocr(text: str, rng: random.Random, noise: float) -> str:
+    chars = []
+    for char in text:
+        error = rng.random()
+        if error < noise / 3:
+            continue
+        elif error < noise * 2 / 3:
+            chars.append(rng.choice(string.ascii_lowercase))
+        elif error < noise:
+            chars.extend([char, rng.choice(string.ascii_lowercase)])
+        else:
+            chars.append(char)
+    return ''.join(chars)
+
+
+def __confidence(rng: random.Random, noise: float) -> float:
+    return 20. if rng.random() < noise * 5 else rng.uniform(80, 99.9)
+
+
+def generate_page(spec: CorpusSpec, groups: typing.List[_Group], page: int, rng: random.Random) -> typing.Dict:
+    """
+    Generates the AnalyzeDocument response of a page of a form.
+    """
+    builder = _PageBuilder(rng)
+    builder.add_line(f'Synthetic form page {page + 1} of {spec.pages_per_form}', .01)
+
+    for group in groups:
+        if group.page != page:
+            continue
+        builder.add_line(group.question.replace(' comment', ''), group.top)
+        if group.multi:
+            selected = [rng.random() < .3 for _ in group.options]
+        else:
+            choice = rng.randrange(len(group.options) + 1)
+            selected = [index == choice for index in range(len(group.options))]
+
+        for index, (option, is_selected) in enumerate(zip(group.options, selected)):
+            if rng.random() >= spec.noise:
+                builder.add_field(__ocr(option, rng, spec.noise), is_selected, __confidence(rng, spec.noise),
+                                  .1 + index * .2, group.top + .03)
+
+        text = ' '.join(rng.sample(__NOUNS, rng.randrange(3)))
+        builder.add_field(__ocr(group.question, rng, spec.noise), text, __confidence(rng, spec.noise),
+                          .1, group.top + .07)
+
+    return {'DocumentMetadata': {'Pages': 1}, 'Blocks': builder.blocks}
+
+
+def generate_corpus(folder: str, spec: CorpusSpec) -> typing.List[str]:
+    """
+    Writes the result JSON files of the corpus, named like the results of run_textract.
+
+    :param folder: Target folder, created if it does not exist
+    :param spec: Scale and noise of the corpus
+    :return: Names of the written files
+    """
+    os.makedirs(folder, exist_ok=True)
+    groups = __layout(spec)
+    rng = random.Random(spec.seed + 1)
+    file_names = []
+    for form in range(spec.forms):
+        for page in range(spec.pages_per_form):
+            file_name = os.path.join(folder, f'form_{form:06}_{page}.png.json')
+            with open(file_name, 'w') as f:
+                # Encoding the whole page at once uses the C encoder, unlike json.dump
+                f.write(json.dumps(generate_page(spec, groups, page, rng)))
+            file_names.append(file_name)
+    return file_names
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--forms', type=int, default=CorpusSpec.forms, help='Number of forms')
+    parser.add_argument('--pages', type=int, default=CorpusSpec.pages_per_form, help='Pages per form')
+    parser.add_argument('--fields', type=int, default=CorpusSpec.fields_per_page, help='Fields per page')
+    parser.add_argument('--noise', type=float, default=CorpusSpec.noise, help='OCR error probability per character')
+    parser.add_argument('--seed', type=int, default=CorpusSpec.seed, help='Random seed')
+
+
+def spec_from_arguments(args: argparse.Namespace) -> CorpusSpec:
+    return CorpusSpec(args.forms, args.pages, args.fields, args.noise, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic AWS Textract corpus')
+    parser.add_argument('folder', help='Target folder')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    file_names = generate_corpus(args.folder, spec_from_arguments(args))
+    print(f'{len(file_names)} pages written to {args.folder}')
+
+
+if __name__ == '__main__':
+    main()
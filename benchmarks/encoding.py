@@ -0,0 +1,102 @@
+"""
+Benchmark of the image encodings of converted pages.
+
+Reports the encode time and the bytes per page for each encoding setting. The pages are taken from a folder of
+images, from a PDF file (requires poppler) or generated as synthetic scanned form pages.
+
+    python -m benchmarks.encoding [folder_or_pdf] [--pages 3] [--dpi 400]
+"""
+import argparse
+import glob
+import os
+import random
+import time
+import typing
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from form_analyzer.conversion import ImageEncoding, TEXTRACT_MAX_BYTES, encode_image
+
+SETTINGS: typing.Dict[str, ImageEncoding] = {
+    'png (default)': ImageEncoding(),
+    'png level 1': ImageEncoding(compress_level=1),
+    'png grayscale level 1': ImageEncoding(compress_level=1, mode='L'),
+    'png bilevel': ImageEncoding(mode='1'),
+    'jpeg quality 90': ImageEncoding('jpeg', quality=90),
+    'jpeg grayscale quality 75': ImageEncoding('jpeg', mode='L'),
+    'png fit Textract limit': ImageEncoding(max_bytes=TEXTRACT_MAX_BYTES),
+}
+
+
+def synthetic_page(dpi: int, seed: int) -> Image.Image:
+    """
+    Generates an A4 page that looks like a scanned form: boxes, check boxes, text lines and scanner noise.
+    """
+    rng = random.Random(seed)
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    image = Image.new('RGB', (width, height), (250, 248, 240))
+    draw = ImageDraw.Draw(image)
+    line_height = dpi // 6
+    for row in range(2, int(11.69 * 6) - 2):
+        top = row * line_height
+        if rng.random() < .3:
+            draw.rectangle((dpi // 2, top, width // 2, top + line_height - 10), outline=(20, 20, 20), width=dpi // 100)
+        if rng.random() < .2:
+            box = dpi // 10
+            draw.rectangle((width // 2 + dpi // 4, top, width // 2 + dpi // 4 + box, top + box), outline=(20, 20, 20),
+                           width=dpi // 100)
+        text = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz    ') for _ in range(rng.randrange(10, 60)))
+        draw.text((dpi // 2, top + line_height // 3), text, fill=(30, 30, 80))
+
+    noise = Image.effect_noise((width, height), 8).convert('RGB')
+    return Image.blend(image, noise, .05).filter(ImageFilter.SMOOTH)
+
+
+def load_pages(folder_or_pdf: typing.Optional[str], pages: int, dpi: int) -> typing.List[Image.Image]:
+    if folder_or_pdf is None:
+        return [synthetic_page(dpi, seed) for seed in range(pages)]
+    if os.path.isdir(folder_or_pdf):
+        file_names = sorted(glob.glob(f'{folder_or_pdf}/*.png') + glob.glob(f'{folder_or_pdf}/*.jpg'))[:pages]
+        return [Image.open(file_name).convert('RGB') for file_name in file_names]
+
+    import pdf2image
+
+    return pdf2image.convert_from_path(folder_or_pdf, dpi=dpi, first_page=1, last_page=pages)
+
+
+def run(images: typing.List[Image.Image]) -> typing.List[typing.Tuple[str, float, float, int]]:
+    """
+    Encodes the images with all settings.
+
+    :return: Setting name, encode time per page in seconds, bytes per page and number of pages above the
+        Textract limit per setting
+    """
+    results = []
+    for name, encoding in SETTINGS.items():
+        sizes = []
+        start = time.perf_counter()
+        for image in images:
+            sizes.append(len(encode_image(image, encoding)))
+        duration = time.perf_counter() - start
+        results.append((name, duration / len(images), sum(sizes) / len(images),
+                        sum(size > TEXTRACT_MAX_BYTES for size in sizes)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the image encodings of converted pages')
+    parser.add_argument('folder_or_pdf', nargs='?', help='Folder of PNG/JPEG images or PDF file, default are '
+                                                         'synthetic pages')
+    parser.add_argument('--pages', type=int, default=3, help='Number of pages')
+    parser.add_argument('--dpi', type=int, default=400, help='DPI of PDF and synthetic pages')
+    args = parser.parse_args()
+
+    images = load_pages(args.folder_or_pdf, args.pages, args.dpi)
+    print(f'{len(images)} pages of {images[0].width}x{images[0].height} pixels')
+    print(f'{"Setting":<28}{"ms/page":>10}{"KB/page":>10}{"> 5 MB":>8}')
+    for name, seconds, size, too_large in run(images):
+        print(f'{name:<28}{seconds * 1000:>10.0f}{size / 1024:>10.0f}{too_large:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""
+Benchmark suite of the form analysis on a synthetic corpus.
+
+Measures the throughput of the analysis stages: parsing the Textract results, filtering the fields, matching single
+and multi selects, looking up text fields and writing the Excel workbook. Each stage is timed first and then run again
+with tracemalloc to measure its peak memory, so that the tracing does not distort the timing. If the Textract Response
+Parser is installed, parsing the corpus with it is measured as a baseline for the parse stage.
+
+    python -m benchmarks [--forms 100] [--pages 2] [--fields 40] [--noise 0.02] [--seed 0] [--corpus folder]
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+import typing
+from dataclasses import dataclass
+
+from form_analyzer import form_analyzer_logger, form_parser, memo
+from form_analyzer.analyze import FormFields, FormToSheet, get_headers
+from form_analyzer.form_parser import IndexedFieldList, ParsedForm
+from form_analyzer.selectors import MultiSelect, SingleSelect, TextField
+from form_analyzer.writers import ExcelWriter
+
+from benchmarks.corpus import CorpusSpec, add_arguments, form_fields, generate_corpus, keywords_per_page, \
+    spec_from_arguments
+
+try:
+    import trp
+except ImportError:
+    trp = None
+
+
+@dataclass
+class StageResult:
+    name: str
+    items: int
+    unit: str
+    seconds: float
+    peak_bytes: int
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.seconds if self.seconds else float('inf')
+
+    def __str__(self):
+        return f'{self.name:<16}{self.items:>8} {self.unit:<10}{self.seconds:>9.3f}s' \
+               f'{self.throughput:>12.0f}/s{self.peak_bytes / 1024 / 1024:>10.1f} MB'
+
+
+def __fresh_forms(parsed_forms: typing.List[ParsedForm]) -> typing.List[ParsedForm]:
+    # Filter results are memoized per field list, so each run starts with new lists
+    return [ParsedForm(parsed_form.page_files, IndexedFieldList(list(parsed_form.fields)))
+            for parsed_form in parsed_forms]
+
+
+def __selectors(fields: FormFields, selector_type: type) -> typing.List:
+    return [form_field.selector for form_field in fields if type(form_field.selector) is selector_type]
+
+
+def __run_stage(name: str, unit: str, setup: typing.Callable[[], typing.Any],
+                stage: typing.Callable[[typing.Any], int]) -> StageResult:
+    memo.simple_str_cache.clear()
+    memo.similarity_cache.clear()
+    start = time.perf_counter()
+    items = stage(setup())
+    seconds = time.perf_counter() - start
+
+    memo.simple_str_cache.clear()
+    memo.similarity_cache.clear()
+    argument = setup()
+    tracemalloc.start()
+    try:
+        stage(argument)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return StageResult(name, items, unit, seconds, peak_bytes)
+
+
+def run(corpus_folder: str, spec: CorpusSpec, result_folder: str) -> typing.List[StageResult]:
+    """
+    Runs all stages on a corpus.
+
+    :param corpus_folder: Folder of the corpus generated with the spec
+    :param spec: Spec of the corpus
+    :param result_folder: Folder of the written workbook
+    :return: Result of each stage
+    """
+    fields = form_fields(spec)
+    form_pages = form_parser.FormPages(spec.pages_per_form, keywords_per_page(spec))
+    parsed_forms: typing.List[ParsedForm] = []
+
+    def parse(_) -> int:
+        parsed_forms[:] = form_parser.parse(corpus_folder, form_pages)
+        return len(parsed_forms)
+
+    def parse_with_trp(file_groups: typing.List[typing.List[str]]) -> int:
+        for file_names in file_groups:
+            responses = []
+            for file_name in file_names:
+                with open(file_name) as f:
+                    responses.append(json.load(f))
+            # The document parses the form fields of all pages when it is created
+            trp.Document(responses)
+        return len(file_groups)
+
+    def apply_filters(forms: typing.List[ParsedForm]) -> int:
+        filters = [form_field.selector.filter for form_field in fields]
+        for parsed_form in forms:
+            for filter_ in filters:
+                filter_.filter(parsed_form.fields)
+        return len(forms) * len(filters)
+
+    def select_values(selector_type: type) -> typing.Callable[[typing.List[ParsedForm]], int]:
+        def values(forms: typing.List[ParsedForm]) -> int:
+            selectors = __selectors(fields, selector_type)
+            for parsed_form in forms:
+                for selector in selectors:
+                    selector.values(parsed_form.fields)
+            return len(forms) * len(selectors)
+        return values
+
+    def write_workbook(forms: typing.List[ParsedForm]) -> int:
+        result_writer = ExcelWriter(os.path.join(result_folder, 'benchmark.xlsx'))
+        result_writer.open(get_headers(fields))
+        form_to_sheet = FormToSheet(result_writer, fields)
+        for parsed_form in forms:
+            form_to_sheet.add_parsed_form(', '.join(parsed_form.page_files), parsed_form)
+        result_writer.close()
+        return len(forms)
+
+    results = [__run_stage('parse', 'forms', lambda: None, parse)]
+    if trp is not None:
+        results.append(__run_stage('parse (trp)', 'forms',
+                                   lambda: form_parser.get_form_file_groups(corpus_folder, form_pages), parse_with_trp))
+    results.append(__run_stage('filter', 'filters', lambda: __fresh_forms(parsed_forms), apply_filters))
+    results.append(__run_stage('single select', 'selects', lambda: __fresh_forms(parsed_forms),
+                               select_values(SingleSelect)))
+    results.append(__run_stage('multi select', 'selects', lambda: __fresh_forms(parsed_forms),
+                               select_values(MultiSelect)))
+    results.append(__run_stage('text field', 'lookups', lambda: __fresh_forms(parsed_forms),
+                               select_values(TextField)))
+    results.append(__run_stage('write workbook', 'forms', lambda: __fresh_forms(parsed_forms), write_workbook))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the form analysis on a synthetic AWS Textract corpus')
+    add_arguments(parser)
+    parser.add_argument('--corpus', help='Folder of the corpus, it is generated if it does not exist, default is a '
+                                         'temporary folder')
+    args = parser.parse_args()
+    spec = spec_from_arguments(args)
+    form_analyzer_logger.setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        corpus_folder = args.corpus or os.path.join(temp_folder, 'corpus')
+        if not os.path.isdir(corpus_folder):
+            start = time.perf_counter()
+            generate_corpus(corpus_folder, spec)
+            print(f'Generated {spec.forms * spec.pages_per_form} pages in {time.perf_counter() - start:.1f}s')
+
+        print(f'{"Stage":<16}{"Items":>8} {"":<10}{"Time":>10}{"Throughput":>14}{"Peak":>13}')
+        for result in run(corpus_folder, spec, temp_folder):
+            print(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,10 +4,11 @@ __author__ = "Florian Fetz"
 import logging
 
 from .analyze import analyze, dump_fields, FormDescriptionError, FormFields, FormField
-from .conversion import pdf_to_image, ProcessedImage
-from .textract import run_textract
+from .conversion import pdf_to_image, ProcessedImage, ImageEncoding, TEXTRACT_MAX_BYTES
+from .textract import run_textract, run_textract_async, run_textract_jobs, pdf_to_textract
+from .pipeline import run_pipeline
 
-__all__ = [analyze, dump_fields, FormDescriptionError, pdf_to_image, run_textract, FormFields, FormField]
+__all__ = [analyze, dump_fields, FormDescriptionError, pdf_to_image, ImageEncoding, run_textract, run_textract_async, run_textract_jobs, pdf_to_textract, run_pipeline, FormFields, FormField]
 
 
 form_analyzer_logger = logging.Logger('form_analyzer')
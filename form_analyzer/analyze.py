@@ -1,14 +1,16 @@
+import hashlib
+import json
 import logging
 import os
 import typing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
 
-from openpyxl import Workbook
-from openpyxl.worksheet.worksheet import Worksheet
-
-from . import form_parser
+from . import form_parser, instrumentation, memo
 from .form_parser import ParsedForm
+from .manifest import FormRow, Manifest
 from .selectors.base import Selector
+from .writers import ExcelWriter, ResultWriter, TableLine, UncertainField, result_writers
 
 
 @dataclass
@@ -39,13 +41,23 @@ def __get_form_description_module(form_module_name: str):
     return form
 
 
-def __get_form(form_module_name: typing.Optional[str]) -> typing.Tuple[form_parser.FormPages, FormFields]:
+def get_form(form_module_name: typing.Optional[str]) -> typing.Tuple[form_parser.FormPages, FormFields]:
+    """
+    Loads a form description and compiles the filters of its form fields.
+
+    :param form_module_name: Name of the form description Python module, None for no form description
+    :return: Pages and form fields of the form
+    """
     if form_module_name is not None:
         form = __get_form_description_module(form_module_name)
         form_keywords_per_page: typing.List[typing.List[str]] = form.keywords_per_page
         form_pages = form_parser.FormPages(len(form_keywords_per_page),
                                            form_keywords_per_page)
         form_fields = form.form_fields
+
+        compiled_filters = {}
+        for form_field in form_fields:
+            form_field.selector.compile_filters(compiled_filters)
     else:
         form_pages = form_parser.FormPages(0, [])
         form_fields = []
@@ -53,137 +65,301 @@ def __get_form(form_module_name: typing.Optional[str]) -> typing.Tuple[form_pars
     return form_pages, form_fields
 
 
-def __prepare_workbook(form_fields: FormFields) -> Workbook:
-    wb = Workbook()
-    sheet = wb.active
-    sheet.title = 'Results'
+def get_headers(form_fields: FormFields) -> typing.List[str]:
+    """
+    Gets the column headers of the result file, the first column is the form name.
+    """
     table_headers = ['']
 
     for form_field in form_fields:
         table_headers.append(form_field.title)
         table_headers.extend(form_field.selector.headers())
-    sheet.append(table_headers)
 
-    return wb
+    return table_headers
+
+
+def check_output_format(output_format: str):
+    """
+    Raises a ValueError if there is no result writer for the output format.
+    """
+    if output_format not in result_writers:
+        raise ValueError(f'Unknown output format {output_format}, use one of {", ".join(result_writers)}')
+
+
+def create_result_writer(results_file: str, output_format: str, streaming: bool, link_pages: bool = True) -> ResultWriter:
+    """
+    Creates the result writer of an output format, streaming and link_pages are only used for Excel files.
+    """
+    if output_format == 'xlsx':
+        return ExcelWriter(results_file, streaming, link_pages)
+    return result_writers[output_format](results_file)
 
 
 class FormToSheet:
-    @dataclass
-    class UncertainField:
-        col: int
-        page_file: str
+    UncertainField = UncertainField
 
-    def __init__(self, sheet: Worksheet, form_fields: FormFields):
-        self.__sheet = sheet
+    def __init__(self, result_writer: ResultWriter, form_fields: FormFields):
+        self.__result_writer = result_writer
         self.__form_fields = form_fields
         self.num_fields = 0
         self.uncertain_fields = 0
 
-    def __get_table_line(self, form_name: str, parsed_form: ParsedForm) -> \
-            typing.Tuple[typing.List[str], typing.List[UncertainField]]:
+    @staticmethod
+    def get_table_line(form_fields: FormFields, form_name: str, parsed_form: ParsedForm) -> \
+            typing.Tuple[TableLine, typing.List[UncertainField]]:
         table_line = [form_name]
         uncertain_fields = []
 
-        for form_field in self.__form_fields:
-            values = form_field.selector.values(parsed_form.fields)
+        for form_field in form_fields:
+            with instrumentation.form_field(form_field.title):
+                values = form_field.selector.values(parsed_form.fields)
 
-            uncertain_fields.extend([FormToSheet.UncertainField(len(table_line) + i,
-                                                                parsed_form.page_files[value.page])
+            uncertain_fields.extend([UncertainField(len(table_line) + i, parsed_form.page_files[value.page])
                                      for i, value in enumerate(values) if value.uncertain])
 
             table_line.extend(list(map(lambda x: int(x.value) if x.value.isnumeric() else x.value, values)))
-            self.num_fields += 1
 
         return table_line, uncertain_fields
 
-    @staticmethod
-    def __annotate_uncertain_fields(uncertain_fields: typing.List[UncertainField], row):
-        for uncertain in uncertain_fields:
-            uncertain_cell = row[uncertain.col]
-            uncertain_cell.hyperlink = f'{uncertain.page_file}'
-            try:
-                if len(uncertain_cell.value) == 0:
-                    uncertain_cell.value = '???'
-            except TypeError:
-                pass
-            uncertain_cell.style = 'Hyperlink'
+    def add_table_line(self, table_line: TableLine, uncertain_fields: typing.List[UncertainField]):
+        with instrumentation.stage('write row'):
+            self.__result_writer.write(table_line, uncertain_fields)
+
+        self.num_fields += len(self.__form_fields)
+        self.uncertain_fields += len(uncertain_fields)
 
     def add_parsed_form(self, form_name: str, parsed_form: ParsedForm):
-        table_line, uncertain_fields = self.__get_table_line(form_name, parsed_form)
-        self.__sheet.append(table_line)
-        row = self.__sheet[self.__sheet.max_row]
+        self.add_table_line(*self.get_table_line(self.__form_fields, form_name, parsed_form))
 
-        self.__annotate_uncertain_fields(uncertain_fields, row)
 
-        row[0].hyperlink = f'{row[0].value.split(",")[0]}'
-        row[0].style = 'Hyperlink'
+# Form description, pages and cache usage of a worker process, set up once by __init_worker
+__worker_form: typing.Optional[typing.Tuple[form_parser.FormPages, FormFields, bool]] = None
 
-        self.uncertain_fields += len(uncertain_fields)
+
+def __init_worker(form_description_module_name: typing.Optional[str], form_pages: form_parser.FormPages, use_cache: bool):
+    global __worker_form
+
+    _, form_fields = get_form(form_description_module_name)
+    __worker_form = form_pages, form_fields, use_cache
 
 
-def dump_fields(form_folder_or_json_file: str, form_description_module_name: typing.Optional[str] = None, target_directory: str = None):
+def analyze_form_group(file_names: typing.List[str], form_pages: form_parser.FormPages, form_fields: FormFields,
+                       use_cache: bool) -> FormRow:
+    """
+    Parses and analyzes the result files of one form.
+
+    :return: Form name, table line and uncertain fields of the form
+    """
+    with instrumentation.stage('parse form'):
+        parsed_form = form_parser.parse_form(file_names, form_pages, use_cache)
+    form_name = ", ".join(parsed_form.page_files)
+
+    with instrumentation.stage('analyze form'):
+        return (form_name, *FormToSheet.get_table_line(form_fields, form_name, parsed_form))
+
+
+def get_form_row(file_names: typing.List[str]) -> FormRow:
+    """
+    Analyzes a form in a process of a worker_pool with the form description of the pool.
+    """
+    form_pages, form_fields, use_cache = __worker_form
+    return analyze_form_group(file_names, form_pages, form_fields, use_cache)
+
+
+def __dump_parsed_form(parsed_form: ParsedForm, target_directory: str):
+    lines = []
+    for field_with_page in sorted(parsed_form.fields, key=lambda tx_field_: str(tx_field_.page) + tx_field_.field.key.text):
+        tx_field = field_with_page.field
+        value = '' if tx_field.value is None else tx_field.value.text
+        lines.append(f'{field_with_page.page} {tx_field.key.text}: {tx_field.geometry.boundingBox.left} '
+                     f'{tx_field.geometry.boundingBox.top} {value} {tx_field.confidence}')
+
+    with open(f'{target_directory}/fields{parsed_form.page_files[0]}.txt', 'w') as f:
+        f.write('\n'.join(lines))
+
+
+def __dump_form_group(file_names: typing.List[str], target_directory: str):
+    form_pages, _, use_cache = __worker_form
+    __dump_parsed_form(form_parser.parse_form(file_names, form_pages, use_cache), target_directory)
+
+
+def worker_pool(workers: int, form_description_module_name: typing.Optional[str],
+                form_pages: form_parser.FormPages, use_cache: bool) -> ProcessPoolExecutor:
+    """
+    Creates a pool of worker processes that load the form description once and analyze forms with get_form_row.
+    """
+    return ProcessPoolExecutor(max_workers=workers, initializer=__init_worker,
+                               initargs=(form_description_module_name, form_pages, use_cache))
+
+
+def __chunk_size(num_groups: int, workers: int) -> int:
+    # Ship a few chunks per worker to keep the pool busy without paying inter-process overhead per form
+    return max(1, num_groups // (workers * 4))
+
+
+def __analyze_form_groups(file_groups: typing.List[typing.List[str]], form_description_module_name: str,
+                          form_pages: form_parser.FormPages, form_fields: FormFields, workers: int,
+                          use_cache: bool, use_threads: bool) -> typing.Iterator[FormRow]:
+    if workers > 1 and file_groups and use_threads:
+        # The threads share the form description, which is safe since the selectors keep no state per form
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(lambda file_names: analyze_form_group(file_names, form_pages, form_fields,
+                                                                           use_cache), file_groups)
+    elif workers > 1 and file_groups:
+        with worker_pool(workers, form_description_module_name, form_pages, use_cache) as executor:
+            yield from executor.map(get_form_row, file_groups, chunksize=__chunk_size(len(file_groups), workers))
+    else:
+        for file_names in file_groups:
+            yield analyze_form_group(file_names, form_pages, form_fields, use_cache)
+
+
+def __get_form_fingerprint(form_description_module_name: str, headers: typing.List[str]) -> str:
+    import importlib
+
+    form = importlib.import_module(form_description_module_name)
+    form_hash = hashlib.sha256(json.dumps(headers).encode())
+    with open(form.__file__, 'rb') as f:
+        form_hash.update(f.read())
+
+    return form_hash.hexdigest()
+
+
+def dump_fields(form_folder_or_json_file: str, form_description_module_name: typing.Optional[str] = None,
+                target_directory: str = None, workers: int = 1, use_cache: bool = False, profile_file: str = None):
     """
     Dumps the analyzed fields from AWS Textract to text files to support debugging.
 
     :param form_folder_or_json_file: Folder with the AWS Textract result files or a AWS Textract result file
     :param form_description_module_name: Optional form description module name
     :param target_directory: Optional target directory for the dumped files
+    :param workers: Number of worker processes used to parse the forms, default is 1 (no extra processes)
+    :param use_cache: Store the parsed fields of each result file in a cache file next to it and reuse it in later
+        runs, default is False
+    :param profile_file: Optional name of a JSON file, if given, the run is profiled (see analyze)
     """
-    form_pages, _ = __get_form(form_description_module_name)
+    with instrumentation.profile(profile_file):
+        __dump_fields(form_folder_or_json_file, form_description_module_name, target_directory, workers, use_cache)
+
+
+def __dump_fields(form_folder_or_json_file: str, form_description_module_name: typing.Optional[str],
+                  target_directory: typing.Optional[str], workers: int, use_cache: bool):
+    form_pages, _ = get_form(form_description_module_name)
     form_pages.words_on_page = []
-    parsed_forms = form_parser.parse(form_folder_or_json_file, form_pages)
+    file_groups = form_parser.get_form_file_groups(form_folder_or_json_file, form_pages)
 
     from form_analyzer import form_analyzer_logger
 
     form_analyzer_logger.log(logging.INFO, f'Dumping fields to {form_folder_or_json_file}')
 
-    for parsed_form in parsed_forms:
-        lines = []
-        for field_with_page in sorted(parsed_form.fields, key=lambda tx_field_: str(tx_field_.page) + tx_field_.field.key.text):
-            tx_field = field_with_page.field
-            value = '' if tx_field.value is None else tx_field.value.text
-            lines.append(f'{field_with_page.page} {tx_field.key.text}: {tx_field.geometry.boundingBox.left} '
-                         f'{tx_field.geometry.boundingBox.top} {value} {tx_field.confidence}')
+    if target_directory is None:
+        target_directory = os.path.dirname(form_folder_or_json_file)
 
-        if target_directory is None:
-            target_directory = os.path.dirname(form_folder_or_json_file)
-        with open(f'{target_directory}/fields{parsed_form.page_files[0]}.txt', 'w') as f:
-            f.write('\n'.join(lines))
+    if workers > 1:
+        with worker_pool(workers, form_description_module_name, form_pages, use_cache) as executor:
+            list(executor.map(__dump_form_group, file_groups, [target_directory] * len(file_groups),
+                              chunksize=__chunk_size(len(file_groups), workers)))
+    else:
+        for file_names in file_groups:
+            with instrumentation.stage('parse form'):
+                parsed_form = form_parser.parse_form(file_names, form_pages, use_cache)
+            with instrumentation.stage('dump fields'):
+                __dump_parsed_form(parsed_form, target_directory)
 
 
-def analyze(form_folder_or_json_file: str, form_description_module_name: str, excel_file_name: str = 'results'):
+def analyze(form_folder_or_json_file: str, form_description_module_name: str, excel_file_name: str = 'results',
+            workers: int = 1, use_cache: bool = False, streaming: bool = False, output_format: str = 'xlsx',
+            incremental: bool = False, profile_file: str = None, use_threads: bool = False, link_pages: bool = True):
     """
     Analyzes the AWS Textract results in a folder based on a given form description and writes the results to
     an Excel file.
 
+    Instead of an Excel file, the results can also be written as CSV, JSON lines or Parquet (requires pyarrow) file.
+    These formats contain the uncertain fields and the source page in additional columns instead of hyperlinks.
+
+    If more than one worker is given, the forms are parsed and analyzed in a pool of worker processes. The rows are
+    still written in the original file order, so the result is the same as for a single worker. With use_threads, the
+    workers are threads of the current process instead, which share the form description and need no start-up, but only
+    run in parallel on a free-threaded Python build.
+
     :param form_folder_or_json_file: Folder with the AWS Textract result files or a AWS Textract result file
     :param form_description_module_name: Name of the form description Python module
-    :param excel_file_name: Name of the result Excel file, default is 'results'
+    :param excel_file_name: Name of the result file without extension, default is 'results'
+    :param workers: Number of worker processes or threads used to analyze the forms, default is 1 (no extra workers)
+    :param use_cache: Store the parsed fields of each result file in a cache file next to it and reuse it in later
+        runs, default is False
+    :param streaming: Write the Excel file in write-only mode, so that rows are not kept in memory, default is False
+    :param output_format: Result file format, one of 'xlsx', 'csv', 'jsonl' or 'parquet', default is 'xlsx'
+    :param incremental: Keep a manifest of the analyzed forms next to the result file and only analyze forms that are
+        new or changed since the last run, unless the form description changed, default is False
+    :param profile_file: Optional name of a JSON file, if given, the wall time and number of calls of each stage and
+        each form field as well as counters like the number of filtered fields, similarity computations and cache
+        hits are written to it. With more than one worker process, only the stages of the main process are measured.
+    :param use_threads: Use threads instead of processes as workers, default is False
+    :param link_pages: Link the Excel cells to the page images, disable it for the results of run_textract_jobs, which
+        have no page images, default is True
     """
+    with instrumentation.profile(profile_file):
+        __analyze(form_folder_or_json_file, form_description_module_name, excel_file_name, workers, use_cache,
+                  streaming, output_format, incremental, use_threads, link_pages)
+
+
+def __analyze(form_folder_or_json_file: str, form_description_module_name: str, excel_file_name: str, workers: int,
+              use_cache: bool, streaming: bool, output_format: str, incremental: bool, use_threads: bool,
+              link_pages: bool):
     from form_analyzer import form_analyzer_logger
 
-    form_pages, form_fields = __get_form(form_description_module_name)
+    check_output_format(output_format)
+
+    form_pages, form_fields = get_form(form_description_module_name)
+
+    file_groups = form_parser.get_form_file_groups(form_folder_or_json_file, form_pages)
+
+    results_file = f'{os.path.dirname(form_folder_or_json_file)}/{excel_file_name}.{output_format}'
+    result_writer = create_result_writer(results_file, output_format, streaming, link_pages)
+    headers = get_headers(form_fields)
+    result_writer.open(headers)
 
-    parsed_forms = form_parser.parse(form_folder_or_json_file, form_pages)
+    try:
+        form_to_sheet = FormToSheet(result_writer, form_fields)
 
-    wb = __prepare_workbook(form_fields)
-    sheet = wb.active
+        if incremental:
+            manifest = Manifest(f'{results_file}.manifest',
+                                __get_form_fingerprint(form_description_module_name, headers))
+            manifest.load()
+            previous_rows = [manifest.get(file_names) for file_names in file_groups]
+            form_analyzer_logger.log(logging.INFO,
+                                     f'Reusing {len(previous_rows) - previous_rows.count(None)} previously analyzed forms')
+        else:
+            manifest = None
+            previous_rows = [None] * len(file_groups)
 
-    form_to_sheet = FormToSheet(sheet, form_fields)
+        form_rows = __analyze_form_groups([file_names for file_names, previous_row in zip(file_groups, previous_rows)
+                                           if previous_row is None],
+                                          form_description_module_name, form_pages, form_fields, workers, use_cache,
+                                          use_threads)
 
-    for parsed_form in parsed_forms:
-        form_name = ", ".join(parsed_form.page_files)
-        form_analyzer_logger.log(logging.INFO, f'Analyzing {form_name}')
+        for file_names, form_row in zip(file_groups, previous_rows):
+            if form_row is None:
+                form_row = next(form_rows)
+                form_analyzer_logger.log(logging.INFO, f'Analyzing {form_row[0]}')
 
-        form_to_sheet.add_parsed_form(form_name, parsed_form)
+            form_to_sheet.add_table_line(form_row[1], form_row[2])
+            if manifest is not None:
+                manifest.add(file_names, form_row)
 
-    form_analyzer_logger.log(logging.INFO,
-                             f'Found {form_to_sheet.uncertain_fields} uncertain fields in total '
-                             f'{form_to_sheet.num_fields} fields')
+        form_analyzer_logger.log(logging.INFO,
+                                 f'Found {form_to_sheet.uncertain_fields} uncertain fields in total '
+                                 f'{form_to_sheet.num_fields} fields')
+        for cache_name, cache_info in memo.info().items():
+            form_analyzer_logger.log(logging.DEBUG, f'Cache {cache_name}: {cache_info}')
 
-    sheet.freeze_panes = "A2"
-    sheet.print_title_rows = '1:1'
+    except BaseException:
+        # Do not leave open files and an incomplete result file behind
+        result_writer.discard()
+        raise
 
-    results_file = f'{os.path.dirname(form_folder_or_json_file)}/{excel_file_name}.xlsx'
     form_analyzer_logger.log(logging.INFO, f'Finished. Results saved in {results_file}')
-    wb.save(results_file)
+    with instrumentation.stage('save results'):
+        result_writer.close()
+    if manifest is not None:
+        manifest.save()
@@ -0,0 +1,137 @@
+import typing
+from dataclasses import dataclass
+
+
+@dataclass
+class BoundingBox:
+    width: float
+    height: float
+    left: float
+    top: float
+
+
+@dataclass
+class Geometry:
+    boundingBox: BoundingBox
+
+
+@dataclass
+class FieldText:
+    text: str
+
+
+@dataclass
+class Field:
+    """
+    Key/value pair found by AWS Textract.
+
+    The attribute names follow the ones of the Textract Response Parser, so that the field can be used as a drop-in
+    replacement for a trp.Field in selectors and filters.
+    """
+    key: FieldText
+    value: typing.Optional[FieldText]
+    confidence: float
+    geometry: Geometry
+
+
+@dataclass
+class Page:
+    fields: typing.List[Field]
+    texts: typing.List[str]
+
+
+Block = typing.Dict[str, typing.Any]
+BlockMap = typing.Dict[str, Block]
+
+__INDEXED_BLOCK_TYPES = {'KEY_VALUE_SET', 'WORD', 'SELECTION_ELEMENT'}
+
+
+def __related_ids(block: Block, relationship_type: str) -> typing.List[str]:
+    return [block_id for relationship in block.get('Relationships', []) if relationship['Type'] == relationship_type
+            for block_id in relationship['Ids']]
+
+
+def __get_text(block: Block, children: typing.List[str], block_map: BlockMap, with_selection: bool) -> str:
+    text = block.get('Text') or ''
+    words = []
+
+    for child_id in children:
+        child = block_map.get(child_id)
+        if child is None:
+            continue
+        if child['BlockType'] == 'WORD':
+            words.append(child.get('Text') or '')
+        elif with_selection and child['BlockType'] == 'SELECTION_ELEMENT':
+            text = child['SelectionStatus']
+
+    return ' '.join(words) if words else text
+
+
+def __get_value(block: Block, block_map: BlockMap) -> typing.Optional[FieldText]:
+    value = None
+
+    for value_id in __related_ids(block, 'VALUE'):
+        value_block = block_map.get(value_id)
+        if value_block is None or 'VALUE' not in value_block.get('EntityTypes', []):
+            continue
+        for relationship in value_block.get('Relationships', []):
+            if relationship['Type'] == 'CHILD':
+                value = FieldText(__get_text(value_block, relationship['Ids'], block_map, True))
+
+    return value
+
+
+def __get_field(block: Block, block_map: BlockMap) -> typing.Optional[Field]:
+    key = None
+
+    for relationship in block.get('Relationships', []):
+        if relationship['Type'] == 'CHILD':
+            key = FieldText(__get_text(block, relationship['Ids'], block_map, False))
+
+    if key is None:
+        return None
+
+    bounding_box = block['Geometry']['BoundingBox']
+    return Field(key, __get_value(block, block_map), block['Confidence'],
+                 Geometry(BoundingBox(bounding_box['Width'], bounding_box['Height'],
+                                      bounding_box['Left'], bounding_box['Top'])))
+
+
+def parse_pages(responses: typing.List[typing.Dict]) -> typing.List[Page]:
+    """
+    Extracts the form fields and texts per page from AWS Textract AnalyzeDocument responses.
+
+    Only KEY_VALUE_SET, WORD and SELECTION_ELEMENT blocks are indexed, all other blocks are only scanned for their text.
+    A new page starts with each PAGE block, like in the Textract Response Parser. KEY blocks without a CHILD
+    relationship have no key and are skipped, which the Textract Response Parser also does when it adds the fields
+    to the form of a page.
+
+    :param responses: List of AnalyzeDocument responses
+    :return: List of pages with their fields and texts
+    """
+    block_map: BlockMap = {}
+    pages_blocks: typing.List[typing.List[Block]] = []
+
+    for response in responses:
+        for block in response['Blocks']:
+            if block['BlockType'] in __INDEXED_BLOCK_TYPES:
+                block_map[block['Id']] = block
+            if block['BlockType'] == 'PAGE':
+                pages_blocks.append([])
+            elif pages_blocks:
+                pages_blocks[-1].append(block)
+
+    pages = []
+    for page_blocks in pages_blocks:
+        fields = []
+        texts = []
+        for block in page_blocks:
+            if 'Text' in block:
+                texts.append(block['Text'])
+            if block['BlockType'] == 'KEY_VALUE_SET' and 'KEY' in block.get('EntityTypes', []):
+                field = __get_field(block, block_map)
+                if field is not None:
+                    fields.append(field)
+        pages.append(Page(fields, texts))
+
+    return pages
@@ -1,12 +1,22 @@
 import glob
+import io
 import logging
+import math
 import os
 import typing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import dataclass
 
 import pdf2image
+import PIL.Image
 from PIL.Image import Image
 
+# Maximum size of a document passed as bytes to AWS Textract
+TEXTRACT_MAX_BYTES = 5 * 1024 * 1024
+
+# Image file types that are analyzed, as produced by pdf_to_image
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
 
 @dataclass
 class ProcessedImage:
@@ -17,10 +27,123 @@ class ProcessedImage:
 ImageProcessor = typing.Callable[[int, Image], typing.List[ProcessedImage]]
 
 
+@dataclass
+class ImageEncoding:
+    """
+    Encoding of the converted images.
+
+    :param image_format: "png" or "jpeg", default is "png"
+    :param compress_level: PNG compression level from 0 (fastest) to 9 (smallest), default is 6
+    :param quality: JPEG quality from 1 to 95, default is 75
+    :param mode: Optional conversion before encoding, "L" for grayscale or "1" for bilevel (black and white)
+    :param max_bytes: Optional maximum size of an encoded image, larger images are downscaled until they fit,
+        use TEXTRACT_MAX_BYTES to stay below the AWS Textract limit
+    """
+    image_format: str = 'png'
+    compress_level: int = 6
+    quality: int = 75
+    mode: typing.Optional[str] = None
+    max_bytes: typing.Optional[int] = None
+
+    @property
+    def extension(self) -> str:
+        return '.jpg' if self.image_format == 'jpeg' else f'.{self.image_format}'
+
+    def save_options(self) -> typing.Dict:
+        if self.image_format == 'png':
+            return {'format': 'PNG', 'compress_level': self.compress_level}
+        if self.image_format == 'jpeg':
+            return {'format': 'JPEG', 'quality': self.quality}
+        raise ValueError(f'Unknown image format {self.image_format}, use one of png, jpeg')
+
+
+def encode_image(image: Image, encoding: ImageEncoding = ImageEncoding()) -> bytes:
+    """
+    Encodes an image, converting and downscaling it as given by the encoding.
+
+    :param image: Image to encode
+    :param encoding: Image encoding, default is PNG with the default compression level
+    :return: Encoded image
+    :raises ValueError: If the image does not fit into max_bytes even when downscaled as far as possible
+    """
+    if encoding.mode == '1':
+        # Threshold instead of dithering, which would break up the strokes of the text
+        image = image.convert('L').convert('1', dither=PIL.Image.Dither.NONE)
+    elif encoding.mode is not None:
+        image = image.convert(encoding.mode)
+    elif encoding.image_format == 'jpeg' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    while True:
+        buffer = io.BytesIO()
+        image.save(buffer, **encoding.save_options())
+        if encoding.max_bytes is None or buffer.tell() <= encoding.max_bytes:
+            return buffer.getvalue()
+
+        # The encoded size is roughly proportional to the number of pixels
+        scale = math.sqrt(encoding.max_bytes / buffer.tell()) * .95
+        size = max(1, int(image.width * scale)), max(1, int(image.height * scale))
+        if size == image.size:
+            raise ValueError(f'Image of {image.width}x{image.height} pixels does not fit into {encoding.max_bytes} bytes')
+        image = image.resize(size, PIL.Image.Resampling.LANCZOS)
+
+
+def __keep_image(image_index: int, img: Image) -> typing.List[ProcessedImage]:
+    return [ProcessedImage(img, '')]
+
+
+def render_pdf(file_name: str, dpi: int = 400, poppler_path: str = None, image_processor: ImageProcessor = __keep_image,
+               thread_count: int = 1, page_window: int = 10) -> typing.Iterator[typing.Tuple[str, Image]]:
+    """
+    Renders the pages of a PDF file and passes them to the image processor.
+
+    :param file_name: PDF file name
+    :param dpi: DPI to use for image generation, default is 400
+    :param poppler_path: Path to a poppler installation, required for Windows
+    :param image_processor: A function that takes an image index and an image and returns a list of ProcessedImage,
+        default keeps the image as it is
+    :param thread_count: Number of poppler threads used to render the pages, default is 1
+    :param page_window: Number of pages that are rendered and kept in memory at the same time, default is 10
+    :return: Iterator of the image file names without the image extension and the processed images
+    """
+    from form_analyzer import form_analyzer_logger
+
+    form_analyzer_logger.log(logging.INFO, f'Converting {file_name}')
+    num_pages = pdf2image.pdfinfo_from_path(file_name, poppler_path=poppler_path)['Pages']
+    file_name_without_ext = os.path.splitext(file_name)[0]
+
+    # Only the pages of one window are rendered and kept in memory at the same time
+    for first_page in range(1, num_pages + 1, page_window):
+        pages = pdf2image.convert_from_path(file_name, dpi=dpi, poppler_path=poppler_path, thread_count=thread_count,
+                                            first_page=first_page, last_page=min(first_page + page_window - 1, num_pages))
+
+        for page_index, image in enumerate(pages, first_page - 1):
+            processed_images = image_processor(page_index, image)
+            for processed_image in processed_images:
+                if processed_image is None:
+                    continue
+                yield f'{file_name_without_ext}_{page_index}{processed_image.extension}', processed_image.image
+
+        # The images may still be used by the caller, so they are only released instead of closed
+        del pages
+
+
+def get_pdf_files(folder_or_filename: str) -> typing.List[str]:
+    return sorted(glob.glob(f'{folder_or_filename}/*.pdf')) if os.path.isdir(folder_or_filename) else [folder_or_filename]
+
+
+def __convert_pdf(file_name: str, dpi: int, poppler_path: typing.Optional[str], image_processor: ImageProcessor,
+                  thread_count: int, page_window: int, encoding: ImageEncoding):
+    for image_file_name, image in render_pdf(file_name, dpi, poppler_path, image_processor, thread_count, page_window):
+        with open(f'{image_file_name}{encoding.extension}', 'wb') as f:
+            f.write(encode_image(image, encoding))
+
+
 def pdf_to_image(folder_or_filename: str, dpi: int = 400, poppler_path: str = None,
-                 image_processor: ImageProcessor = lambda image_index, img: [ProcessedImage(img, '')]):
+                 image_processor: ImageProcessor = __keep_image, workers: int = 1, thread_count: int = 1,
+                 page_window: int = 10, encoding: ImageEncoding = ImageEncoding()):
     """
-    Converts PDF files in a folder to PNG images.
+    Converts PDF files in a folder to PNG or JPEG images.
 
     PDF files are converted page by page using pdf2image. Each generated page can optionally be passed to a
     function that can further process the image (e.g. split it or crop it). Additionally, the extension of the
@@ -30,17 +153,22 @@ def pdf_to_image(folder_or_filename: str, dpi: int = 400, poppler_path: str = No
     :param dpi: DPI to use for image generation. The higher, the bigger the image. 400 is the default.
     :param poppler_path: Path to a poppler installation, required for Windows.
     :param image_processor: A function that takes an image index and an image and returns a list of ProcessedImage.
+        With more than one worker, it must be defined at module level, so that it can be passed to the worker processes.
+    :param workers: Number of processes that convert PDF files in parallel, default is 1. The file names do not depend
+        on the number of workers.
+    :param thread_count: Number of poppler threads used to render the pages of a PDF file, default is 1.
+    :param page_window: Number of pages that are rendered and kept in memory at the same time per worker, default is 10.
+    :param encoding: Image encoding, default is PNG with the default compression level.
     """
-    from form_analyzer import form_analyzer_logger
+    file_names = get_pdf_files(folder_or_filename)
 
-    for file_name in glob.glob(f'{folder_or_filename}/*.pdf') if os.path.isdir(folder_or_filename) else [folder_or_filename]:
-        form_analyzer_logger.log(logging.INFO, f'Converting {file_name}')
-        pages = pdf2image.convert_from_path(file_name, dpi=dpi, poppler_path=poppler_path)
-        file_name_without_ext = os.path.splitext(file_name)[0]
-
-        for page_index, image in enumerate(pages):
-            processed_images = image_processor(page_index, image)
-            for processed_image in processed_images:
-                if processed_image is None:
-                    continue
-                processed_image.image.save(f'{file_name_without_ext}_{page_index}{processed_image.extension}.png')
+    if workers > 1 and len(file_names) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(__convert_pdf, file_name, dpi, poppler_path, image_processor, thread_count,
+                                       page_window, encoding)
+                       for file_name in file_names]
+            for future in as_completed(futures):
+                future.result()
+    else:
+        for file_name in file_names:
+            __convert_pdf(file_name, dpi, poppler_path, image_processor, thread_count, page_window, encoding)
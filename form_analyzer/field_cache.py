@@ -0,0 +1,88 @@
+import json
+import os
+import typing
+
+from . import instrumentation
+from .block_parser import BoundingBox, Field, FieldText, Geometry, Page, parse_pages
+
+CACHE_EXTENSION = '.cache'
+__CACHE_VERSION = 1
+
+
+def fingerprint(file_name: str) -> typing.Dict[str, int]:
+    """
+    Gets the size and modification time of a file, which change whenever the file is rewritten.
+    """
+    stat = os.stat(file_name)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+def __page_to_dict(page: Page) -> typing.Dict:
+    return {'texts': page.texts,
+            'fields': [[field.key.text, field.value.text if field.value is not None else None, field.confidence,
+                        [field.geometry.boundingBox.width, field.geometry.boundingBox.height,
+                         field.geometry.boundingBox.left, field.geometry.boundingBox.top]]
+                       for field in page.fields]}
+
+
+def __page_from_dict(page: typing.Dict) -> Page:
+    return Page([Field(FieldText(key), FieldText(value) if value is not None else None, confidence,
+                       Geometry(BoundingBox(*bounding_box)))
+                 for key, value, confidence, bounding_box in page['fields']],
+                page['texts'])
+
+
+def __read_cache(cache_file_name: str, file_fingerprint: typing.Dict[str, int]) -> typing.Optional[typing.List[Page]]:
+    try:
+        with open(cache_file_name) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if cache.get('version') != __CACHE_VERSION or cache.get('fingerprint') != file_fingerprint:
+        return None
+
+    return [__page_from_dict(page) for page in cache['pages']]
+
+
+def __write_cache(cache_file_name: str, file_fingerprint: typing.Dict[str, int], pages: typing.List[Page]):
+    # Write to a temporary file first, so that concurrent readers never see a partially written cache
+    temp_file_name = f'{cache_file_name}.{os.getpid()}.tmp'
+    with open(temp_file_name, 'w') as f:
+        json.dump({'version': __CACHE_VERSION, 'fingerprint': file_fingerprint,
+                   'pages': [__page_to_dict(page) for page in pages]}, f)
+    os.replace(temp_file_name, cache_file_name)
+
+
+def load_pages(file_name: str, use_cache: bool = False) -> typing.List[Page]:
+    """
+    Loads the pages of an AWS Textract result file.
+
+    If the cache is used, the extracted pages are stored in a file next to the result file with an additional
+    ".cache" extension. The cache entry is only used if the size and modification time of the result file did not
+    change since the cache was written.
+
+    :param file_name: AWS Textract result JSON file name
+    :param use_cache: Read and write the cache file, default is False
+    :return: List of pages with their fields and texts
+    """
+    if use_cache:
+        file_fingerprint = fingerprint(file_name)
+        with instrumentation.stage('read field cache'):
+            pages = __read_cache(file_name + CACHE_EXTENSION, file_fingerprint)
+        if pages is not None:
+            instrumentation.count('field cache hits')
+            return pages
+        instrumentation.count('field cache misses')
+
+    with instrumentation.stage('load JSON'):
+        with open(file_name) as f:
+            response = json.load(f)
+    with instrumentation.stage('parse blocks'):
+        pages = parse_pages([response])
+
+    if use_cache:
+        with instrumentation.stage('write field cache'):
+            __write_cache(file_name + CACHE_EXTENSION, file_fingerprint, pages)
+
+    return pages
@@ -1,35 +1,114 @@
 import typing
-from copy import copy
 
-from .form_parser import FieldList
+from . import instrumentation
+from .form_parser import FieldList, IndexedFieldList
+
+FilterKey = typing.Hashable
 
 
 class Filter:
+    """
+    Base class of all filters.
+
+    Filters are immutable, combining them with & or | creates a new filter. Filters that are structurally equal
+    have the same key, which is used to evaluate them only once per field list.
+    """
     def __init__(self):
-        self.__operations: typing.List[typing.Tuple[str, Filter]] = []
+        self.__key: typing.Optional[FilterKey] = None
+
+    def __and__(self, other: 'Filter') -> 'Filter':
+        return And(self, other)
 
-    def __and__(self, other):
-        self.__operations.append(('and', other))
-        return self
+    def __or__(self, other: 'Filter') -> 'Filter':
+        return Or(self, other)
 
-    def __or__(self, other):
-        self.__operations.append(('or', other))
-        return copy(self)
+    @property
+    def key(self) -> FilterKey:
+        if getattr(self, '_Filter__key', None) is None:
+            self.__key = (self._key_type(), self._parameters())
+        return self.__key
+
+    def _key_type(self) -> type:
+        # Subclasses that only provide a different constructor use the key type of their base class
+        return type(self)
+
+    def _parameters(self) -> FilterKey:
+        # Filters that do not describe their parameters are only equal to themselves
+        return id(self)
+
+    def compile(self, compiled_filters: typing.Dict[FilterKey, 'Filter']) -> 'Filter':
+        """
+        Gets the shared instance of this filter.
+
+        :param compiled_filters: Filters compiled so far by their key
+        :return: The first compiled filter that is structurally equal to this one
+        """
+        return compiled_filters.setdefault(self.key, self)
 
     def filter(self, fields: FieldList) -> FieldList:
-        filtered_fields = self._filter(fields)
-        for operation, other in self.__operations:
-            if operation == 'and':
-                filtered_fields = other.filter(filtered_fields)
-            if operation == 'or':
-                filtered_fields.extend(other.filter(fields))
+        if isinstance(fields, IndexedFieldList):
+            return fields.filter_result(self.key, lambda: self.__evaluate(fields))
+        return self.__evaluate(fields)
 
-        return filtered_fields
+    def __evaluate(self, fields: FieldList) -> FieldList:
+        instrumentation.count('filter evaluations')
+        instrumentation.count('fields filtered', len(fields))
+        return self._filter(fields)
 
     def _filter(self, fields: FieldList) -> FieldList:
         raise NotImplementedError
 
 
+class And(Filter):
+    """
+    Restricts the fields to those that pass all given filters, applied one after the other.
+    """
+    def __init__(self, *filters: Filter):
+        super(And, self).__init__()
+        if not filters:
+            raise ValueError('And requires at least one filter')
+        self.filters: typing.Tuple[Filter, ...] = tuple(f for filter_ in filters
+                                                          for f in (filter_.filters if isinstance(filter_, And)
+                                                                    else [filter_]))
+        # All filters except the last one, evaluated (and cached) on their own
+        self.__head = And(*self.filters[:-1]) if len(self.filters) > 2 else self.filters[0]
+
+    def _parameters(self) -> FilterKey:
+        return tuple(filter_.key for filter_ in self.filters)
+
+    def compile(self, compiled_filters: typing.Dict[FilterKey, Filter]) -> Filter:
+        if self.key not in compiled_filters:
+            compiled_filters[self.key] = And(*[filter_.compile(compiled_filters) for filter_ in self.filters])
+        return compiled_filters[self.key]
+
+    def _filter(self, fields: FieldList) -> FieldList:
+        if len(self.filters) == 1:
+            return self.__head.filter(fields)
+        return self.filters[-1].filter(self.__head.filter(fields))
+
+
+class Or(Filter):
+    """
+    Combines the fields of all given filters in the given order.
+    """
+    def __init__(self, *filters: Filter):
+        super(Or, self).__init__()
+        self.filters: typing.Tuple[Filter, ...] = tuple(f for filter_ in filters
+                                                          for f in (filter_.filters if isinstance(filter_, Or) else [filter_]))
+
+    def _parameters(self) -> FilterKey:
+        return tuple(filter_.key for filter_ in self.filters)
+
+    def compile(self, compiled_filters: typing.Dict[FilterKey, Filter]) -> Filter:
+        if self.key not in compiled_filters:
+            compiled_filters[self.key] = Or(*[filter_.compile(compiled_filters) for filter_ in self.filters])
+        return compiled_filters[self.key]
+
+    def _filter(self, fields: FieldList) -> FieldList:
+        # Filters may return shared lists, so always create a new one
+        return IndexedFieldList(field for filter_ in self.filters for field in filter_.filter(fields))
+
+
 class Pages(Filter):
     """
     Restricts the fields to the given pages.
@@ -40,9 +119,22 @@ class Pages(Filter):
     """
     def __init__(self, pages: typing.List[int]):
         super(Pages, self).__init__()
-        self.__pages = pages
+        self.__pages = frozenset(pages)
+
+    def _key_type(self) -> type:
+        return Pages
+
+    def _parameters(self) -> FilterKey:
+        return self.__pages
 
     def _filter(self, fields: FieldList) -> FieldList:
+        if isinstance(fields, IndexedFieldList) and fields.ordered_by_page:
+            fields_by_page = fields.fields_by_page
+            pages = sorted(self.__pages.intersection(fields_by_page))
+            if len(pages) == 1:
+                return fields_by_page[pages[0]]
+            return IndexedFieldList(field for page in pages for field in fields_by_page[page])
+
         filtered_fields = []
         for field in fields:
             if field.page in self.__pages:
@@ -79,26 +171,45 @@ class Location(Filter):
 
     def __init__(self, horizontal: optional_dimension = None, vertical: optional_dimension = None):
         super(Location, self).__init__()
-        self.__horizontal = horizontal
-        self.__vertical = vertical
+        self.__horizontal = tuple(horizontal) if horizontal is not None else None
+        self.__vertical = tuple(vertical) if vertical is not None else None
+
+    def _parameters(self) -> FilterKey:
+        return self.__horizontal, self.__vertical
+
+    def __in_range(self, field) -> bool:
+        bounding_box = field.field.geometry.boundingBox
+        return (self.__horizontal is None or self.__horizontal[0] < bounding_box.left < self.__horizontal[1]) and \
+            (self.__vertical is None or self.__vertical[0] < bounding_box.top < self.__vertical[1])
+
+    def __filter_indexed(self, fields: IndexedFieldList) -> FieldList:
+        candidates = None
+        for coordinate, dimension in [('left', self.__horizontal), ('top', self.__vertical)]:
+            if dimension is not None:
+                positions = fields.positions_in_range(coordinate, dimension[0], dimension[1])
+                if candidates is None or len(positions) < len(candidates):
+                    candidates = positions
+
+        if candidates is None:
+            return fields
+
+        # Keep the original field order, the other dimension is checked on the remaining candidates
+        return IndexedFieldList(fields[position] for position in sorted(candidates) if self.__in_range(fields[position]))
 
     def _filter(self, fields: FieldList) -> FieldList:
-        filtered_fields = []
-        for field in fields:
-            tx_field = field.field
-            if (self.__horizontal is None or self.__horizontal[0] < tx_field.geometry.boundingBox.left <
-                self.__horizontal[1]) and \
-                    (self.__vertical is None or self.__vertical[0] < tx_field.geometry.boundingBox.top <
-                     self.__vertical[1]):
-                filtered_fields.append(field)
+        if isinstance(fields, IndexedFieldList):
+            return self.__filter_indexed(fields)
 
-        return filtered_fields
+        return [field for field in fields if self.__in_range(field)]
 
 
 class Selected(Filter):
     """
     Restricts the fields to those that are selected (i.e. have a checked checkbox).
     """
+    def _parameters(self) -> FilterKey:
+        return ()
+
     def _filter(self, fields: FieldList) -> FieldList:
         filtered_fields = []
         for field in fields:
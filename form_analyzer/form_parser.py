@@ -1,27 +1,112 @@
+import bisect
 import glob
-import json
 import logging
 import os
 import typing
 from dataclasses import dataclass
 
-import trp
+from .block_parser import Field
+from .field_cache import load_pages
 
 
 @dataclass
 class FieldWithPage:
     page: int
-    field: trp.Field
+    field: Field
 
 
 FieldList = typing.List[FieldWithPage]
 
 
+class IndexedFieldList(list):
+    """
+    List of fields with an index of the fields per page.
+
+    Additionally, the positions of the fields can be looked up by the range of their bounding box left or top
+    coordinate.
+
+    The indices are built on first use, so the list must not be modified afterwards.
+    """
+    def __init__(self, fields: typing.Iterable[FieldWithPage] = ()):
+        super(IndexedFieldList, self).__init__(fields)
+        self.__fields_by_page: typing.Optional[typing.Dict[int, IndexedFieldList]] = None
+        self.__ordered_by_page = True
+        self.__coordinates: typing.Dict[str, typing.Tuple[typing.List[float], typing.List[int]]] = {}
+        self.__filter_results: typing.Dict[typing.Hashable, FieldList] = {}
+
+    def __build_index(self):
+        fields_by_page = {}
+        last_page = None
+        for field in self:
+            fields_by_page.setdefault(field.page, []).append(field)
+            if last_page is not None and field.page < last_page:
+                self.__ordered_by_page = False
+            last_page = field.page
+
+        if len(fields_by_page) == 1:
+            self.__fields_by_page = {last_page: self}
+        else:
+            self.__fields_by_page = {page: IndexedFieldList(fields) for page, fields in fields_by_page.items()}
+
+    @property
+    def fields_by_page(self) -> typing.Dict[int, 'IndexedFieldList']:
+        """Fields per page, each page in the original order"""
+        if self.__fields_by_page is None:
+            self.__build_index()
+        return self.__fields_by_page
+
+    @property
+    def ordered_by_page(self) -> bool:
+        """True if the fields are sorted by their page number"""
+        if self.__fields_by_page is None:
+            self.__build_index()
+        return self.__ordered_by_page
+
+    def filter_result(self, key: typing.Hashable, filter_: typing.Callable[[], FieldList]) -> FieldList:
+        """
+        Gets the result of a filter on this list, the filter is only called once per key.
+
+        :param key: Key of the filter
+        :param filter_: Function that filters this list
+        :return: Filtered fields, must not be modified
+        """
+        if key not in self.__filter_results:
+            self.__filter_results[key] = filter_()
+        return self.__filter_results[key]
+
+    def __sorted_coordinates(self, coordinate: str) -> typing.Tuple[typing.List[float], typing.List[int]]:
+        if coordinate not in self.__coordinates:
+            ordered = sorted((getattr(field.field.geometry.boundingBox, coordinate), position)
+                             for position, field in enumerate(self))
+            self.__coordinates[coordinate] = [value for value, _ in ordered], [position for _, position in ordered]
+        return self.__coordinates[coordinate]
+
+    def positions_in_range(self, coordinate: str, low: float, high: float) -> typing.List[int]:
+        """
+        Gets the positions of all fields whose coordinate is in the open interval (low, high).
+
+        :param coordinate: Bounding box coordinate, either 'left' or 'top'
+        :param low: Lower bound (exclusive)
+        :param high: Upper bound (exclusive)
+        :return: Positions of the fields in the list, in no particular order
+        """
+        values, positions = self.__sorted_coordinates(coordinate)
+        return positions[bisect.bisect_right(values, low):bisect.bisect_left(values, high)]
+
+
 @dataclass
 class ParsedForm:
     page_files: typing.List[str]
     fields: FieldList
 
+    def __post_init__(self):
+        if not isinstance(self.fields, IndexedFieldList):
+            self.fields = IndexedFieldList(self.fields)
+
+    @property
+    def fields_by_page(self) -> typing.Dict[int, IndexedFieldList]:
+        return self.fields.fields_by_page
+
 
 @dataclass
 class FormPages:
@@ -29,48 +114,29 @@ class FormPages:
     words_on_page: typing.List[typing.List[str]]
 
 
-def __get_field_list_from_document(document: trp.Document) -> typing.List[FieldList]:
-    fields = []
-    for page_num, page in enumerate(document.pages):
-        for field in page.form.fields:
-            fields.append(FieldWithPage(page_num, field))
-        if page_num % 4 == 3:
-            yield fields
-            fields = []
-
+def __is_any_word_in_texts(texts: typing.List[str], words: typing.List[str]) -> bool:
+    return not len(words) or any(word in text for text in texts for word in words)
 
-def __is_any_word_in_blocks(blocks, words: typing.List[str]) -> bool:
-    word_found = False
 
-    for block in blocks:
-        if any(['Text' in block and word in block['Text'] for word in words]):
-            word_found = True
-
-    return not len(words) or word_found
-
-
-def __get_parsed_form(file_names: typing.List[str], form_pages: FormPages) -> ParsedForm:
+def parse_form(file_names: typing.List[str], form_pages: FormPages, use_cache: bool = False) -> ParsedForm:
     base_file_names = []
-    responses = []
+    pages = []
 
     for file_name in file_names:
         base_file_names.append(os.path.splitext(os.path.split(file_name)[1])[0])
-        with open(file_name) as f:
-            responses.append(json.load(f))
+        pages.extend(load_pages(file_name, use_cache))
 
-    doc = trp.Document(responses)
-    for page, words in zip(doc.pages, form_pages.words_on_page):
-        page: trp.Page
-        assert __is_any_word_in_blocks(page.blocks, words), f'Words {words} not found in files {file_names}\n{page}'
+    for page, words in zip(pages, form_pages.words_on_page):
+        assert __is_any_word_in_texts(page.texts, words), f'Words {words} not found in files {file_names}\n{page.texts}'
 
     fields: FieldList = []
-    for page_num, page in enumerate(doc.pages):
-        for field in page.form.fields:
+    for page_num, page in enumerate(pages):
+        for field in page.fields:
             fields.append((FieldWithPage(page_num, field)))
     return ParsedForm(base_file_names, fields)
 
 
-def parse(path_or_file: str, form_pages: FormPages) -> typing.List[ParsedForm]:
+def get_form_file_groups(path_or_file: str, form_pages: FormPages) -> typing.List[typing.List[str]]:
     file_names = sorted(glob.glob(path_or_file + '/*.json')) if os.path.isdir(path_or_file) else [path_or_file]
 
     from form_analyzer import form_analyzer_logger
@@ -84,5 +150,9 @@ def parse(path_or_file: str, form_pages: FormPages) -> typing.List[ParsedForm]:
         if len(file_names) == 0:
             raise FileNotFoundError(f'No textract JSON result files found in {path_or_file}')
 
-    for i in range(0, len(file_names), form_pages.pages):
-        yield __get_parsed_form(file_names[i:i + form_pages.pages], form_pages)
+    return [file_names[i:i + form_pages.pages] for i in range(0, len(file_names), form_pages.pages)]
+
+
+def parse(path_or_file: str, form_pages: FormPages, use_cache: bool = False) -> typing.List[ParsedForm]:
+    for file_names in get_form_file_groups(path_or_file, form_pages):
+        yield parse_form(file_names, form_pages, use_cache)
@@ -0,0 +1,150 @@
+import contextlib
+import json
+import logging
+import threading
+import time
+import typing
+from dataclasses import asdict, dataclass
+
+from . import memo
+
+
+@dataclass
+class Timing:
+    calls: int = 0
+    seconds: float = 0
+
+
+class Instrumentation:
+    """
+    Wall times and call counts per stage and per form field as well as event counters of one run.
+    """
+    def __init__(self):
+        self.stages: typing.Dict[str, Timing] = {}
+        self.form_fields: typing.Dict[str, Timing] = {}
+        self.counters: typing.Dict[str, int] = {}
+        self.__lock = threading.Lock()
+        self.__start = time.perf_counter()
+        self.__cache_info = memo.info()
+
+    def add_time(self, timings: typing.Dict[str, Timing], name: str, seconds: float):
+        with self.__lock:
+            timing = timings.setdefault(name, Timing())
+            timing.calls += 1
+            timing.seconds += seconds
+
+    def count(self, name: str, value: int):
+        with self.__lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self) -> typing.Dict:
+        """
+        Gets the report as a JSON serializable dictionary.
+
+        The cache counters are the hits and misses of the memo caches during the run.
+        """
+        caches = {}
+        for cache_name, cache_info in memo.info().items():
+            start_info = self.__cache_info[cache_name]
+            caches[cache_name] = {'hits': cache_info.hits - start_info.hits,
+                                  'misses': cache_info.misses - start_info.misses,
+                                  'evictions': cache_info.evictions - start_info.evictions}
+
+        return {'wall_time': time.perf_counter() - self.__start,
+                'stages': {name: asdict(timing) for name, timing in self.stages.items()},
+                'form_fields': {name: asdict(timing) for name, timing in self.form_fields.items()},
+                'counters': dict(self.counters),
+                'caches': caches}
+
+    def summary(self) -> str:
+        return ', '.join(f'{name} {timing.seconds:.2f}s ({timing.calls} calls)'
+                         for name, timing in sorted(self.stages.items(), key=lambda item: -item[1].seconds))
+
+
+class __Timer:
+    def __init__(self, instrumentation: Instrumentation, timings: typing.Dict[str, Timing], name: str):
+        self.__instrumentation = instrumentation
+        self.__timings = timings
+        self.__name = name
+        self.__start = 0.
+
+    def __enter__(self):
+        self.__start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.__instrumentation.add_time(self.__timings, self.__name, time.perf_counter() - self.__start)
+
+
+class __NoTimer:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+# Instrumentation of the current run, None if switched off
+__active: typing.Optional[Instrumentation] = None
+__NO_TIMER = __NoTimer()
+
+
+def active() -> typing.Optional[Instrumentation]:
+    return __active
+
+
+def stage(name: str):
+    """
+    Measures the wall time of a stage, does nothing if the instrumentation is switched off.
+
+    :param name: Stage name
+    :return: Context manager around the stage
+    """
+    if __active is None:
+        return __NO_TIMER
+    return __Timer(__active, __active.stages, name)
+
+
+def form_field(title: str):
+    """
+    Measures the wall time of the evaluation of a form field, does nothing if the instrumentation is switched off.
+
+    :param title: Form field title
+    :return: Context manager around the evaluation
+    """
+    if __active is None:
+        return __NO_TIMER
+    return __Timer(__active, __active.form_fields, title)
+
+
+def count(name: str, value: int = 1):
+    """
+    Increases a counter, does nothing if the instrumentation is switched off.
+    """
+    if __active is not None:
+        __active.count(name, value)
+
+
+@contextlib.contextmanager
+def profile(report_file: typing.Optional[str]) -> typing.Iterator[typing.Optional[Instrumentation]]:
+    """
+    Switches the instrumentation on for a run and saves the report when the run is finished.
+
+    :param report_file: Name of the JSON report file, the instrumentation stays switched off if None
+    """
+    global __active
+    from form_analyzer import form_analyzer_logger
+
+    if report_file is None:
+        yield None
+        return
+
+    instrumentation = __active = Instrumentation()
+    try:
+        yield instrumentation
+    finally:
+        __active = None
+
+    with open(report_file, 'w') as f:
+        json.dump(instrumentation.report(), f, indent=2)
+    form_analyzer_logger.log(logging.INFO, f'Profile: {instrumentation.summary()}')
+    form_analyzer_logger.log(logging.INFO, f'Profile saved in {report_file}')
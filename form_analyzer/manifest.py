@@ -0,0 +1,80 @@
+import json
+import logging
+import os
+import typing
+
+from .field_cache import fingerprint
+from .writers import TableLine, UncertainField
+
+FormRow = typing.Tuple[str, TableLine, typing.List[UncertainField]]
+
+_MANIFEST_VERSION = 1
+
+
+def _group_key(file_names: typing.List[str]) -> str:
+    return '|'.join(os.path.basename(file_name) for file_name in file_names)
+
+
+def _fingerprints(file_names: typing.List[str]) -> typing.List[typing.Dict[str, int]]:
+    return [fingerprint(file_name) for file_name in file_names]
+
+
+class Manifest:
+    """
+    Record of the form groups that were already analyzed together with their result rows.
+
+    A group is identified by the names of its page files and is only reused if none of the files changed. All
+    entries are dropped if the form description fingerprint differs from the one the manifest was written with.
+
+    :param file_name: Name of the manifest file
+    :param form_fingerprint: Fingerprint of the form description
+    """
+    def __init__(self, file_name: str, form_fingerprint: str):
+        self.__file_name = file_name
+        self.__form_fingerprint = form_fingerprint
+        self.__previous_groups: typing.Dict[str, typing.Dict] = {}
+        self.__groups: typing.Dict[str, typing.Dict] = {}
+
+    def load(self):
+        from form_analyzer import form_analyzer_logger
+
+        try:
+            with open(self.__file_name) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if manifest.get('version') != _MANIFEST_VERSION or manifest.get('form') != self.__form_fingerprint:
+            form_analyzer_logger.log(logging.INFO, 'Form description changed, analyzing all forms again')
+            return
+
+        self.__previous_groups = manifest['groups']
+
+    def get(self, file_names: typing.List[str]) -> typing.Optional[FormRow]:
+        """
+        Gets the row of a form group if the group was analyzed before and its files did not change.
+        """
+        group = self.__previous_groups.get(_group_key(file_names))
+        if group is None or group['fingerprints'] != _fingerprints(file_names):
+            return None
+
+        return group['form_name'], group['table_line'], [UncertainField(col, page_file)
+                                                         for col, page_file in group['uncertain_fields']]
+
+    def add(self, file_names: typing.List[str], form_row: FormRow):
+        form_name, table_line, uncertain_fields = form_row
+        self.__groups[_group_key(file_names)] = {
+            'fingerprints': _fingerprints(file_names),
+            'form_name': form_name,
+            'table_line': table_line,
+            'uncertain_fields': [[uncertain.col, uncertain.page_file] for uncertain in uncertain_fields]
+        }
+
+    def save(self):
+        """
+        Saves the groups added since loading, groups that were not added again are removed.
+        """
+        temp_file_name = f'{self.__file_name}.tmp'
+        with open(temp_file_name, 'w') as f:
+            json.dump({'version': _MANIFEST_VERSION, 'form': self.__form_fingerprint, 'groups': self.__groups}, f)
+        os.replace(temp_file_name, self.__file_name)
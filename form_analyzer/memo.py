@@ -0,0 +1,116 @@
+import collections
+import threading
+import typing
+from dataclasses import dataclass
+
+Key = typing.Hashable
+Value = typing.TypeVar('Value')
+
+
+@dataclass
+class CacheInfo:
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+    maxsize: int
+
+
+class LRUCache:
+    """
+    Thread-safe cache that evicts the least recently used entries when it exceeds its maximum size.
+
+    Hits do not take the lock, since looking up and reordering single entries are atomic operations. The hit counter
+    is not locked either, so a few concurrent hits may not be counted.
+
+    :param maxsize: Maximum number of entries, 0 disables the cache
+    """
+    def __init__(self, maxsize: int):
+        self.__maxsize = maxsize
+        self.__entries: 'collections.OrderedDict[Key, typing.Any]' = collections.OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    @property
+    def maxsize(self) -> int:
+        return self.__maxsize
+
+    @maxsize.setter
+    def maxsize(self, maxsize: int):
+        with self.__lock:
+            self.__maxsize = maxsize
+            self.__evict()
+
+    def __evict(self):
+        while len(self.__entries) > self.__maxsize:
+            self.__entries.popitem(last=False)
+            self.__evictions += 1
+
+    def get(self, key: Key, compute: typing.Callable[[], Value]) -> Value:
+        """
+        Gets the cached value for a key or computes and caches it.
+
+        :param key: Key of the value
+        :param compute: Function that computes the value if it is not cached
+        :return: Value
+        """
+        if self.__maxsize == 0:
+            return compute()
+
+        try:
+            value = self.__entries[key]
+        except KeyError:
+            pass
+        else:
+            self.__hits += 1
+            try:
+                self.__entries.move_to_end(key)
+            except KeyError:
+                # Evicted by another thread in the meantime
+                pass
+            return value
+
+        value = compute()
+
+        with self.__lock:
+            self.__misses += 1
+            self.__entries[key] = value
+            self.__evict()
+
+        return value
+
+    def clear(self):
+        """
+        Removes all entries and resets the counters.
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.__hits = self.__misses = self.__evictions = 0
+
+    def info(self) -> CacheInfo:
+        with self.__lock:
+            return CacheInfo(self.__hits, self.__misses, self.__evictions, len(self.__entries), self.__maxsize)
+
+
+# Process-wide caches shared by all forms of a run
+simple_str_cache = LRUCache(100000)
+similarity_cache = LRUCache(100000)
+
+
+def configure(maxsize: int):
+    """
+    Sets the maximum number of entries of the key normalization and similarity caches.
+
+    :param maxsize: Maximum number of entries per cache, 0 disables caching
+    """
+    simple_str_cache.maxsize = maxsize
+    similarity_cache.maxsize = maxsize
+
+
+def info() -> typing.Dict[str, CacheInfo]:
+    """
+    Gets the hit and miss counters of the key normalization and similarity caches.
+    """
+    return {'simple_str': simple_str_cache.info(), 'similarity': similarity_cache.info()}
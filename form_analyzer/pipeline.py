@@ -0,0 +1,299 @@
+import bisect
+import collections
+import logging
+import os
+import queue
+import threading
+import typing
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .analyze import FormDescriptionError, FormToSheet, analyze_form_group, check_output_format, create_result_writer, \
+    get_form, get_form_row, get_headers, worker_pool
+from .conversion import ImageEncoding, ImageProcessor, TEXTRACT_MAX_BYTES, encode_image, get_pdf_files, render_pdf
+from .textract import AWSTextract
+from .throttling import Throttler
+
+# Encoded page on its way from the conversion to the Textract stage: image file name and image bytes
+_EncodedPage = typing.Tuple[str, bytes]
+
+
+class _Stopped(Exception):
+    pass
+
+
+def _put(target_queue: queue.Queue, item, stop: threading.Event):
+    while True:
+        if stop.is_set():
+            raise _Stopped()
+        try:
+            target_queue.put(item, timeout=.1)
+            return
+        except queue.Full:
+            pass
+
+
+def _get(source_queue: queue.Queue, stop: threading.Event):
+    while True:
+        if stop.is_set():
+            raise _Stopped()
+        try:
+            return source_queue.get(timeout=.1)
+        except queue.Empty:
+            pass
+
+
+class _FormGroupTracker:
+    """
+    Collects the analyzed pages and releases the form groups in order as soon as all their pages are analyzed.
+
+    The pages are grouped like form_parser.get_form_file_groups does, i.e. by the sorted names of all result files, so
+    a form may also span several PDF files. The result file names of a PDF file all start with the PDF file name
+    without extension and an underscore, so the position of a known name in the sorted names is final as soon as it
+    is before the names of all PDF files that are not converted yet.
+    """
+    def __init__(self, pdf_file_names: typing.List[str], form_pages: int, ready_groups: queue.Queue):
+        self.__form_pages = form_pages
+        self.__ready_groups = ready_groups
+        self.__pending_prefixes = {pdf_index: f'{os.path.splitext(file_name)[0]}_'
+                                   for pdf_index, file_name in enumerate(pdf_file_names)}
+        self.__file_names: typing.List[str] = []
+        self.__analyzed: typing.Set[str] = set()
+        self.__next_group = 0
+        self.__finished = False
+        self.__lock = threading.Lock()
+        self.__release()
+
+    def add_pdf(self, pdf_index: int, json_file_names: typing.List[str]):
+        with self.__lock:
+            del self.__pending_prefixes[pdf_index]
+            self.__file_names = sorted(self.__file_names + json_file_names)
+            self.__release()
+
+    def page_analyzed(self, json_file_name: str):
+        with self.__lock:
+            self.__analyzed.add(json_file_name)
+            self.__release()
+
+    def __release(self):
+        if self.__pending_prefixes:
+            num_final = bisect.bisect_left(self.__file_names, min(self.__pending_prefixes.values()))
+        else:
+            num_final = len(self.__file_names)
+
+        while True:
+            start = self.__next_group * self.__form_pages
+            end = start + self.__form_pages
+            # The last group may be incomplete, but only when all PDF files are converted
+            if start >= num_final or (end > num_final and self.__pending_prefixes):
+                break
+            group = self.__file_names[start:end]
+            if not self.__analyzed.issuperset(group):
+                break
+            self.__ready_groups.put(group)
+            self.__next_group += 1
+
+        if not self.__pending_prefixes and self.__next_group * self.__form_pages >= num_final and not self.__finished:
+            # All groups are released
+            self.__ready_groups.put(None)
+            self.__finished = True
+
+
+def __convert_stage(pdf_files: queue.Queue, encoded_pages: queue.Queue, tracker: _FormGroupTracker,
+                    stop: threading.Event, dpi: int, poppler_path: typing.Optional[str],
+                    render_kwargs: typing.Dict, page_window: int, encoding: ImageEncoding):
+    while True:
+        try:
+            pdf_index, file_name = pdf_files.get_nowait()
+        except queue.Empty:
+            return
+
+        json_file_names = []
+        for image_file_name, image in render_pdf(file_name, dpi, poppler_path, page_window=page_window, **render_kwargs):
+            image_file_name = f'{image_file_name}{encoding.extension}'
+            json_file_names.append(f'{image_file_name}.json')
+            if AWSTextract.is_analyzed(image_file_name):
+                tracker.page_analyzed(f'{image_file_name}.json')
+            else:
+                _put(encoded_pages, (image_file_name, encode_image(image, encoding)), stop)
+
+        tracker.add_pdf(pdf_index, json_file_names)
+
+
+def __textract_stage(encoded_pages: queue.Queue, tracker: _FormGroupTracker, stop: threading.Event,
+                     textract: AWSTextract, save_images: bool):
+    while True:
+        encoded_page: typing.Optional[_EncodedPage] = _get(encoded_pages, stop)
+        if encoded_page is None:
+            return
+
+        image_file_name, document = encoded_page
+        textract.analyze_image(image_file_name, document, save_images)
+        tracker.page_analyzed(f'{image_file_name}.json')
+
+
+def __run_stage(stage: typing.Callable, stop: threading.Event, ready_groups: queue.Queue, *args):
+    try:
+        stage(*args)
+    except _Stopped:
+        pass
+    except BaseException:
+        # Stop the other stages and wake up the analysis, which raises the error of the failed future
+        stop.set()
+        ready_groups.put(None)
+        raise
+
+
+def run_pipeline(folder_or_filename: str,
+                 form_description_module_name: str,
+                 excel_file_name: str = 'results',
+                 dpi: int = 400,
+                 poppler_path: str = None,
+                 image_processor: typing.Optional[ImageProcessor] = None,
+                 page_window: int = 10,
+                 encoding: ImageEncoding = ImageEncoding(max_bytes=TEXTRACT_MAX_BYTES),
+                 save_images: bool = False,
+                 aws_region_name: str = None,
+                 aws_access_key_id: str = None,
+                 aws_secret_access_key: str = None,
+                 convert_workers: int = 1,
+                 textract_workers: int = 4,
+                 analyze_workers: int = 1,
+                 queue_size: int = 8,
+                 max_rate: typing.Optional[float] = None,
+                 max_retries: int = 8,
+                 use_cache: bool = False,
+                 streaming: bool = False,
+                 output_format: str = 'xlsx'):
+    """
+    Converts PDF files to images, runs AWS Textract on them and analyzes the forms in one overlapping pipeline.
+
+    The three stages run at the same time, each with its own number of workers. Converted pages are passed to the
+    Textract stage in a queue of at most queue_size pages, so that the conversion cannot run far ahead and fill up the
+    memory. A form is analyzed and written to the result file as soon as all its pages are analyzed by Textract and
+    all forms before it are written. The pages are grouped into forms in the order of their result file names like
+    analyze does, so the result file is the same as with pdf_to_image, run_textract and analyze on a folder that
+    only contains the results of these PDF files. The result file is written to the same location as with analyze,
+    i.e. next to the folder or in the folder of the PDF file. The form description must give the keywords per page,
+    since the number of pages per form has to be known in advance.
+
+    The images, result JSON files and the result file are saved like with pdf_to_textract and analyze. Pages whose
+    result JSON already exists are not sent to Textract again.
+
+    :param folder_or_filename: The folder containing the PDF files or a PDF file name
+    :param form_description_module_name: Name of the form description Python module
+    :param excel_file_name: Name of the result file without extension, default is 'results'
+    :param dpi: DPI to use for image generation, default is 400
+    :param poppler_path: Path to a poppler installation, required for Windows
+    :param image_processor: Optional function that takes an image index and an image and returns a list of
+        ProcessedImage (see pdf_to_image)
+    :param page_window: Number of pages that are rendered and kept in memory at the same time per conversion worker,
+        default is 10
+    :param encoding: Image encoding, default is PNG downscaled to fit the Textract limit
+    :param save_images: Also save the encoded images next to the PDF files, default is False
+    :param aws_region_name: Optional AWS region name
+    :param aws_access_key_id: Optional AWS access key ID
+    :param aws_secret_access_key: Optional AWS secret access key
+    :param convert_workers: Number of threads that convert PDF files, default is 1
+    :param textract_workers: Maximum number of concurrent Textract requests, default is 4
+    :param analyze_workers: Number of worker processes that analyze the forms, default is 1 (no extra processes)
+    :param queue_size: Maximum number of converted pages waiting for Textract, default is 8
+    :param max_rate: Optional maximum number of Textract requests per second
+    :param max_retries: Maximum number of retries of a throttled Textract request, default is 8
+    :param use_cache: Store the parsed fields of each result file in a cache file next to it, default is False
+    :param streaming: Write the Excel file in write-only mode, so that rows are not kept in memory, default is False
+    :param output_format: Result file format, one of 'xlsx', 'csv', 'jsonl' or 'parquet', default is 'xlsx'
+    """
+    from form_analyzer import form_analyzer_logger
+
+    check_output_format(output_format)
+    form_pages, form_fields = get_form(form_description_module_name)
+    if form_pages.pages == 0:
+        raise FormDescriptionError('The pipeline requires a form description with keywords_per_page to know the number '
+                                   'of pages per form')
+
+    pdf_file_names = get_pdf_files(folder_or_filename)
+    pdf_files = queue.Queue()
+    for pdf_file in enumerate(pdf_file_names):
+        pdf_files.put(pdf_file)
+    encoded_pages = queue.Queue(maxsize=queue_size)
+    ready_groups = queue.Queue()
+    tracker = _FormGroupTracker(pdf_file_names, form_pages.pages, ready_groups)
+    stop = threading.Event()
+
+    textract = AWSTextract(aws_region_name, aws_access_key_id, aws_secret_access_key,
+                           throttler=Throttler(textract_workers, max_rate, max_retries),
+                           max_pool_connections=textract_workers)
+    render_kwargs = {'image_processor': image_processor} if image_processor is not None else {}
+
+    # Same location as with analyze on the folder or file
+    results_file = f'{os.path.dirname(folder_or_filename)}/{excel_file_name}.{output_format}'
+    result_writer = create_result_writer(results_file, output_format, streaming)
+    result_writer.open(get_headers(form_fields))
+
+    try:
+        form_to_sheet = FormToSheet(result_writer, form_fields)
+
+        analyze_pool = worker_pool(analyze_workers, form_description_module_name, form_pages, use_cache) \
+            if analyze_workers > 1 else None
+
+        with ThreadPoolExecutor(max_workers=convert_workers + textract_workers) as executor:
+            try:
+                convert_futures = [executor.submit(__run_stage, __convert_stage, stop, ready_groups, pdf_files,
+                                                   encoded_pages, tracker, stop, dpi, poppler_path, render_kwargs,
+                                                   page_window, encoding)
+                                   for _ in range(convert_workers)]
+                textract_futures = [executor.submit(__run_stage, __textract_stage, stop, ready_groups, encoded_pages,
+                                                    tracker, stop, textract, save_images)
+                                    for _ in range(textract_workers)]
+
+                def finish_conversion():
+                    for convert_future in convert_futures:
+                        convert_future.result()
+                    for _ in textract_futures:
+                        _put(encoded_pages, None, stop)
+
+                finish_future = executor.submit(__run_stage, finish_conversion, stop, ready_groups)
+
+                # Rows are written in file order, the analysis of the following forms runs meanwhile
+                form_rows: typing.Deque[typing.Union[Future, typing.Tuple]] = collections.deque()
+                while True:
+                    file_names = ready_groups.get()
+                    if file_names is None or stop.is_set():
+                        break
+
+                    if analyze_pool is not None:
+                        form_rows.append(analyze_pool.submit(get_form_row, file_names))
+                    else:
+                        form_rows.append(analyze_form_group(file_names, form_pages, form_fields, use_cache))
+
+                    while form_rows and (not isinstance(form_rows[0], Future) or form_rows[0].done()
+                                         or len(form_rows) > 2 * analyze_workers):
+                        __write_form_row(form_to_sheet, form_rows.popleft())
+
+                for future in convert_futures + textract_futures + [finish_future]:
+                    future.result()
+                while form_rows:
+                    __write_form_row(form_to_sheet, form_rows.popleft())
+            finally:
+                stop.set()
+                if analyze_pool is not None:
+                    analyze_pool.shutdown()
+    except BaseException:
+        # Do not leave open files and an incomplete result file behind
+        result_writer.discard()
+        raise
+
+    form_analyzer_logger.log(logging.INFO, f'Textract summary: {textract.throttler.statistics}')
+    form_analyzer_logger.log(logging.INFO,
+                             f'Found {form_to_sheet.uncertain_fields} uncertain fields in total '
+                             f'{form_to_sheet.num_fields} fields')
+    form_analyzer_logger.log(logging.INFO, f'Finished. Results saved in {results_file}')
+    result_writer.close()
+
+
+def __write_form_row(form_to_sheet: FormToSheet, form_row: typing.Union[Future, typing.Tuple]):
+    from form_analyzer import form_analyzer_logger
+
+    form_name, table_line, uncertain_fields = form_row.result() if isinstance(form_row, Future) else form_row
+    form_analyzer_logger.log(logging.INFO, f'Analyzing {form_name}')
+    form_to_sheet.add_table_line(table_line, uncertain_fields)
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import threading
+import typing
+from dataclasses import dataclass
+
+# Price of AnalyzeDocument with forms for the first million pages per month in US dollars
+PRICE_PER_PAGE = 0.05
+
+
+@dataclass
+class ResponseCacheStatistics:
+    hits: int = 0
+    misses: int = 0
+    price_per_page: float = PRICE_PER_PAGE
+
+    @property
+    def savings(self) -> float:
+        return self.hits * self.price_per_page
+
+    def __str__(self):
+        return f'{self.hits} hits, {self.misses} misses, estimated savings ${self.savings:.2f}'
+
+
+class ResponseCache:
+    """
+    Content-addressed cache of AWS Textract responses in a local directory.
+
+    Responses are stored under the SHA-256 hash of the image file, so that re-scanned, renamed or duplicated pages
+    with the same content are only analyzed once.
+
+    :param directory: Cache directory, created if it does not exist
+    :param price_per_page: Price of a Textract request for the estimated savings, default is the price of
+        AnalyzeDocument with forms
+    """
+    def __init__(self, directory: str, price_per_page: float = PRICE_PER_PAGE):
+        self.__directory = directory
+        self.__hashes: typing.Dict[str, str] = {}
+        self.__lock = threading.Lock()
+        self.statistics = ResponseCacheStatistics(price_per_page=price_per_page)
+
+    def __hash(self, file_name: str) -> str:
+        with self.__lock:
+            if file_name in self.__hashes:
+                return self.__hashes[file_name]
+
+        sha256 = hashlib.sha256()
+        with open(file_name, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+
+        with self.__lock:
+            self.__hashes[file_name] = sha256.hexdigest()
+        return self.__hashes[file_name]
+
+    def __cache_file_name(self, file_name: str) -> str:
+        content_hash = self.__hash(file_name)
+        return os.path.join(self.__directory, content_hash[:2], f'{content_hash}.json')
+
+    def contains(self, file_name: str) -> bool:
+        return os.path.exists(self.__cache_file_name(file_name))
+
+    def get(self, file_name: str) -> typing.Optional[typing.Dict]:
+        """
+        Gets the cached response for an image file and counts the hit or miss.
+
+        :param file_name: Image file name
+        :return: The response or None if the content was not analyzed yet
+        """
+        try:
+            with open(self.__cache_file_name(file_name)) as f:
+                response = json.load(f)
+        except (OSError, ValueError):
+            response = None
+
+        with self.__lock:
+            if response is None:
+                self.statistics.misses += 1
+            else:
+                self.statistics.hits += 1
+        return response
+
+    def put(self, file_name: str, response: typing.Dict):
+        cache_file_name = self.__cache_file_name(file_name)
+        os.makedirs(os.path.dirname(cache_file_name), exist_ok=True)
+        # Write to a temporary file first, so that concurrent readers never see a partially written response
+        temp_file_name = f'{cache_file_name}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_file_name, 'w') as f:
+            json.dump(response, f)
+        os.replace(temp_file_name, cache_file_name)
@@ -2,13 +2,19 @@ import enum
 import typing
 from dataclasses import dataclass
 
+from form_analyzer import memo
+from form_analyzer.filters import FilterKey, Filter
 from form_analyzer.form_parser import FieldList, FieldWithPage
 
 
-def simple_str(s: str) -> str:
+def __simple_str(s: str) -> str:
     return ''.join(filter(lambda x: ord('a') <= ord(x) <= ord('z') or ord('0') <= ord(x) <= ord('9'), s.lower()))
 
 
+def simple_str(s: str) -> str:
+    return memo.simple_str_cache.get(s, lambda: __simple_str(s))
+
+
 class Match(enum.Enum):
     EXACT_SELECTED = 0
     EXACT_NOT_SELECTED = 1
@@ -42,6 +48,14 @@ class Selector:
     def headers(self) -> typing.List[str]:
         raise NotImplementedError
 
+    def compile_filters(self, compiled_filters: typing.Dict[FilterKey, Filter]):
+        """
+        Replaces the filters of the selector by shared instances of structurally equal filters.
+
+        :param compiled_filters: Filters compiled so far by their key
+        """
+        pass
+
 
 class Placeholder(Selector):
     """
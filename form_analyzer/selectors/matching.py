@@ -0,0 +1,85 @@
+import collections
+import difflib
+import typing
+
+from form_analyzer import instrumentation, memo
+from form_analyzer.selectors.base import SimpleField
+
+
+class FieldMatcher:
+    """
+    Finds the fields that match a selection in a list of fields.
+
+    Exact matches are looked up in a hash map. For similar matches, fields are skipped based on upper bounds of the
+    similarity ratio (length and character counts) before the full ratio is calculated, so the result is the same as
+    calculating the ratio for all fields.
+
+    :param simple_fields: Fields to match
+    """
+    def __init__(self, simple_fields: typing.List[SimpleField]):
+        self.__simple_fields = simple_fields
+        self.__fields_by_key: typing.Dict[str, SimpleField] = {}
+        for simple_field in reversed(simple_fields):
+            self.__fields_by_key[simple_field.key] = simple_field
+        self.__char_counts: typing.List[typing.Optional[typing.Counter]] = [None] * len(simple_fields)
+        self.__sequence_matchers: typing.List[typing.Optional[difflib.SequenceMatcher]] = [None] * len(simple_fields)
+
+    def exact_match(self, simple_selection: str) -> typing.Optional[SimpleField]:
+        """
+        Gets the first field whose key is equal to the selection.
+        """
+        return self.__fields_by_key.get(simple_selection)
+
+    def __char_count(self, index: int) -> typing.Counter:
+        if self.__char_counts[index] is None:
+            self.__char_counts[index] = collections.Counter(self.__simple_fields[index].key)
+        return self.__char_counts[index]
+
+    def __calculate_ratio(self, simple_selection: str, index: int) -> float:
+        # The field key is always the second sequence, whose analysis is kept for the other selections
+        if self.__sequence_matchers[index] is None:
+            self.__sequence_matchers[index] = difflib.SequenceMatcher(b=self.__simple_fields[index].key)
+        sequence_matcher = self.__sequence_matchers[index]
+        sequence_matcher.set_seq1(simple_selection)
+        instrumentation.count('similarity computations')
+        return sequence_matcher.ratio()
+
+    def __ratio(self, simple_selection: str, index: int) -> float:
+        return memo.similarity_cache.get((simple_selection, self.__simple_fields[index].key),
+                                         lambda: self.__calculate_ratio(simple_selection, index))
+
+    def most_similar(self, simple_selection: str, min_ratio: float) -> typing.Optional[SimpleField]:
+        """
+        Gets the first field with the highest similarity ratio to the selection above the minimum ratio.
+
+        :param simple_selection: Selection to match
+        :param min_ratio: Minimum ratio (exclusive)
+        :return: The most similar field or None if no field is similar enough
+        """
+        best_field = None
+        max_ratio = min_ratio
+        selection_char_count = None
+
+        for index, simple_field in enumerate(self.__simple_fields):
+            length = len(simple_selection) + len(simple_field.key)
+            if length == 0:
+                ratio = 1.0
+            else:
+                # Upper bound by length, like SequenceMatcher.real_quick_ratio
+                if 2.0 * min(len(simple_selection), len(simple_field.key)) / length <= max_ratio:
+                    continue
+
+                # Upper bound by common characters, like SequenceMatcher.quick_ratio
+                if selection_char_count is None:
+                    selection_char_count = collections.Counter(simple_selection)
+                common_chars = sum((selection_char_count & self.__char_count(index)).values())
+                if 2.0 * common_chars / length <= max_ratio:
+                    continue
+
+                ratio = self.__ratio(simple_selection, index)
+
+            if ratio > max_ratio:
+                best_field = simple_field
+                max_ratio = ratio
+
+        return best_field
@@ -29,9 +29,10 @@ class MultiSelect(Select):
     def headers(self) -> typing.List[str]:
         return self.selections + super(MultiSelect, self).headers()
 
-    def __check_exact_or_part_match(self, matches) -> bool:
+    @staticmethod
+    def __check_exact_or_part_match(selection_matches: typing.List[Select.SelectionMatch], matches) -> bool:
         match_found = False
-        for index, match in enumerate(self.selection_matches):
+        for index, match in enumerate(selection_matches):
             if match.match in [Match.EXACT_SELECTED, Match.SIMILAR_SELECTED]:
                 matches[index + 1] = FormValue('1' + ('?' if match.uncertain else ''), match.page, match.uncertain)
                 match_found = True
@@ -40,8 +41,8 @@ class MultiSelect(Select):
 
         return match_found
 
-    def __get_uncertain_selected(self) -> FormValue:
-        return FormValue('1?', self._get_first_found_page(), True)
+    def __get_uncertain_selected(self, selection_matches: typing.List[Select.SelectionMatch]) -> FormValue:
+        return FormValue('1?', self._get_first_found_page(selection_matches), True)
 
     @staticmethod
     def __populate_matches(num_matches: int):
@@ -55,18 +56,18 @@ class MultiSelect(Select):
         matches = self.__populate_matches(len(self.selections) + 1)
 
         simple_fields = self._get_filtered_fields(form_fields)
-        self._match_selections(simple_fields)
+        selection_matches = self._match_selections(simple_fields)
 
-        any_found = self.__check_exact_or_part_match(matches)
-        matches[0].page = self._get_first_found_page()
+        any_found = self.__check_exact_or_part_match(selection_matches, matches)
+        matches[0].page = self._get_first_found_page(selection_matches)
 
         # If no matches were found, the matching item might be not detected - but only if there are some missing
         not_found_match = Select.SelectionMatch(Match.NOT_FOUND)
-        if not any_found and self.selection_matches.count(not_found_match) == 1:
-            select_index = self.selection_matches.index(not_found_match)
-            matches[select_index + 1] = self.__get_uncertain_selected()
+        if not any_found and selection_matches.count(not_found_match) == 1:
+            select_index = selection_matches.index(not_found_match)
+            matches[select_index + 1] = self.__get_uncertain_selected(selection_matches)
 
-        if self.selection_matches.count(not_found_match) >= 2:
+        if selection_matches.count(not_found_match) >= 2:
             matches[0].uncertain = True
 
         if self.alternative is not None:
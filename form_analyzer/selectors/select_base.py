@@ -1,12 +1,12 @@
-import difflib
 import typing
 from abc import ABC
 from dataclasses import dataclass
 
-from form_analyzer.filters import Filter
+from form_analyzer.filters import Filter, FilterKey
 from form_analyzer.form_parser import FieldList
 from form_analyzer.selectors.text_fields import TextField, TextFieldWithCheckbox
 from form_analyzer.selectors.base import Selector, Match, SimpleField, simple_str
+from form_analyzer.selectors.matching import FieldMatcher
 
 
 class Select(Selector, ABC):
@@ -22,7 +22,6 @@ class Select(Selector, ABC):
     def __init__(self, selections: typing.List[str], filter_: Filter, alternative: typing.Union['TextField', 'TextFieldWithCheckbox'] = None,
                  additional: typing.Union['TextField', 'TextFieldWithCheckbox'] = None):
         self.selections = selections
-        self.selection_matches = [Select.SelectionMatch(Match.NOT_FOUND)] * len(self.selections)
         self.alternative = alternative
         self.additional: TextField = additional
         self.filter = filter_
@@ -33,56 +32,66 @@ class Select(Selector, ABC):
         else:
             return []
 
+    def compile_filters(self, compiled_filters: typing.Dict[FilterKey, Filter]):
+        self.filter = self.filter.compile(compiled_filters)
+        if self.alternative is not None:
+            self.alternative.compile_filters(compiled_filters)
+        if self.additional is not None:
+            self.additional.compile_filters(compiled_filters)
+
     def _get_filtered_fields(self, form_fields: FieldList) -> typing.List[SimpleField]:
         return [SimpleField(field_with_page) for field_with_page in self.filter.filter(form_fields)]
 
-    def __check_exact_match(self, simple_selection: str, index: int, simple_fields: typing.List[SimpleField]) -> bool:
-        for simple_field in simple_fields:
-            if simple_field.key == simple_selection:
-                self.selection_matches[index] = Select.SelectionMatch(
-                    Match.EXACT_SELECTED if simple_field.selected else Match.EXACT_NOT_SELECTED,
-                    simple_field.page, simple_field.uncertain)
-                return True
-
-        return False
+    @staticmethod
+    def __match(simple_field: SimpleField, exact: bool) -> 'Select.SelectionMatch':
+        if exact:
+            match = Match.EXACT_SELECTED if simple_field.selected else Match.EXACT_NOT_SELECTED
+        else:
+            match = Match.SIMILAR_SELECTED if simple_field.selected else Match.SIMILAR_NOT_SELECTED
+        return Select.SelectionMatch(match, simple_field.page, simple_field.uncertain)
 
-    def __check_similar_match(self, simple_selection: str, index: int, simple_fields: typing.List[SimpleField]) -> bool:
-        match_found = False
-        max_ratio = 0.9
-        # Second pass: similar match
-        for simple_field in simple_fields:
-            s = difflib.SequenceMatcher(a=simple_selection, b=simple_field.key)
-            ratio = s.ratio()
-            if ratio > max_ratio:
-                self.selection_matches[index] = Select.SelectionMatch(
-                    Match.SIMILAR_SELECTED if simple_field.selected else Match.SIMILAR_NOT_SELECTED,
-                    simple_field.page, simple_field.uncertain)
-                max_ratio = ratio
-                match_found = True
-
-        return match_found
-
-    def __check_part_match(self, simple_selection: str, index: int, simple_fields: typing.List[SimpleField]):
+    @staticmethod
+    def __part_match(simple_selection: str, simple_fields: typing.List[SimpleField]) -> typing.Optional[SimpleField]:
         for simple_field in simple_fields:
             if simple_field.key in simple_selection:
-                self.selection_matches[index] = Select.SelectionMatch(
-                    Match.SIMILAR_SELECTED if simple_field.selected else Match.SIMILAR_NOT_SELECTED,
-                    simple_field.page, simple_field.uncertain)
-                break
+                return simple_field
 
-    def _match_selections(self, simple_fields: typing.List[SimpleField]):
-        self.selection_matches = [Select.SelectionMatch(Match.NOT_FOUND)] * len(self.selections)
+        return None
 
-        for index, selection in enumerate(self.selections):
-            simple_selection = simple_str(selection)
+    def __match_selection(self, selection: str, simple_fields: typing.List[SimpleField],
+                          field_matcher: FieldMatcher) -> 'Select.SelectionMatch':
+        simple_selection = simple_str(selection)
 
-            if not self.__check_exact_match(simple_selection, index, simple_fields) and \
-                    not self.__check_similar_match(simple_selection, index, simple_fields) and \
-                    len(selection) > 15:
-                self.__check_part_match(simple_selection, index, simple_fields)
+        # First pass: exact match
+        simple_field = field_matcher.exact_match(simple_selection)
+        if simple_field is not None:
+            return self.__match(simple_field, True)
 
-    def _get_first_found_page(self) -> int:
-        for selection_match in self.selection_matches:
+        # Second pass: similar match
+        simple_field = field_matcher.most_similar(simple_selection, 0.9)
+        if simple_field is None and len(selection) > 15:
+            simple_field = self.__part_match(simple_selection, simple_fields)
+        if simple_field is not None:
+            return self.__match(simple_field, False)
+
+        return Select.SelectionMatch(Match.NOT_FOUND)
+
+    def _match_selections(self, simple_fields: typing.List[SimpleField]) -> typing.List['Select.SelectionMatch']:
+        """
+        Matches the selections against the fields of a form.
+
+        The matches are returned instead of stored in the selector, so that a selector can analyze several forms at the
+        same time, i.e. in different threads.
+
+        :param simple_fields: Filtered fields of the form
+        :return: One match per selection
+        """
+        field_matcher = FieldMatcher(simple_fields)
+        return [self.__match_selection(selection, simple_fields, field_matcher) for selection in self.selections]
+
+    @staticmethod
+    def _get_first_found_page(selection_matches: typing.List['Select.SelectionMatch']) -> int:
+        for selection_match in selection_matches:
             if selection_match.match != Match.NOT_FOUND:
                 return selection_match.page
 
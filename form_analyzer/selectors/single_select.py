@@ -26,22 +26,25 @@ class SingleSelect(Select):
                  additional: typing.Union['TextField', 'TextFieldWithCheckbox'] = None):
         super().__init__(selections, filter_, alternative, additional)
 
-    def __form_value_from_match(self, select_index: int) -> FormValue:
-        return FormValue(self.selections[select_index], self.selection_matches[select_index].page,
-                         self.selection_matches[select_index].uncertain,
+    def __form_value_from_match(self, selection_matches: typing.List[Select.SelectionMatch],
+                                select_index: int) -> FormValue:
+        return FormValue(self.selections[select_index], selection_matches[select_index].page,
+                         selection_matches[select_index].uncertain,
                          )
 
-    def __get_matched_select_index(self) -> typing.Optional[int]:
+    @staticmethod
+    def __get_matched_select_index(selection_matches: typing.List[Select.SelectionMatch]) -> typing.Optional[int]:
         try:
-            select_index = self.selection_matches.index(Select.SelectionMatch(Match.EXACT_SELECTED))
+            select_index = selection_matches.index(Select.SelectionMatch(Match.EXACT_SELECTED))
         except ValueError:
             try:
-                select_index = self.selection_matches.index(Select.SelectionMatch(Match.SIMILAR_SELECTED))
+                select_index = selection_matches.index(Select.SelectionMatch(Match.SIMILAR_SELECTED))
             except ValueError:
                 select_index = None
         return select_index
 
-    def __get_value_if_no_selection(self, form_fields: FieldList) -> FormValue:
+    def __get_value_if_no_selection(self, form_fields: FieldList,
+                                    selection_matches: typing.List[Select.SelectionMatch]) -> FormValue:
         # No selection found, try alternatives
         not_found_match = Select.SelectionMatch(Match.NOT_FOUND)
 
@@ -49,12 +52,13 @@ class SingleSelect(Select):
         alternative = self.alternative.values(form_fields)[0] if self.alternative is not None else None
 
         if alternative is None or not len(alternative.value):
-            if self.selection_matches.count(not_found_match) == 1:
-                select_index = self.selection_matches.index(not_found_match)
-                return_value = self.__form_value_from_match(select_index)
-                return_value.page = self._get_first_found_page()
+            if selection_matches.count(not_found_match) == 1:
+                select_index = selection_matches.index(not_found_match)
+                return_value = self.__form_value_from_match(selection_matches, select_index)
+                return_value.page = self._get_first_found_page(selection_matches)
             else:
-                return_value = FormValue('', self._get_first_found_page(), self.selection_matches.count(not_found_match) > 1)
+                return_value = FormValue('', self._get_first_found_page(selection_matches),
+                                         selection_matches.count(not_found_match) > 1)
         else:
             return_value = alternative
 
@@ -62,15 +66,15 @@ class SingleSelect(Select):
 
     def values(self, form_fields: FieldList) -> typing.List[FormValue]:
         simple_fields = self._get_filtered_fields(form_fields)
-        self._match_selections(simple_fields)
+        selection_matches = self._match_selections(simple_fields)
 
         # Find best matching fields
-        select_index = self.__get_matched_select_index()
+        select_index = self.__get_matched_select_index(selection_matches)
 
         if select_index is not None:
-            return_value = [self.__form_value_from_match(select_index)]
+            return_value = [self.__form_value_from_match(selection_matches, select_index)]
         else:
-            return_value = [self.__get_value_if_no_selection(form_fields)]
+            return_value = [self.__get_value_if_no_selection(form_fields, selection_matches)]
 
         if self.additional is not None:
             return_value.append(self.additional.values(form_fields)[0])
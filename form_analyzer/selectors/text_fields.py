@@ -1,6 +1,6 @@
 import typing
 
-from form_analyzer.filters import Filter
+from form_analyzer.filters import Filter, FilterKey
 from form_analyzer.form_parser import FieldWithPage, FieldList
 from form_analyzer.selectors.base import Selector, simple_str, FormValue
 
@@ -20,6 +20,9 @@ class TextField(Selector):
     def headers(self) -> typing.List[str]:
         return []
 
+    def compile_filters(self, compiled_filters: typing.Dict[FilterKey, Filter]):
+        self.filter = self.filter.compile(compiled_filters)
+
     @staticmethod
     def __form_value_from_match(field_with_page: FieldWithPage) -> FormValue:
         tx_field = field_with_page.field
@@ -76,6 +79,9 @@ class TextFieldWithCheckbox(Selector):
     def headers(self) -> typing.List[str]:
         return []
 
+    def compile_filters(self, compiled_filters: typing.Dict[FilterKey, Filter]):
+        self.filter = self.filter.compile(compiled_filters)
+
     def __form_value_from_match(self, field_with_page: FieldWithPage) -> FormValue:
         tx_field = field_with_page.field
         uncertain = tx_field.confidence < 40
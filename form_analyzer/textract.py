@@ -1,11 +1,36 @@
+import asyncio
 import glob
 import json
 import logging
 import os
+import threading
+import time
 import typing
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from dataclasses import dataclass
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from PIL.Image import Image
+
+from .conversion import IMAGE_EXTENSIONS, ImageEncoding, ImageProcessor, TEXTRACT_MAX_BYTES, encode_image, get_pdf_files, \
+    render_pdf
+from .response_cache import ResponseCache
+from .throttling import Throttler, ThrottlingStatistics
+
+
+@dataclass
+class TextractTimings:
+    clients: int = 0
+    client_setup: float = 0
+    requests: int = 0
+    request_time: float = 0
+
+    def __str__(self):
+        return f'{self.clients} clients set up in {self.client_setup:.2f}s, ' \
+               f'{self.requests} requests in {self.request_time:.2f}s'
 
 
 class AWSTextract:
@@ -13,89 +38,643 @@ class AWSTextract:
                  aws_access_key_id: str = None,
                  aws_secret_access_key: str = None,
                  s3_bucket_name: str = None,
-                 s3_folder: str = ''):
+                 s3_folder: str = '',
+                 throttler: Throttler = None,
+                 max_pool_connections: int = 10,
+                 response_cache: ResponseCache = None):
         self.aws_region_name = aws_region_name
         self.aws_access_key_id = aws_access_key_id
         self.aws_secret_access_key = aws_secret_access_key
         self.s3_bucket_name = s3_bucket_name
         self.s3_folder = s3_folder
+        self.throttler = throttler or Throttler(4)
+        self.response_cache = response_cache
+        self.timings = TextractTimings()
+        self.__max_pool_connections = max_pool_connections
+        self.__clients = {}
+        self.__lock = threading.Lock()
+        self.__s3_keys: typing.Optional[typing.Set[str]] = None
+        self.__s3_lock = threading.Lock()
+        self.__transfer_config = TransferConfig(multipart_threshold=8 * 1024 * 1024,
+                                                max_concurrency=min(2, max_pool_connections))
 
-    def query_aws(self, file_name: str):
-        from form_analyzer import form_analyzer_logger
+    def client(self, service_name: str):
+        """
+        Gets the client for an AWS service, which is created once and shared by all threads.
 
-        if os.path.exists(f'{file_name}.json'):
-            form_analyzer_logger.log(logging.DEBUG, f'Skipping {file_name}')
-            return
+        :param service_name: AWS service name
+        :return: boto3 client
+        """
+        # Creating clients is not thread-safe, while using them is
+        with self.__lock:
+            if service_name not in self.__clients:
+                start = time.perf_counter()
+                self.__clients[service_name] = boto3.client(
+                    service_name, region_name=self.aws_region_name, aws_access_key_id=self.aws_access_key_id,
+                    aws_secret_access_key=self.aws_secret_access_key,
+                    config=Config(max_pool_connections=self.__max_pool_connections))
+                self.timings.clients += 1
+                self.timings.client_setup += time.perf_counter() - start
+            return self.__clients[service_name]
+
+    def __timed_request(self, request: typing.Callable[[], typing.Dict]) -> typing.Dict:
+        start = time.perf_counter()
+        try:
+            return request()
+        finally:
+            with self.__lock:
+                self.timings.requests += 1
+                self.timings.request_time += time.perf_counter() - start
 
-        form_analyzer_logger.log(logging.INFO, f'Textracting {file_name}')
+    @staticmethod
+    def is_analyzed(file_name: str) -> bool:
+        return os.path.exists(f'{file_name}.json')
 
+    def load_document(self, file_name: str) -> typing.Dict:
         if self.s3_bucket_name is not None:
-            document = self.__upload_to_s3(file_name, self.s3_bucket_name, self.s3_folder)
+            return self.__get_s3_document(file_name)
         else:
             with open(file_name, "rb") as image_file:
-                document = {
+                return {
                     'Bytes': image_file.read(),
                 }
 
-        textract = boto3.client('textract', region_name=self.aws_region_name, aws_access_key_id=self.aws_access_key_id,
-                                aws_secret_access_key=self.aws_secret_access_key)
+    def analyze_document(self, document: typing.Dict) -> typing.Dict:
+        textract = self.client('textract')
 
-        response = textract.analyze_document(
+        return self.throttler.call(lambda: self.__timed_request(lambda: textract.analyze_document(
             Document=document,
             FeatureTypes=["FORMS"]
-        )
+        )))
 
+    @staticmethod
+    def save_response(file_name: str, response: typing.Dict):
         with open(f'{file_name}.json', 'w+') as f:
             json.dump(response, f)
 
-    def __upload_to_s3(self, file_name: str,
-                       s3_bucket_name: str = None,
-                       s3_folder: str = '') -> typing.Dict:
+    def analyze_image(self, image_file_name: str, document: bytes, save_image: bool = False):
+        """
+        Runs AWS Textract on an encoded image and saves the response next to the image file name.
+
+        :param image_file_name: Name of the image file
+        :param document: Encoded image
+        :param save_image: Also save the encoded image, default is False
+        """
         from form_analyzer import form_analyzer_logger
 
-        s3 = boto3.client('s3', region_name=self.aws_region_name, aws_access_key_id=self.aws_access_key_id,
-                          aws_secret_access_key=self.aws_secret_access_key)
+        if save_image:
+            with open(image_file_name, 'wb') as f:
+                f.write(document)
+
+        form_analyzer_logger.log(logging.INFO, f'Textracting {image_file_name}')
+        self.save_response(image_file_name, self.analyze_document({'Bytes': document}))
+
+    def query_aws(self, file_name: str):
+        from form_analyzer import form_analyzer_logger
+
+        if self.is_analyzed(file_name):
+            form_analyzer_logger.log(logging.DEBUG, f'Skipping {file_name}')
+            return
+
+        response = self.__get_cached_response(file_name)
+        if response is None:
+            form_analyzer_logger.log(logging.INFO, f'Textracting {file_name}')
+            response = self.analyze_document(self.load_document(file_name))
+            self.__cache_response(file_name, response)
+
+        self.save_response(file_name, response)
+
+    async def query_aws_async(self, file_name: str, executor: ThreadPoolExecutor, read_semaphore: asyncio.Semaphore):
+        from form_analyzer import form_analyzer_logger
+
+        if self.is_analyzed(file_name):
+            form_analyzer_logger.log(logging.DEBUG, f'Skipping {file_name}')
+            return
+
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(executor, self.__get_cached_response, file_name)
+        if response is None:
+            form_analyzer_logger.log(logging.INFO, f'Textracting {file_name}')
+
+            if self.s3_bucket_name is None:
+                # The semaphore bounds the number of documents that are read and held in memory at the same time
+                async with read_semaphore:
+                    response = await self.__analyze_file_async(file_name, executor)
+            else:
+                # Documents on S3 are only referenced, so nothing is read
+                response = await self.__analyze_file_async(file_name, executor)
+            await loop.run_in_executor(executor, self.__cache_response, file_name, response)
+
+        await loop.run_in_executor(executor, self.save_response, file_name, response)
+
+    async def __analyze_file_async(self, file_name: str, executor: ThreadPoolExecutor) -> typing.Dict:
+        loop = asyncio.get_running_loop()
+        document = await loop.run_in_executor(executor, self.load_document, file_name)
+        return await loop.run_in_executor(executor, self.analyze_document, document)
+
+    def __get_cached_response(self, file_name: str) -> typing.Optional[typing.Dict]:
+        from form_analyzer import form_analyzer_logger
+
+        if self.response_cache is None:
+            return None
+
+        response = self.response_cache.get(file_name)
+        if response is not None:
+            form_analyzer_logger.log(logging.INFO, f'Using cached result for {file_name}')
+        return response
+
+    def __cache_response(self, file_name: str, response: typing.Dict):
+        if self.response_cache is not None:
+            self.response_cache.put(file_name, response)
+
+    def pending_uploads(self, file_names: typing.List[str]) -> typing.List[str]:
+        """
+        Gets the files that need to be analyzed and are not in the response cache.
+        """
+        return [file_name for file_name in file_names if not self.is_analyzed(file_name) and
+                (self.response_cache is None or not self.response_cache.contains(file_name))]
+
+    def __s3_file_name(self, file_name: str) -> str:
+        return self.s3_folder + os.path.split(file_name)[1]
 
-        s3_file_name = s3_folder + os.path.split(file_name)[1]
-        if 'Contents' not in s3.list_objects(Bucket=s3_bucket_name, Prefix=s3_file_name):
-            form_analyzer_logger.log(logging.INFO, f'Uploading to S3 as {s3_file_name}')
-            s3.upload_file(file_name, s3_bucket_name, s3_file_name)
+    def s3_keys(self) -> typing.Set[str]:
+        """
+        Gets the keys in the S3 bucket folder, the folder is only listed once.
+        """
+        return set(self.__get_s3_keys())
+
+    def __get_s3_keys(self) -> typing.Set[str]:
+        with self.__s3_lock:
+            if self.__s3_keys is None:
+                # List the folder once instead of checking each file, paginated since a listing is limited to 1000 keys
+                s3_keys = set()
+                paginator = self.client('s3').get_paginator('list_objects_v2')
+                for page in paginator.paginate(Bucket=self.s3_bucket_name, Prefix=self.s3_folder):
+                    s3_keys.update(s3_object['Key'] for s3_object in page.get('Contents', []))
+                self.__s3_keys = s3_keys
+            return self.__s3_keys
+
+    def __upload_file(self, file_name: str):
+        from form_analyzer import form_analyzer_logger
+
+        s3_file_name = self.__s3_file_name(file_name)
+        form_analyzer_logger.log(logging.INFO, f'Uploading to S3 as {s3_file_name}')
+        self.client('s3').upload_file(file_name, self.s3_bucket_name, s3_file_name, Config=self.__transfer_config)
+        with self.__s3_lock:
+            self.__s3_keys.add(s3_file_name)
+
+    def __upload_connections(self, file_name: str) -> int:
+        # Files below the multipart threshold are uploaded with a single request
+        if os.path.getsize(file_name) < self.__transfer_config.multipart_threshold:
+            return 1
+        return self.__transfer_config.max_concurrency
+
+    def upload_to_s3(self, file_names: typing.List[str]):
+        """
+        Uploads all files that are not yet in the S3 bucket folder concurrently.
+
+        Single-part uploads use one connection each, multipart uploads up to max_concurrency connections. Both kinds are
+        uploaded one after the other with as many concurrent uploads as fit into the connection pool.
+
+        :param file_names: Names of the files to upload
+        """
+        s3_keys = self.__get_s3_keys()
+        missing_file_names: typing.Dict[int, typing.List[str]] = {}
+        for file_name in file_names:
+            if self.__s3_file_name(file_name) not in s3_keys:
+                missing_file_names.setdefault(self.__upload_connections(file_name), []).append(file_name)
+
+        for connections, upload_file_names in sorted(missing_file_names.items()):
+            with ThreadPoolExecutor(max_workers=max(1, self.__max_pool_connections // connections)) as executor:
+                for future in as_completed([executor.submit(self.__upload_file, file_name)
+                                            for file_name in upload_file_names]):
+                    future.result()
+
+    def __get_s3_document(self, file_name: str) -> typing.Dict:
+        from form_analyzer import form_analyzer_logger
+
+        s3_file_name = self.__s3_file_name(file_name)
+        if s3_file_name not in self.__get_s3_keys():
+            self.__upload_file(file_name)
         else:
             form_analyzer_logger.log(logging.DEBUG, f'File {s3_file_name} already on S3')
 
         return {
             'S3Object':
-                {'Bucket': s3_bucket_name,
+                {'Bucket': self.s3_bucket_name,
                  'Name': s3_file_name
                  }
         }
 
 
+class _TextractJobFailed(Exception):
+    pass
+
+
+@dataclass
+class _TextractJob:
+    s3_file_name: str
+    job_id: str
+    poll_interval: float
+    next_poll: float
+
+
+class TextractJobs:
+    """
+    Analyzes multi-page PDFs on S3 with asynchronous AWS Textract jobs.
+
+    Up to max_jobs jobs are running at the same time. Each job is polled with an exponentially growing interval until
+    it is finished, then the results of all pages are fetched and saved as one JSON file per page, named after the PDF
+    file with the four digit page number appended, e.g. "form_0001.json". PDFs in subfolders of the S3 folder get the
+    subfolders in their name, e.g. "2021_form_0001.json" for "2021/form.pdf". Sorting the files by name keeps the pages
+    of a PDF together and in order, so that the files can be used with analyze.
+
+    :param textract: AWSTextract instance with the S3 bucket
+    :param target_folder: Folder of the result JSON files
+    :param max_jobs: Maximum number of running jobs, default is 100
+    :param poll_interval: Interval before the first poll of a job in seconds, default is 1
+    :param max_poll_interval: Maximum interval between two polls of a job in seconds, default is 30
+    """
+    def __init__(self, textract: AWSTextract, target_folder: str, max_jobs: int = 100, poll_interval: float = 1,
+                 max_poll_interval: float = 30):
+        self.__textract = textract
+        self.__target_folder = target_folder
+        self.__max_jobs = max_jobs
+        self.__poll_interval = poll_interval
+        self.__max_poll_interval = max_poll_interval
+
+    def page_file_name(self, s3_file_name: str, page: int) -> str:
+        s3_folder = self.__textract.s3_folder
+        relative_name = s3_file_name[len(s3_folder):] if s3_file_name.startswith(s3_folder) else s3_file_name
+        file_name_without_ext = os.path.splitext(relative_name.strip('/'))[0].replace('/', '_')
+        return os.path.join(self.__target_folder, f'{file_name_without_ext}_{page:04}.json')
+
+    def is_analyzed(self, s3_file_name: str) -> bool:
+        # The first page is saved last, so it only exists if all pages were saved
+        return os.path.exists(self.page_file_name(s3_file_name, 1))
+
+    def __request(self, request: typing.Callable[[], typing.Dict]) -> typing.Dict:
+        return self.__textract.throttler.call(request)
+
+    def __start_job(self, s3_file_name: str) -> _TextractJob:
+        from form_analyzer import form_analyzer_logger
+
+        form_analyzer_logger.log(logging.INFO, f'Starting Textract job for {s3_file_name}')
+        textract = self.__textract.client('textract')
+        response = self.__request(lambda: textract.start_document_analysis(
+            DocumentLocation={'S3Object': {'Bucket': self.__textract.s3_bucket_name, 'Name': s3_file_name}},
+            FeatureTypes=['FORMS']
+        ))
+        return _TextractJob(s3_file_name, response['JobId'], self.__poll_interval, time.monotonic() + self.__poll_interval)
+
+    def __get_results(self, job: _TextractJob) -> typing.Optional[typing.List[typing.Dict]]:
+        """
+        Gets the results of a finished job.
+
+        :return: The responses of all pages or None if the job is still running
+        :raises _TextractJobFailed: If the job failed
+        """
+        from form_analyzer import form_analyzer_logger
+
+        textract = self.__textract.client('textract')
+        responses = []
+        next_token = None
+        while True:
+            kwargs = {'JobId': job.job_id}
+            if next_token is not None:
+                kwargs['NextToken'] = next_token
+            response = self.__request(lambda: textract.get_document_analysis(**kwargs))
+
+            status = response['JobStatus']
+            if status == 'IN_PROGRESS':
+                return None
+            if status == 'FAILED':
+                raise _TextractJobFailed(response.get('StatusMessage'))
+            if status == 'PARTIAL_SUCCESS':
+                form_analyzer_logger.log(logging.WARNING, f'Textract job for {job.s3_file_name} partially succeeded: '
+                                                          f'{response.get("StatusMessage")}')
+
+            responses.append(response)
+            next_token = response.get('NextToken')
+            if next_token is None:
+                return responses
+
+    def __save_pages(self, job: _TextractJob, responses: typing.List[typing.Dict]):
+        from form_analyzer import form_analyzer_logger
+
+        pages_blocks: typing.Dict[int, typing.List[typing.Dict]] = {}
+        for response in responses:
+            for block in response['Blocks']:
+                pages_blocks.setdefault(block.get('Page', 1), []).append(block)
+
+        form_analyzer_logger.log(logging.INFO, f'Saving {len(pages_blocks)} pages of {job.s3_file_name}')
+        os.makedirs(self.__target_folder, exist_ok=True)
+        for page in sorted(pages_blocks, reverse=True):
+            with open(self.page_file_name(job.s3_file_name, page), 'w') as f:
+                json.dump({'DocumentMetadata': {'Pages': 1}, 'Blocks': pages_blocks[page]}, f)
+
+    def run(self, s3_file_names: typing.List[str]):
+        """
+        Analyzes the PDFs that were not analyzed yet.
+
+        A job that fails or cannot be started does not stop the others, the results of all other PDFs are saved before
+        the error is raised.
+
+        :param s3_file_names: Names of the PDF files in the S3 bucket
+        :raises ValueError: If the results of two PDFs would get the same file names
+        :raises RuntimeError: If the jobs of some PDFs failed
+        """
+        from form_analyzer import form_analyzer_logger
+
+        s3_file_names_by_page_file: typing.Dict[str, str] = {}
+        for s3_file_name in s3_file_names:
+            page_file_name = self.page_file_name(s3_file_name, 1)
+            if page_file_name in s3_file_names_by_page_file:
+                raise ValueError(f'{s3_file_names_by_page_file[page_file_name]} and {s3_file_name} would both be saved '
+                                 f'as {page_file_name}')
+            s3_file_names_by_page_file[page_file_name] = s3_file_name
+
+        pending = [s3_file_name for s3_file_name in s3_file_names if not self.is_analyzed(s3_file_name)]
+        form_analyzer_logger.log(logging.INFO, f'{len(pending)} of {len(s3_file_names)} PDF files to analyze')
+        pending.reverse()
+        jobs: typing.List[_TextractJob] = []
+        failed_file_names: typing.List[str] = []
+
+        while pending or jobs:
+            while pending and len(jobs) < self.__max_jobs:
+                s3_file_name = pending.pop()
+                try:
+                    jobs.append(self.__start_job(s3_file_name))
+                except ClientError as e:
+                    form_analyzer_logger.log(logging.ERROR, f'Textract job for {s3_file_name} could not be started: {e}')
+                    failed_file_names.append(s3_file_name)
+            if not jobs:
+                break
+
+            job = min(jobs, key=lambda running_job: running_job.next_poll)
+            time.sleep(max(0., job.next_poll - time.monotonic()))
+
+            try:
+                responses = self.__get_results(job)
+            except _TextractJobFailed as e:
+                form_analyzer_logger.log(logging.ERROR, f'Textract job for {job.s3_file_name} failed: {e}')
+                jobs.remove(job)
+                failed_file_names.append(job.s3_file_name)
+                continue
+
+            if responses is None:
+                job.poll_interval = min(self.__max_poll_interval, job.poll_interval * 2)
+                job.next_poll = time.monotonic() + job.poll_interval
+            else:
+                jobs.remove(job)
+                self.__save_pages(job, responses)
+
+        if failed_file_names:
+            raise RuntimeError(f'Textract jobs failed for {", ".join(failed_file_names)}')
+
+
+def __log_summary(textract: AWSTextract):
+    from form_analyzer import form_analyzer_logger
+
+    form_analyzer_logger.log(logging.INFO, f'Textract summary: {textract.throttler.statistics}')
+    form_analyzer_logger.log(logging.INFO, f'Textract timings: {textract.timings}')
+    if textract.response_cache is not None:
+        form_analyzer_logger.log(logging.INFO, f'Textract result cache: {textract.response_cache.statistics}')
+
+
+def __get_image_files(folder_or_image_file: str) -> typing.List[str]:
+    if not os.path.isdir(folder_or_image_file):
+        return [folder_or_image_file]
+    return sorted(file_name for file_name in glob.glob(f'{folder_or_image_file}/*.*')
+                  if os.path.splitext(file_name)[1].lower() in IMAGE_EXTENSIONS)
+
+
+async def run_textract_async(folder_or_png_file: str,
+                             aws_region_name: str = None,
+                             aws_access_key_id: str = None,
+                             aws_secret_access_key: str = None,
+                             s3_bucket_name: str = None,
+                             s3_folder: str = '',
+                             max_in_flight: int = 16,
+                             max_reads: int = 8,
+                             max_rate: typing.Optional[float] = None,
+                             max_retries: int = 8,
+                             cache_directory: typing.Optional[str] = None) -> ThrottlingStatistics:
+    """
+    Run AWS Textract on all PNG and JPEG files in a folder or on a single image file with asyncio.
+
+    Up to max_in_flight files are processed concurrently, the blocking AWS calls and file operations run in a thread
+    pool of the same size. Without an S3 bucket, the image files are sent to Textract directly, so only max_reads of
+    them are read and held in memory at the same time, which also bounds the concurrent requests. Each result is saved
+    as soon as it is received. If a result JSON already exists for an image file, it will not be analyzed again.
+
+    :param folder_or_png_file: Image folder name or single image file
+    :param aws_region_name: Optional AWS region name
+    :param aws_access_key_id: Optional AWS access key ID
+    :param aws_secret_access_key: Optional AWS secret access key
+    :param s3_bucket_name: Optional S3 bucket name, if given, the function will upload the files to S3
+    :param s3_folder: S3 bucket folder name, defaults to ''
+    :param max_in_flight: Maximum number of concurrent Textract requests, default is 16
+    :param max_reads: Maximum number of image files read and held in memory at the same time, not used with an S3
+        bucket, default is 8
+    :param max_rate: Optional maximum number of Textract requests per second
+    :param max_retries: Maximum number of retries of a throttled Textract request, default is 8
+    :param cache_directory: Optional directory of a content-addressed result cache (see run_textract)
+    :return: Number of requests, throttled requests, retries and failures
+    """
+    textract = AWSTextract(aws_region_name, aws_access_key_id, aws_secret_access_key, s3_bucket_name, s3_folder,
+                           Throttler(max_in_flight, max_rate, max_retries), max_in_flight,
+                           ResponseCache(cache_directory) if cache_directory is not None else None)
+    read_semaphore = asyncio.Semaphore(max_reads)
+    loop = asyncio.get_running_loop()
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        # Listing the folder, hashing the files for the cache and listing the S3 folder block, so they do not run in
+        # the event loop
+        file_names = await loop.run_in_executor(executor, __get_image_files, folder_or_png_file)
+        if s3_bucket_name is not None:
+            pending_file_names = await loop.run_in_executor(executor, textract.pending_uploads, file_names)
+            await loop.run_in_executor(executor, textract.upload_to_s3, pending_file_names)
+        file_names = iter(file_names)
+
+        async def worker():
+            for file_name in file_names:
+                await textract.query_aws_async(file_name, executor, read_semaphore)
+
+        # Each worker takes the next file from the shared iterator, so only max_in_flight tasks exist at any time
+        await asyncio.gather(*[worker() for _ in range(max_in_flight)])
+
+    __log_summary(textract)
+    return textract.throttler.statistics
+
+
 def run_textract(folder_or_png_file: str,
                  aws_region_name: str = None,
                  aws_access_key_id: str = None,
                  aws_secret_access_key: str = None,
                  s3_bucket_name: str = None,
-                 s3_folder: str = ''):
+                 s3_folder: str = '',
+                 max_in_flight: typing.Optional[int] = None,
+                 max_rate: typing.Optional[float] = None,
+                 max_retries: int = 8,
+                 cache_directory: typing.Optional[str] = None,
+                 max_reads: int = 8) -> ThrottlingStatistics:
     """
-    Run AWS Textract on all PNG files in a folder or on a single PNG file.
+    Run AWS Textract on all PNG and JPEG files in a folder or on a single image file.
 
     The function can either upload all files to an S3 bucket and process them from there or upload them directly to Textract. The analysis results are saved
-    as JSON files. If a result JSON already exists for a PNG file, it will not be analyzed again.
+    as JSON files. If a result JSON already exists for an image file, it will not be analyzed again.
 
-    :param folder_or_png_file: PNG folder name or single PNG file
+    :param folder_or_png_file: Image folder name or single image file
     :param aws_region_name: Optional AWS region name
     :param aws_access_key_id: Optional AWS access key ID
     :param aws_secret_access_key: Optional AWS secret access key
     :param s3_bucket_name: Optional S3 bucket name, if given, the function will upload the files to S3
     :param s3_folder: S3 bucket folder name, defaults to ''
+    :param max_in_flight: Optional maximum number of concurrent Textract requests, if given, the files are processed
+        with asyncio (see run_textract_async), otherwise four threads are used
+    :param max_rate: Optional maximum number of Textract requests per second
+    :param max_retries: Maximum number of retries of a throttled Textract request, default is 8
+    :param cache_directory: Optional directory of a result cache, which stores the results by the content of the image
+        files. Files with the same content as an already analyzed file get the cached result instead of being sent to
+        Textract again. The hits, misses and estimated savings are logged at the end.
+    :param max_reads: Maximum number of image files held in memory with max_in_flight and without an S3 bucket
+        (see run_textract_async), default is 8
+    :return: Number of requests, throttled requests, retries and failures
     """
+    if max_in_flight is not None:
+        return asyncio.run(run_textract_async(folder_or_png_file, aws_region_name, aws_access_key_id, aws_secret_access_key,
+                                              s3_bucket_name, s3_folder, max_in_flight, max_reads, max_rate=max_rate,
+                                              max_retries=max_retries, cache_directory=cache_directory))
+
     with ThreadPoolExecutor(max_workers=4) as executor:
-        textract = AWSTextract(aws_region_name, aws_access_key_id, aws_secret_access_key, s3_bucket_name, s3_folder)
+        textract = AWSTextract(aws_region_name, aws_access_key_id, aws_secret_access_key, s3_bucket_name, s3_folder,
+                               Throttler(4, max_rate, max_retries), 4,
+                               ResponseCache(cache_directory) if cache_directory is not None else None)
         futures = []
 
-        for file_name in sorted(glob.glob(f'{folder_or_png_file}/*.png')) if os.path.isdir(folder_or_png_file) else [folder_or_png_file]:
+        file_names = __get_image_files(folder_or_png_file)
+        if s3_bucket_name is not None:
+            textract.upload_to_s3(textract.pending_uploads(file_names))
+
+        for file_name in file_names:
             futures.append(executor.submit(textract.query_aws, file_name))
 
         for future in as_completed(futures):
             future.result()
+
+    __log_summary(textract)
+    return textract.throttler.statistics
+
+
+def run_textract_jobs(target_folder: str,
+                      s3_bucket_name: str,
+                      s3_folder: str = '',
+                      aws_region_name: str = None,
+                      aws_access_key_id: str = None,
+                      aws_secret_access_key: str = None,
+                      max_jobs: int = 100,
+                      poll_interval: float = 1,
+                      max_poll_interval: float = 30,
+                      max_rate: typing.Optional[float] = None,
+                      max_retries: int = 8) -> ThrottlingStatistics:
+    """
+    Run asynchronous AWS Textract jobs on all PDF files in an S3 bucket folder.
+
+    Multi-page PDFs are analyzed without converting them to images first. The results are saved as one JSON file per
+    page in the target folder (see TextractJobs). PDFs whose results already exist are not analyzed again.
+
+    :param target_folder: Folder of the result JSON files
+    :param s3_bucket_name: S3 bucket name
+    :param s3_folder: S3 bucket folder name, defaults to ''
+    :param aws_region_name: Optional AWS region name
+    :param aws_access_key_id: Optional AWS access key ID
+    :param aws_secret_access_key: Optional AWS secret access key
+    :param max_jobs: Maximum number of running Textract jobs, default is 100
+    :param poll_interval: Interval before the first poll of a job in seconds, doubled for each further poll, default is 1
+    :param max_poll_interval: Maximum interval between two polls of a job in seconds, default is 30
+    :param max_rate: Optional maximum number of Textract requests per second
+    :param max_retries: Maximum number of retries of a throttled Textract request, default is 8
+    :return: Number of requests, throttled requests, retries and failures
+    """
+    textract = AWSTextract(aws_region_name, aws_access_key_id, aws_secret_access_key, s3_bucket_name, s3_folder,
+                           Throttler(4, max_rate, max_retries), 4)
+    s3_file_names = sorted(s3_file_name for s3_file_name in textract.s3_keys()
+                           if s3_file_name.lower().endswith('.pdf'))
+
+    TextractJobs(textract, target_folder, max_jobs, poll_interval, max_poll_interval).run(s3_file_names)
+
+    __log_summary(textract)
+    return textract.throttler.statistics
+
+
+def __analyze_image(textract: AWSTextract, image_file_name: str, image: Image, encoding: ImageEncoding,
+                    save_images: bool):
+    from form_analyzer import form_analyzer_logger
+
+    if textract.is_analyzed(image_file_name):
+        form_analyzer_logger.log(logging.DEBUG, f'Skipping {image_file_name}')
+        return
+
+    textract.analyze_image(image_file_name, encode_image(image, encoding), save_images)
+
+
+def pdf_to_textract(folder_or_filename: str,
+                    dpi: int = 400,
+                    poppler_path: str = None,
+                    image_processor: typing.Optional[ImageProcessor] = None,
+                    page_window: int = 10,
+                    encoding: ImageEncoding = ImageEncoding(max_bytes=TEXTRACT_MAX_BYTES),
+                    save_images: bool = False,
+                    aws_region_name: str = None,
+                    aws_access_key_id: str = None,
+                    aws_secret_access_key: str = None,
+                    max_in_flight: int = 4,
+                    max_rate: typing.Optional[float] = None,
+                    max_retries: int = 8) -> ThrottlingStatistics:
+    """
+    Converts PDF files to images and runs AWS Textract on them without writing the images to disk.
+
+    This combines pdf_to_image and run_textract: each page is rendered, passed to the image processor, encoded in
+    memory and sent to Textract. The results are saved with the same names as with pdf_to_image and run_textract,
+    e.g. "form_0.png.json", so they can be analyzed as usual. Pages whose result JSON already exists are not analyzed
+    again.
+
+    :param folder_or_filename: The folder containing the PDF files or a PDF file name
+    :param dpi: DPI to use for image generation, default is 400
+    :param poppler_path: Path to a poppler installation, required for Windows
+    :param image_processor: Optional function that takes an image index and an image and returns a list of
+        ProcessedImage (see pdf_to_image)
+    :param page_window: Number of pages that are rendered and kept in memory at the same time, default is 10
+    :param encoding: Image encoding, default is PNG downscaled to fit the Textract limit
+    :param save_images: Also save the encoded images next to the PDF files, default is False
+    :param aws_region_name: Optional AWS region name
+    :param aws_access_key_id: Optional AWS access key ID
+    :param aws_secret_access_key: Optional AWS secret access key
+    :param max_in_flight: Maximum number of pages that are encoded and analyzed concurrently, default is 4
+    :param max_rate: Optional maximum number of Textract requests per second
+    :param max_retries: Maximum number of retries of a throttled Textract request, default is 8
+    :return: Number of requests, throttled requests, retries and failures
+    """
+    textract = AWSTextract(aws_region_name, aws_access_key_id, aws_secret_access_key,
+                           throttler=Throttler(max_in_flight, max_rate, max_retries), max_pool_connections=max_in_flight)
+    render_kwargs = {'image_processor': image_processor} if image_processor is not None else {}
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        futures = set()
+        for file_name in get_pdf_files(folder_or_filename):
+            for image_file_name, image in render_pdf(file_name, dpi, poppler_path, page_window=page_window,
+                                                     **render_kwargs):
+                # Wait for a page to finish before submitting more, so that only a few images are held in memory
+                if len(futures) >= max_in_flight:
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                futures.add(executor.submit(__analyze_image, textract, f'{image_file_name}{encoding.extension}', image,
+                                            encoding, save_images))
+
+        for future in as_completed(futures):
+            future.result()
+
+    __log_summary(textract)
+    return textract.throttler.statistics
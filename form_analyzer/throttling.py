@@ -0,0 +1,155 @@
+import random
+import threading
+import time
+import typing
+from dataclasses import dataclass
+
+from botocore.exceptions import ClientError
+
+THROTTLING_ERROR_CODES = {'ProvisionedThroughputExceededException', 'ThrottlingException', 'LimitExceededException'}
+
+Result = typing.TypeVar('Result')
+
+
+def is_throttling_error(error: Exception) -> bool:
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that limits the rate of requests.
+
+    :param rate: Tokens added per second
+    :param burst: Maximum number of tokens, default is 1
+    """
+    def __init__(self, rate: float, burst: int = 1):
+        self.__rate = rate
+        self.__burst = burst
+        self.__tokens = float(burst)
+        self.__last = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes a token, waits until one is available.
+        """
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(self.__burst, self.__tokens + (now - self.__last) * self.__rate)
+                self.__last = now
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                wait = (1 - self.__tokens) / self.__rate
+            time.sleep(wait)
+
+
+class AdaptiveConcurrency:
+    """
+    Thread-safe concurrency limit that adapts to throttling (additive increase, multiplicative decrease).
+
+    The limit grows by one per limit successful requests and is halved on each throttled request.
+
+    :param max_limit: Maximum number of concurrent requests
+    :param min_limit: Minimum number of concurrent requests, default is 1
+    """
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.__max_limit = max_limit
+        self.__min_limit = min_limit
+        self.__limit = float(max_limit)
+        self.__in_use = 0
+        self.__condition = threading.Condition()
+
+    @property
+    def limit(self) -> float:
+        return self.__limit
+
+    def acquire(self):
+        with self.__condition:
+            while self.__in_use >= int(self.__limit):
+                self.__condition.wait()
+            self.__in_use += 1
+
+    def release(self, throttled: bool):
+        with self.__condition:
+            self.__in_use -= 1
+            if throttled:
+                self.__limit = max(self.__min_limit, self.__limit / 2)
+            else:
+                self.__limit = min(self.__max_limit, self.__limit + 1 / self.__limit)
+            self.__condition.notify_all()
+
+
+@dataclass
+class ThrottlingStatistics:
+    requests: int = 0
+    throttles: int = 0
+    retries: int = 0
+    failures: int = 0
+
+    def __str__(self):
+        return f'{self.requests} requests, {self.throttles} throttled, {self.retries} retries, {self.failures} failed'
+
+
+class Throttler:
+    """
+    Runs requests with a rate limit, an adaptive concurrency limit and retries with jittered exponential backoff
+    when the request is throttled.
+
+    :param max_concurrency: Maximum number of concurrent requests
+    :param max_rate: Optional maximum number of requests per second
+    :param max_retries: Maximum number of retries of a throttled request, default is 8
+    :param base_delay: Delay before the first retry in seconds, doubled for each further retry, default is 0.5
+    :param max_delay: Maximum delay before a retry in seconds, default is 30
+    :param rng: Random number generator for the jitter
+    """
+    def __init__(self, max_concurrency: int, max_rate: typing.Optional[float] = None, max_retries: int = 8,
+                 base_delay: float = .5, max_delay: float = 30, rng: random.Random = None):
+        self.__concurrency = AdaptiveConcurrency(max_concurrency)
+        self.__token_bucket = TokenBucket(max_rate) if max_rate is not None else None
+        self.__max_retries = max_retries
+        self.__base_delay = base_delay
+        self.__max_delay = max_delay
+        self.__random = rng or random.Random()
+        self.__lock = threading.Lock()
+        self.statistics = ThrottlingStatistics()
+
+    def __count(self, **counters: int):
+        with self.__lock:
+            for counter, value in counters.items():
+                setattr(self.statistics, counter, getattr(self.statistics, counter) + value)
+
+    def __backoff(self, attempt: int) -> float:
+        # Full jitter: wait a random time up to the exponential delay
+        return self.__random.uniform(0, min(self.__max_delay, self.__base_delay * 2 ** attempt))
+
+    def call(self, request: typing.Callable[[], Result]) -> Result:
+        """
+        Runs a request, retrying it when it is throttled.
+
+        :param request: Function that sends the request
+        :return: Result of the request
+        """
+        for attempt in range(self.__max_retries + 1):
+            if self.__token_bucket is not None:
+                self.__token_bucket.acquire()
+            self.__concurrency.acquire()
+            throttled = False
+            try:
+                self.__count(requests=1)
+                return request()
+            except Exception as e:
+                if not is_throttling_error(e):
+                    self.__count(failures=1)
+                    raise
+                throttled = True
+                self.__count(throttles=1)
+                if attempt == self.__max_retries:
+                    self.__count(failures=1)
+                    raise
+            finally:
+                self.__concurrency.release(throttled)
+
+            self.__count(retries=1)
+            time.sleep(self.__backoff(attempt))
@@ -0,0 +1,267 @@
+import csv
+import json
+import os
+import typing
+from dataclasses import dataclass
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+
+TableLine = typing.List[typing.Union[str, int]]
+
+
+@dataclass
+class UncertainField:
+    col: int
+    page_file: str
+
+
+class ResultWriter:
+    """
+    Base class of the writers of the analysis results.
+
+    A writer receives the column headers once and then one table line per form. The first column of each table line
+    is the form name, which consists of the comma separated page files of the form.
+
+    :param file_name: Name of the result file
+    """
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+
+    def open(self, headers: typing.List[str]):
+        raise NotImplementedError
+
+    def write(self, table_line: TableLine, uncertain_fields: typing.List[UncertainField]):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def discard(self):
+        """
+        Releases the resources of an opened writer after a failure and removes the incomplete result file.
+        """
+        raise NotImplementedError
+
+
+class ExcelWriter(ResultWriter):
+    """
+    Writes the results to an Excel file.
+
+    The first column links to the image of the first page of a form and each uncertain field links to the image of
+    its page.
+
+    :param file_name: Name of the result file
+    :param write_only: Use openpyxl's write-only mode, so that rows are not kept in memory, default is False
+    :param link_pages: Link to the page images, disable it for pages without an image like the results of
+        run_textract_jobs, default is True
+    """
+    def __init__(self, file_name: str, write_only: bool = False, link_pages: bool = True):
+        super(ExcelWriter, self).__init__(file_name)
+        self.__write_only = write_only
+        self.__link_pages = link_pages
+        self.__wb = None
+        self.__sheet = None
+
+    def open(self, headers: typing.List[str]):
+        self.__wb = Workbook(write_only=self.__write_only)
+        if self.__write_only:
+            self.__sheet = self.__wb.create_sheet('Results')
+        else:
+            self.__sheet = self.__wb.active
+            self.__sheet.title = 'Results'
+        self.__sheet.freeze_panes = "A2"
+        self.__sheet.print_title_rows = '1:1'
+        self.__sheet.append(headers)
+
+    def __link(self, cell, page_file: str):
+        if self.__link_pages:
+            cell.hyperlink = page_file
+            cell.style = 'Hyperlink'
+
+    def __annotate_uncertain_fields(self, uncertain_fields: typing.List[UncertainField], row):
+        for uncertain in uncertain_fields:
+            uncertain_cell = row[uncertain.col]
+            try:
+                if len(uncertain_cell.value) == 0:
+                    uncertain_cell.value = '???'
+            except TypeError:
+                pass
+            self.__link(uncertain_cell, uncertain.page_file)
+
+    def write(self, table_line: TableLine, uncertain_fields: typing.List[UncertainField]):
+        if self.__write_only:
+            # Rows of write-only sheets cannot be accessed after appending, so the cells are styled beforehand
+            row = [WriteOnlyCell(self.__sheet, value) for value in table_line]
+        else:
+            self.__sheet.append(table_line)
+            row = self.__sheet[self.__sheet.max_row]
+
+        self.__annotate_uncertain_fields(uncertain_fields, row)
+
+        self.__link(row[0], row[0].value.split(',')[0])
+
+        if self.__write_only:
+            self.__sheet.append(row)
+
+    def close(self):
+        self.__wb.save(self.file_name)
+
+    def discard(self):
+        # The file is only written when saving, but write-only sheets buffer their rows in a temporary file, which is
+        # closed with the sheet and removed by its writer
+        if self.__write_only:
+            self.__sheet.close()
+            self.__sheet._writer.cleanup()
+
+
+class _TableWriter(ResultWriter):
+    """
+    Base class of writers for plain tables.
+
+    Instead of hyperlinks, two columns are added: "Source page" with the first page file of the form and
+    "Uncertain fields" with the uncertain columns and the page files where they were found.
+    """
+    def __init__(self, file_name: str):
+        super(_TableWriter, self).__init__(file_name)
+        self._headers: typing.List[str] = []
+
+    def open(self, headers: typing.List[str]):
+        self._headers = ['Form'] + headers[1:] + ['Source page', 'Uncertain fields']
+
+    def _uncertain_columns(self, uncertain_fields: typing.List[UncertainField]) -> typing.List[typing.Dict[str, str]]:
+        return [{'column': self._headers[uncertain.col], 'page': uncertain.page_file} for uncertain in uncertain_fields]
+
+    @staticmethod
+    def _source_page(table_line: TableLine) -> str:
+        return table_line[0].split(',')[0]
+
+
+class CSVWriter(_TableWriter):
+    """
+    Writes the results to a CSV file row by row.
+
+    The uncertain fields are given as "column: page" pairs separated by semicolons.
+    """
+    def __init__(self, file_name: str):
+        super(CSVWriter, self).__init__(file_name)
+        self.__file = None
+        self.__writer = None
+
+    def open(self, headers: typing.List[str]):
+        super(CSVWriter, self).open(headers)
+        self.__file = open(self.file_name, 'w', newline='', encoding='utf-8')
+        self.__writer = csv.writer(self.__file)
+        self.__writer.writerow(self._headers)
+
+    def write(self, table_line: TableLine, uncertain_fields: typing.List[UncertainField]):
+        uncertain = '; '.join(f'{column["column"]}: {column["page"]}' for column in self._uncertain_columns(uncertain_fields))
+        self.__writer.writerow(table_line + [self._source_page(table_line), uncertain])
+
+    def close(self):
+        self.__file.close()
+
+    def discard(self):
+        self.__file.close()
+        os.remove(self.file_name)
+
+
+def _unique_headers(headers: typing.List[str]) -> typing.List[str]:
+    unique_headers = []
+    for header in headers:
+        unique_header = header
+        count = 1
+        while unique_header in unique_headers:
+            count += 1
+            unique_header = f'{header} ({count})'
+        unique_headers.append(unique_header)
+
+    return unique_headers
+
+
+class JSONLinesWriter(_TableWriter):
+    """
+    Writes the results to a JSON lines file with one JSON object per form.
+
+    Column headers that occur several times are made unique by a number in brackets.
+    """
+    def __init__(self, file_name: str):
+        super(JSONLinesWriter, self).__init__(file_name)
+        self.__file = None
+
+    def open(self, headers: typing.List[str]):
+        super(JSONLinesWriter, self).open(headers)
+        self._headers = _unique_headers(self._headers)
+        self.__file = open(self.file_name, 'w', encoding='utf-8')
+
+    def write(self, table_line: TableLine, uncertain_fields: typing.List[UncertainField]):
+        row = table_line + [self._source_page(table_line), self._uncertain_columns(uncertain_fields)]
+        self.__file.write(json.dumps(dict(zip(self._headers, row)), ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.__file.close()
+
+    def discard(self):
+        self.__file.close()
+        os.remove(self.file_name)
+
+
+class ParquetWriter(_TableWriter):
+    """
+    Writes the results to a Parquet file, requires pyarrow.
+
+    All value columns are stored as strings. Rows are written in row groups of the given size.
+
+    :param file_name: Name of the result file
+    :param row_group_size: Number of rows per row group, default is 10000
+    """
+    def __init__(self, file_name: str, row_group_size: int = 10000):
+        super(ParquetWriter, self).__init__(file_name)
+        self.__row_group_size = row_group_size
+        self.__rows: typing.List[typing.List] = []
+        self.__schema = None
+        self.__writer = None
+
+    def open(self, headers: typing.List[str]):
+        import pyarrow
+        import pyarrow.parquet
+
+        super(ParquetWriter, self).open(headers)
+        self._headers = _unique_headers(self._headers)
+        uncertain_type = pyarrow.list_(pyarrow.struct([('column', pyarrow.string()), ('page', pyarrow.string())]))
+        self.__schema = pyarrow.schema([(header, pyarrow.string()) for header in self._headers[:-1]] +
+                                       [(self._headers[-1], uncertain_type)])
+        self.__writer = pyarrow.parquet.ParquetWriter(self.file_name, self.__schema)
+
+    def __flush(self):
+        import pyarrow
+
+        if self.__rows:
+            columns = list(zip(*self.__rows))
+            self.__writer.write_table(pyarrow.Table.from_arrays([pyarrow.array(column, type=field.type)
+                                                                 for column, field in zip(columns, self.__schema)],
+                                                                schema=self.__schema))
+            self.__rows = []
+
+    def write(self, table_line: TableLine, uncertain_fields: typing.List[UncertainField]):
+        self.__rows.append([str(value) for value in table_line] +
+                           [self._source_page(table_line), self._uncertain_columns(uncertain_fields)])
+        if len(self.__rows) >= self.__row_group_size:
+            self.__flush()
+
+    def close(self):
+        self.__flush()
+        self.__writer.close()
+
+    def discard(self):
+        self.__writer.close()
+        os.remove(self.file_name)
+
+
+# Result writer classes by output format, the format is also the file extension
+result_writers: typing.Dict[str, typing.Callable[[str], ResultWriter]] = {
+    'xlsx': ExcelWriter,
+    'csv': CSVWriter,
+    'jsonl': JSONLinesWriter,
+    'parquet': ParquetWriter
+}
@@ -28,17 +28,19 @@ setup(name='form-analyzer',
       keywords=['textract', 'AWS', 'form', 'questionnaire', 'xlsx', 'excel'],
       url='https://github.com/futsch1/form-analyzer',
       project_urls={'Documentation': 'http://form-analyzer.rtfd.io'},
-      packages=find_packages(exclude=['tests', 'example']),
+      packages=find_packages(exclude=['tests', 'example', 'benchmarks']),
       include_package_data=True,
       install_requires=[
           'boto3',
           'amazon-textract-caller',
-          'amazon-textract-response-parser',
           'pdf2image',
+          'Pillow>=9.1',
           'openpyxl'
       ],
       extras_require={
-          'dev': ['coverage'],
+          'dev': ['coverage', 'amazon-textract-response-parser'],
+          'trp': ['amazon-textract-response-parser'],
+          'parquet': ['pyarrow'],
           'doc': ['sphinx', 'myst-parser']
       },
       test_suite="tests",
@@ -0,0 +1,75 @@
+import json
+import logging
+import tempfile
+from unittest import TestCase, skipIf
+
+import form_analyzer
+from benchmarks.corpus import CorpusSpec, form_fields, generate_corpus, keywords_per_page
+from benchmarks.suite import run
+from form_analyzer import block_parser, form_parser
+from form_analyzer.analyze import FormToSheet
+
+try:
+    import trp
+except ImportError:
+    trp = None
+
+
+class TestBenchmarks(TestCase):
+    def setUp(self) -> None:
+        form_analyzer.form_analyzer_logger.setLevel(logging.ERROR)
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_corpus(self):
+        spec = CorpusSpec(forms=3, pages_per_form=2, fields_per_page=20, noise=0)
+        self.assertEqual(6, len(generate_corpus(self.temp_dir.name, spec)))
+
+        fields = form_fields(spec)
+        self.assertEqual(2 * 2 * 4, len(fields))
+        parsed_forms = list(form_parser.parse(self.temp_dir.name, form_parser.FormPages(2, keywords_per_page(spec))))
+        self.assertEqual(3, len(parsed_forms))
+        selected = set()
+        for parsed_form in parsed_forms:
+            table_line, _ = FormToSheet.get_table_line(fields, 'form', parsed_form)
+            self.assertIn(table_line[1], fields[0].selector.selections + [''])
+            selected.add(table_line[1])
+        self.assertGreater(len(selected - {''}), 0)
+
+    @skipIf(trp is None, 'Textract Response Parser not installed')
+    def test_corpus_trp(self):
+        spec = CorpusSpec(forms=2, pages_per_form=2, noise=.1)
+        file_names = generate_corpus(self.temp_dir.name, spec)
+        responses = []
+        for file_name in file_names[:2]:
+            with open(file_name) as f:
+                responses.append(json.load(f))
+
+        # The IDs are unique across the pages of a form
+        ids = [block['Id'] for response in responses for block in response['Blocks']]
+        self.assertEqual(len(ids), len(set(ids)))
+
+        pages = block_parser.parse_pages(responses)
+        doc = trp.Document(responses)
+        self.assertEqual(len(doc.pages), len(pages))
+        for trp_page, page in zip(doc.pages, pages):
+            self.assertEqual(len(trp_page.form.fields), len(page.fields))
+            self.assertGreater(len(page.fields), 0)
+            for trp_field, field in zip(trp_page.form.fields, page.fields):
+                self.assertEqual(trp_field.key.text, field.key.text)
+                self.assertEqual(trp_field.value.text if trp_field.value else None,
+                                 field.value.text if field.value else None)
+                self.assertEqual(trp_field.geometry.boundingBox.top, field.geometry.boundingBox.top)
+
+    def test_suite(self):
+        spec = CorpusSpec(forms=5)
+        generate_corpus(f'{self.temp_dir.name}/corpus', spec)
+        results = run(f'{self.temp_dir.name}/corpus', spec, self.temp_dir.name)
+        self.assertEqual(['parse'] + (['parse (trp)'] if trp is not None else []) +
+                         ['filter', 'single select', 'multi select', 'text field', 'write workbook'],
+                         [result.name for result in results])
+        self.assertEqual(5, results[0].items)
+        for result in results:
+            self.assertGreater(result.peak_bytes, 0)
@@ -0,0 +1,142 @@
+import io
+import json
+import logging
+import os
+import random
+import tempfile
+from unittest import TestCase, mock
+
+from PIL import Image
+
+import form_analyzer
+from form_analyzer import ImageEncoding, ProcessedImage
+from form_analyzer.conversion import encode_image
+from form_analyzer.textract import AWSTextract
+
+
+def fake_pdfinfo_from_path(file_name, poppler_path=None):
+    with open(file_name) as f:
+        return {'Pages': int(f.read())}
+
+
+def fake_convert_from_path(file_name, dpi, poppler_path=None, thread_count=1, first_page=None, last_page=None):
+    pages = fake_pdfinfo_from_path(file_name)['Pages']
+    first_page = first_page or 1
+    last_page = min(last_page or pages, pages)
+    return [Image.new('L', (20, 10), page) for page in range(first_page, last_page + 1)]
+
+
+def split_image(image_index, image):
+    return [ProcessedImage(image.crop((0, 0, 10, 10)), '_a'), None, ProcessedImage(image.crop((10, 0, 20, 10)), '_b')]
+
+
+class TestConversion(TestCase):
+    def setUp(self) -> None:
+        form_analyzer.form_analyzer_logger.setLevel(logging.ERROR)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        for i, pages in enumerate([3, 12, 1, 5]):
+            with open(f'{self.temp_dir.name}/form_{i}.pdf', 'w') as f:
+                f.write(str(pages))
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def __converted_images(self):
+        images = {}
+        for file_name in sorted(os.listdir(self.temp_dir.name)):
+            if file_name.endswith(('.png', '.jpg')):
+                with Image.open(f'{self.temp_dir.name}/{file_name}') as image:
+                    images[file_name] = (image.size, image.getpixel((0, 0)))
+        return images
+
+    def __convert(self, convert_from_path=fake_convert_from_path, **kwargs):
+        with mock.patch('form_analyzer.conversion.pdf2image.convert_from_path', convert_from_path), \
+                mock.patch('form_analyzer.conversion.pdf2image.pdfinfo_from_path', fake_pdfinfo_from_path):
+            form_analyzer.pdf_to_image(self.temp_dir.name, image_processor=split_image, **kwargs)
+        return self.__converted_images()
+
+    def __remove_images(self, images):
+        for file_name in images:
+            os.remove(f'{self.temp_dir.name}/{file_name}')
+
+    def test_pdf_to_image_workers(self):
+        serial_images = self.__convert()
+        self.assertEqual(2 * (3 + 12 + 1 + 5), len(serial_images))
+        self.assertEqual(((10, 10), 12), serial_images['form_1_11_b.png'])
+
+        self.__remove_images(serial_images)
+        self.assertEqual(serial_images, self.__convert(workers=3, thread_count=2))
+
+    def test_pdf_to_image_page_window(self):
+        window_images = self.__convert(page_window=1000)
+        self.__remove_images(window_images)
+
+        convert_from_path = mock.Mock(side_effect=fake_convert_from_path)
+        self.assertEqual(window_images, self.__convert(convert_from_path, page_window=4))
+        windows = [(call.args[0], call.kwargs['first_page'], call.kwargs['last_page'])
+                   for call in convert_from_path.call_args_list]
+        form_1 = f'{self.temp_dir.name}/form_1.pdf'
+        self.assertEqual([(form_1, 1, 4), (form_1, 5, 8), (form_1, 9, 12)], [window for window in windows
+                                                                              if window[0] == form_1])
+        self.assertEqual(1 + 3 + 1 + 2, len(windows))
+
+    def test_pdf_to_image_encoding(self):
+        images = self.__convert(encoding=ImageEncoding('jpeg', quality=90, mode='L'))
+        self.assertEqual(2 * (3 + 12 + 1 + 5), len(images))
+        self.assertIn('form_1_11_b.jpg', images)
+        self.assertEqual((10, 10), images['form_1_11_b.jpg'][0])
+
+    def test_encode_image(self):
+        rng = random.Random(0)
+        image = Image.new('RGB', (400, 300), 'white')
+        image.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(200 * 300)] +
+                      [(255, 255, 255)] * (200 * 300))
+
+        png = encode_image(image)
+        self.assertLess(len(encode_image(image, ImageEncoding(compress_level=9))),
+                        len(encode_image(image, ImageEncoding(compress_level=0))))
+
+        with Image.open(io.BytesIO(encode_image(image, ImageEncoding(mode='1')))) as bilevel:
+            self.assertEqual('1', bilevel.mode)
+            self.assertLessEqual({color for _, color in bilevel.getcolors()}, {0, 255})
+        with Image.open(io.BytesIO(encode_image(image, ImageEncoding('jpeg', quality=50)))) as jpeg:
+            self.assertEqual(('JPEG', (400, 300)), (jpeg.format, jpeg.size))
+
+        fitted = encode_image(image, ImageEncoding(max_bytes=len(png) // 4))
+        self.assertLessEqual(len(fitted), len(png) // 4)
+        with Image.open(io.BytesIO(fitted)) as fitted_image:
+            self.assertEqual('PNG', fitted_image.format)
+            self.assertLess(fitted_image.width, 400)
+            self.assertAlmostEqual(4 / 3, fitted_image.width / fitted_image.height, delta=.05)
+
+        with self.assertRaises(ValueError):
+            encode_image(image, ImageEncoding('gif'))
+        with self.assertRaises(ValueError):
+            encode_image(image, ImageEncoding(max_bytes=10))
+
+    def test_pdf_to_textract(self):
+        documents = []
+
+        def analyze_document(_, document):
+            with Image.open(io.BytesIO(document['Bytes'])) as image:
+                documents.append(image.format)
+                return {'Blocks': [], 'Pixel': image.getpixel((0, 0))}
+
+        with open(f'{self.temp_dir.name}/form_0_0_a.png.json', 'w') as f:
+            f.write('{}')
+
+        with mock.patch('form_analyzer.conversion.pdf2image.convert_from_path', fake_convert_from_path), \
+                mock.patch('form_analyzer.conversion.pdf2image.pdfinfo_from_path', fake_pdfinfo_from_path), \
+                mock.patch.object(AWSTextract, 'analyze_document', analyze_document):
+            form_analyzer.pdf_to_textract(self.temp_dir.name, image_processor=split_image, page_window=2)
+            self.assertEqual({}, self.__converted_images())
+            form_analyzer.pdf_to_textract(f'{self.temp_dir.name}/form_2.pdf', encoding=ImageEncoding('jpeg'),
+                                          save_images=True)
+
+        self.assertEqual(['PNG'] * (2 * (3 + 12 + 1 + 5) - 1) + ['JPEG'], documents)
+        self.assertEqual(['form_2_0.jpg'], list(self.__converted_images()))
+        self.assertTrue(os.path.exists(f'{self.temp_dir.name}/form_2_0.jpg.json'))
+        with open(f'{self.temp_dir.name}/form_1_11_b.png.json') as f:
+            self.assertEqual(12, json.load(f)['Pixel'])
+        with open(f'{self.temp_dir.name}/form_0_0_a.png.json') as f:
+            self.assertEqual({}, json.load(f))
@@ -1,23 +1,58 @@
+import concurrent.futures
+import csv
+import difflib
+import glob
+import json
 import logging
-from unittest import TestCase
+import os
+import random
+import shutil
+import sys
+import tempfile
+import types
+from unittest import TestCase, skipIf, mock
+
+from openpyxl import load_workbook
 
 import example.example_form
 import form_analyzer
+from benchmarks.corpus import CorpusSpec, form_fields, generate_corpus, keywords_per_page
+from form_analyzer import block_parser, instrumentation, form_parser, memo
+from form_analyzer.filters import And, Page, Pages, Location, Selected
+from form_analyzer.selectors.base import SimpleField
+from form_analyzer.selectors.matching import FieldMatcher
+
+try:
+    import trp
+except ImportError:
+    trp = None
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 
 
 class TestFormAnalyzer(TestCase):
     def setUp(self) -> None:
         form_analyzer.form_analyzer_logger.setLevel(logging.ERROR)
+        # The results are written next to the analyzed folder, so the example results are analyzed in a copy
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.results_folder = f'{self.temp_dir.name}/results'
+        shutil.copytree('example/results', self.results_folder)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
 
     def test_analyze_fail(self):
         with self.assertRaises(FileNotFoundError):
             form_analyzer.analyze('folder_does_not_exist', 'example.example_form')
 
         with self.assertRaises(ModuleNotFoundError):
-            form_analyzer.analyze('example/results', 'module_not_there')
+            form_analyzer.analyze(self.results_folder, 'module_not_there')
 
         with self.assertRaises(form_analyzer.FormDescriptionError):
-            form_analyzer.analyze('example/results', 'example.example')
+            form_analyzer.analyze(self.results_folder, 'example.example')
 
     def test_keywords(self):
         for i in range(len(example.example_form.keywords_per_page)):
@@ -25,17 +60,313 @@ class TestFormAnalyzer(TestCase):
             example.example_form.keywords_per_page[i] = ['some weird text']
 
             with self.assertRaises(AssertionError):
-                form_analyzer.analyze('example/results', 'example.example_form')
+                form_analyzer.analyze(self.results_folder, 'example.example_form')
 
             example.example_form.keywords_per_page[i] = keywords
 
         del example.example_form.keywords_per_page
         with self.assertRaises(form_analyzer.FormDescriptionError):
-            form_analyzer.analyze('example/results', 'example.example_form')
+            form_analyzer.analyze(self.results_folder, 'example.example_form')
 
     def test_dump_fields(self):
-        form_analyzer.dump_fields('example/results', 'example.example_form')
-        form_analyzer.dump_fields('example/results', None)
+        form_analyzer.dump_fields(self.results_folder, 'example.example_form')
+        form_analyzer.dump_fields(self.results_folder, None)
 
     def test_example(self):
-        form_analyzer.analyze('example/results', 'example.example_form')
\ No newline at end of file
+        form_analyzer.analyze(self.results_folder, 'example.example_form')
+
+    def test_example_workers(self):
+        form_analyzer.analyze(self.results_folder, 'example.example_form', 'results_serial')
+        form_analyzer.analyze(self.results_folder, 'example.example_form', 'results_workers', workers=2)
+
+        serial = load_workbook(f'{self.temp_dir.name}/results_serial.xlsx').active
+        parallel = load_workbook(f'{self.temp_dir.name}/results_workers.xlsx').active
+        self.assertEqual([[(cell.value, cell.hyperlink.target if cell.hyperlink else None) for cell in row] for row in serial.rows],
+                         [[(cell.value, cell.hyperlink.target if cell.hyperlink else None) for cell in row] for row in parallel.rows])
+
+    def test_dump_fields_workers(self):
+        form_analyzer.dump_fields(self.results_folder, 'example.example_form', workers=2)
+
+    @skipIf(trp is None, 'Textract Response Parser not installed')
+    def test_block_parser(self):
+        responses = []
+        for file_name in sorted(glob.glob('example/results/*.json')):
+            with open(file_name) as f:
+                responses.append(json.load(f))
+
+        pages = block_parser.parse_pages(responses)
+        doc = trp.Document(responses)
+        self.assertEqual(len(doc.pages), len(pages))
+
+        for trp_page, page in zip(doc.pages, pages):
+            self.assertEqual([block['Text'] for block in trp_page.blocks if 'Text' in block], page.texts)
+            self.assertEqual(len(trp_page.form.fields), len(page.fields))
+            for trp_field, field in zip(trp_page.form.fields, page.fields):
+                self.assertEqual(trp_field.key.text, field.key.text)
+                self.assertEqual(trp_field.value.text if trp_field.value else None, field.value.text if field.value else None)
+                self.assertEqual(trp_field.confidence, field.confidence)
+                self.assertEqual(trp_field.geometry.boundingBox.left, field.geometry.boundingBox.left)
+                self.assertEqual(trp_field.geometry.boundingBox.top, field.geometry.boundingBox.top)
+
+    def test_block_parser_field_without_key(self):
+        geometry = {'BoundingBox': {'Width': .1, 'Height': .1, 'Left': .1, 'Top': .1}, 'Polygon': []}
+        response = {'Blocks': [
+            {'BlockType': 'PAGE', 'Id': 'page', 'Geometry': geometry,
+             'Relationships': [{'Type': 'CHILD', 'Ids': ['key', 'value', 'word']}]},
+            {'BlockType': 'KEY_VALUE_SET', 'Id': 'key', 'EntityTypes': ['KEY'], 'Confidence': 90., 'Geometry': geometry,
+             'Relationships': [{'Type': 'VALUE', 'Ids': ['value']}]},
+            {'BlockType': 'KEY_VALUE_SET', 'Id': 'value', 'EntityTypes': ['VALUE'], 'Confidence': 90., 'Geometry': geometry,
+             'Relationships': [{'Type': 'CHILD', 'Ids': ['word']}]},
+            {'BlockType': 'WORD', 'Id': 'word', 'Text': 'value', 'Confidence': 90., 'Geometry': geometry}
+        ]}
+
+        # A key without a CHILD relationship has no content, the field is skipped like in the Textract Response Parser
+        self.assertEqual([], block_parser.parse_pages([response])[0].fields)
+        if trp is not None:
+            self.assertEqual([], trp.Document(response).pages[0].form.fields)
+
+    def test_example_cache(self):
+        form_analyzer.analyze(self.results_folder, 'example.example_form', 'results_serial')
+        form_analyzer.analyze(self.results_folder, 'example.example_form', 'results_cache_write', use_cache=True)
+        self.assertEqual(2, len(glob.glob(f'{self.results_folder}/*.json.cache')))
+        form_analyzer.analyze(self.results_folder, 'example.example_form', 'results_cache_read', use_cache=True)
+
+        serial = load_workbook(f'{self.temp_dir.name}/results_serial.xlsx').active
+        for file_name in ['results_cache_write.xlsx', 'results_cache_read.xlsx']:
+            cached = load_workbook(f'{self.temp_dir.name}/{file_name}').active
+            self.assertEqual([[cell.value for cell in row] for row in serial.rows],
+                             [[cell.value for cell in row] for row in cached.rows])
+
+    def test_page_filters(self):
+        parsed_form = next(form_parser.parse('example/results', form_parser.FormPages(0, [])))
+        plain_fields = list(parsed_form.fields)
+        self.assertEqual(plain_fields, [field for page in sorted(parsed_form.fields_by_page)
+                                        for field in parsed_form.fields_by_page[page]])
+
+        for filter_ in [Page(0), Page(1), Page(2), Pages([1, 0]), Page(1) | Page(0), Page(0) & Location(vertical=(.2, .4))]:
+            self.assertEqual(filter_.filter(plain_fields), filter_.filter(parsed_form.fields))
+
+    def test_location_filters(self):
+        parsed_form = next(form_parser.parse('example/results', form_parser.FormPages(0, [])))
+        plain_fields = list(parsed_form.fields)
+        tops = [field.field.geometry.boundingBox.top for field in plain_fields]
+
+        for filter_ in [Location(), Location(vertical=(.2, .4)), Location(horizontal=(.0, .5)),
+                        Location(horizontal=(.1, .6), vertical=(.3, 1)), Location(vertical=(tops[0], tops[1])),
+                        Location(vertical=(min(tops), max(tops))), Location(vertical=(.5, .4)),
+                        Page(1) & Location(vertical=(.0, .5)) & Location(horizontal=(.0, .5))]:
+            self.assertEqual(filter_.filter(plain_fields), filter_.filter(parsed_form.fields))
+
+    def test_filter_combination(self):
+        parsed_form = next(form_parser.parse('example/results', form_parser.FormPages(0, [])))
+        plain_fields = list(parsed_form.fields)
+
+        page = Page(0)
+        top = page & Location(vertical=(.0, .5))
+        selected = page & Selected()
+        self.assertEqual(Page(0).filter(plain_fields), page.filter(plain_fields))
+        self.assertEqual([field for field in plain_fields if field.page == 0 and field.field.geometry.boundingBox.top < .5],
+                         top.filter(plain_fields))
+        self.assertEqual(Page(0).filter(Selected().filter(plain_fields)), selected.filter(plain_fields))
+
+        either = top | Page(1) & Selected()
+        self.assertEqual(top.filter(plain_fields) + Selected().filter(Page(1).filter(plain_fields)), either.filter(plain_fields))
+        self.assertEqual(either.filter(plain_fields), either.filter(parsed_form.fields))
+
+    def test_filter_compile(self):
+        parsed_form = next(form_parser.parse('example/results', form_parser.FormPages(0, [])))
+
+        compiled_filters = {}
+        first = (Page(0) & Location(vertical=(.2, .4))).compile(compiled_filters)
+        second = (Pages([0]) & Location(vertical=[.2, .4])).compile(compiled_filters)
+        third = (Page(0) & (Location(vertical=(.2, .4)) & Selected())).compile(compiled_filters)
+        self.assertIs(first, (Page(0) & Location(vertical=(.2, .4))).compile(compiled_filters))
+        # Page is a shorthand of Pages, so both select the same fields and are compiled to one filter
+        self.assertIs(first, second)
+        self.assertEqual(3, len(third.filters))
+        self.assertIs(first.filters[0], third.filters[0])
+        self.assertIs(first.filters[1], third.filters[1])
+
+        self.assertIs(first.filter(parsed_form.fields), first.filter(parsed_form.fields))
+        self.assertEqual(first.filter(list(parsed_form.fields)), first.filter(parsed_form.fields))
+
+        with self.assertRaises(ValueError):
+            And()
+
+    def test_field_matcher(self):
+        def simple_field(key: str) -> SimpleField:
+            bounding_box = block_parser.BoundingBox(0, 0, 0, 0)
+            return SimpleField(form_parser.FieldWithPage(0, block_parser.Field(block_parser.FieldText(key), None, 99,
+                                                                               block_parser.Geometry(bounding_box))))
+
+        def brute_force(selection, fields):
+            best, max_ratio = None, 0.9
+            for field in fields:
+                ratio = difflib.SequenceMatcher(a=selection, b=field.key).ratio()
+                if ratio > max_ratio:
+                    best, max_ratio = field, ratio
+            return best
+
+        rng = random.Random(0)
+        words = ['option', 'green', 'red', 'yellow', 'eitherthisway', 'orthatway', '']
+        for _ in range(200):
+            keys = [rng.choice(words) for _ in range(rng.randint(0, 8))]
+            keys = [''.join(c for c in key if rng.random() > .1) + rng.choice(['', 'l', '1', 'o']) for key in keys]
+            fields = [simple_field(key) for key in keys]
+            field_matcher = FieldMatcher(fields)
+            for selection in words:
+                self.assertIs(brute_force(selection, fields), field_matcher.most_similar(selection, 0.9))
+                self.assertIs(next((field for field in fields if field.key == selection), None),
+                              field_matcher.exact_match(selection))
+
+    def test_lru_cache(self):
+        cache = memo.LRUCache(2)
+        self.assertEqual(1, cache.get('a', lambda: 1))
+        self.assertEqual(2, cache.get('b', lambda: 2))
+        self.assertEqual(1, cache.get('a', lambda: -1))
+        self.assertEqual(3, cache.get('c', lambda: 3))
+        self.assertEqual(-2, cache.get('b', lambda: -2))
+        self.assertEqual(memo.CacheInfo(1, 4, 2, 2, 2), cache.info())
+
+        # A disabled cache returns the computed value without storing it
+        cache.maxsize = 0
+        self.assertEqual(4, cache.get('a', lambda: 4))
+        self.assertEqual(memo.CacheInfo(1, 4, 4, 0, 0), cache.info())
+
+        cache.clear()
+        self.assertEqual(memo.CacheInfo(0, 0, 0, 0, 0), cache.info())
+
+    def test_lru_cache_threads(self):
+        cache = memo.LRUCache(10)
+        keys = [random.Random(seed).randrange(20) for seed in range(2000)]
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            values = list(executor.map(lambda key: cache.get(key, lambda: key * 2), keys))
+        self.assertEqual([key * 2 for key in keys], values)
+        self.assertLessEqual(cache.info().size, 10)
+
+    def test_example_streaming(self):
+        form_analyzer.analyze(self.results_folder, 'example.example_form', 'results_serial')
+        form_analyzer.analyze(self.results_folder, 'example.example_form', 'results_streaming', streaming=True)
+
+        serial = load_workbook(f'{self.temp_dir.name}/results_serial.xlsx').active
+        streaming = load_workbook(f'{self.temp_dir.name}/results_streaming.xlsx').active
+        self.assertEqual([[(cell.value, cell.hyperlink.target if cell.hyperlink else None, cell.style) for cell in row] for row in serial.rows],
+                         [[(cell.value, cell.hyperlink.target if cell.hyperlink else None, cell.style) for cell in row] for row in streaming.rows])
+        self.assertEqual(serial.freeze_panes, streaming.freeze_panes)
+        self.assertEqual(serial.print_title_rows, streaming.print_title_rows)
+
+    def __expected_table(self):
+        form_analyzer.analyze(self.results_folder, 'example.example_form', 'results_serial')
+        serial = list(load_workbook(f'{self.temp_dir.name}/results_serial.xlsx').active.rows)
+        headers = ['Form'] + [cell.value for cell in serial[0][1:]] + ['Source page', 'Uncertain fields']
+        # Empty uncertain cells are marked with ??? in the Excel file only
+        rows = [[cell.value if cell.value not in [None, '???'] else '' for cell in row] +
+                [row[0].hyperlink.target,
+                 [{'column': headers[cell.col_idx - 1], 'page': cell.hyperlink.target} for cell in row[1:] if cell.hyperlink]]
+                for row in serial[1:]]
+        return headers, rows
+
+    def test_example_csv(self):
+        headers, rows = self.__expected_table()
+        form_analyzer.analyze(self.results_folder, 'example.example_form', 'results', output_format='csv')
+
+        with open(f'{self.temp_dir.name}/results.csv', newline='') as f:
+            lines = list(csv.reader(f))
+        self.assertEqual(headers, lines[0])
+        self.assertEqual([[str(value) for value in row[:-1]] +
+                          ['; '.join(f'{uncertain["column"]}: {uncertain["page"]}' for uncertain in row[-1])] for row in rows],
+                         lines[1:])
+
+    def test_example_jsonl(self):
+        headers, rows = self.__expected_table()
+        form_analyzer.analyze(self.results_folder, 'example.example_form', 'results', output_format='jsonl')
+
+        with open(f'{self.temp_dir.name}/results.jsonl') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([dict(zip(headers, row)) for row in rows], lines)
+
+    @skipIf(pyarrow is None, 'pyarrow not installed')
+    def test_example_parquet(self):
+        _, rows = self.__expected_table()
+        form_analyzer.analyze(self.results_folder, 'example.example_form', 'results', output_format='parquet')
+
+        table = pyarrow.parquet.read_table(f'{self.temp_dir.name}/results.parquet')
+        self.assertEqual([[str(value) for value in row[:-1]] + [row[-1]] for row in rows],
+                         [list(row.values()) for row in table.to_pylist()])
+
+    def test_example_profile(self):
+        memo.similarity_cache.clear()
+        form_analyzer.analyze(self.results_folder, 'example.example_form', 'results_serial',
+                              profile_file=f'{self.temp_dir.name}/profile.json')
+        self.assertIsNone(instrumentation.active())
+        with open(f'{self.temp_dir.name}/profile.json') as f:
+            report = json.load(f)
+
+        self.assertEqual({'parse form', 'analyze form', 'load JSON', 'parse blocks', 'write row', 'save results'},
+                         set(report['stages']))
+        self.assertEqual(1, report['stages']['analyze form']['calls'])
+        self.assertEqual(2, report['stages']['load JSON']['calls'])
+        self.assertEqual([form_field.title for form_field in example.example_form.form_fields],
+                         list(report['form_fields']))
+        self.assertGreater(report['counters']['filter evaluations'], 0)
+        self.assertGreater(report['counters']['fields filtered'], 0)
+        self.assertIn('similarity computations', report['counters'])
+        self.assertIn('simple_str', report['caches'])
+
+        form_analyzer.dump_fields(self.results_folder, 'example.example_form', self.temp_dir.name,
+                                  profile_file=f'{self.temp_dir.name}/dump_profile.json')
+        with open(f'{self.temp_dir.name}/dump_profile.json') as f:
+            self.assertEqual(1, json.load(f)['stages']['dump fields']['calls'])
+
+    def test_threads(self):
+        spec = CorpusSpec(forms=40, noise=.05)
+        form = types.ModuleType('synthetic_form')
+        form.keywords_per_page = keywords_per_page(spec)
+        form.form_fields = form_fields(spec)
+        corpus_folder = f'{self.temp_dir.name}/corpus'
+        generate_corpus(corpus_folder, spec)
+
+        with mock.patch.dict(sys.modules, synthetic_form=form):
+            form_analyzer.analyze(corpus_folder, 'synthetic_form', 'serial', output_format='csv')
+            with open(f'{self.temp_dir.name}/serial.csv') as f:
+                serial = f.read()
+
+            # Switch threads often, so that the forms are analyzed interleaved by the shared selectors
+            self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+            sys.setswitchinterval(1e-6)
+            for _ in range(3):
+                memo.similarity_cache.clear()
+                form_analyzer.analyze(corpus_folder, 'synthetic_form', 'threads', workers=8, output_format='csv',
+                                      use_threads=True)
+                with open(f'{self.temp_dir.name}/threads.csv') as f:
+                    self.assertEqual(serial, f.read())
+
+    def test_example_failure(self):
+        from openpyxl.worksheet import _writer
+
+        for output_format in ['xlsx', 'csv', 'jsonl'] + (['parquet'] if pyarrow is not None else []):
+            with mock.patch.object(form_parser, 'parse_form', side_effect=RuntimeError), \
+                    self.assertRaises(RuntimeError):
+                form_analyzer.analyze(self.results_folder, 'example.example_form', streaming=True,
+                                      output_format=output_format)
+            self.assertFalse(os.path.exists(f'{self.temp_dir.name}/results.{output_format}'))
+        self.assertEqual([], _writer.ALL_TEMP_FILES)
+
+    def test_unknown_output_format(self):
+        with self.assertRaises(ValueError):
+            form_analyzer.analyze(self.results_folder, 'example.example_form', output_format='ods')
+
+    def test_example_incremental(self):
+        form_analyzer.analyze(self.results_folder, 'example.example_form', incremental=True)
+        self.assertTrue(os.path.exists(f'{self.temp_dir.name}/results.xlsx.manifest'))
+        expected = [[cell.value for cell in row] for row in load_workbook(f'{self.temp_dir.name}/results.xlsx').active.rows]
+
+        with mock.patch.object(form_parser, 'parse_form', side_effect=AssertionError):
+            form_analyzer.analyze(self.results_folder, 'example.example_form', incremental=True)
+        self.assertEqual(expected, [[cell.value for cell in row] for row in load_workbook(f'{self.temp_dir.name}/results.xlsx').active.rows])
+
+        os.utime(f'{self.results_folder}/form_filled_2.png.json', ns=(0, 0))
+        with mock.patch.object(form_parser, 'parse_form', wraps=form_parser.parse_form) as parse_form:
+            form_analyzer.analyze(self.results_folder, 'example.example_form', incremental=True)
+            self.assertEqual(1, parse_form.call_count)
+        self.assertEqual(expected, [[cell.value for cell in row] for row in load_workbook(f'{self.temp_dir.name}/results.xlsx').active.rows])
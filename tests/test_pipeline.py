@@ -0,0 +1,114 @@
+import importlib
+import io
+import json
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import time
+from unittest import TestCase, mock
+
+from openpyxl import load_workbook
+from PIL import Image
+
+import example.example_form
+import form_analyzer
+from form_analyzer.pipeline import _FormGroupTracker
+from form_analyzer.textract import AWSTextract
+from tests.test_conversion import fake_convert_from_path, fake_pdfinfo_from_path
+
+
+def fake_pixel(document):
+    with Image.open(io.BytesIO(document['Bytes'])) as image:
+        return image.getpixel((0, 0))
+
+
+def fake_analyze_document(_, document):
+    # Page 1 or 2 of the example form by the pixel value, which is the page number in the PDF
+    time.sleep(.01)
+    with open(f'example/results/form_filled_{2 - fake_pixel(document) % 2}.png.json') as f:
+        return json.load(f)
+
+
+class TestPipeline(TestCase):
+    def setUp(self) -> None:
+        form_analyzer.form_analyzer_logger.setLevel(logging.ERROR)
+        # Other tests modify the form description
+        importlib.reload(example.example_form)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.scan_folder = f'{self.temp_dir.name}/scans'
+        os.makedirs(self.scan_folder)
+        # The result files of scan_10 are sorted before those of scan_1, the pages 10 and 11 before page 2
+        for name, pages in [('scan_1', 2), ('scan_10', 12), ('scan_2', 2), ('scan_3', 4)]:
+            with open(f'{self.scan_folder}/{name}.pdf', 'w') as f:
+                f.write(str(pages))
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def __run_pipeline(self, **kwargs):
+        with mock.patch('form_analyzer.conversion.pdf2image.convert_from_path', fake_convert_from_path), \
+                mock.patch('form_analyzer.conversion.pdf2image.pdfinfo_from_path', fake_pdfinfo_from_path), \
+                mock.patch.object(AWSTextract, 'analyze_document', fake_analyze_document):
+            form_analyzer.run_pipeline(self.scan_folder, 'example.example_form', **kwargs)
+
+    def test_pipeline(self):
+        self.__run_pipeline(excel_file_name='pipeline', textract_workers=3, convert_workers=2, queue_size=2,
+                            save_images=True)
+        self.assertEqual(20, len([file_name for file_name in os.listdir(self.scan_folder)
+                                  if file_name.endswith('.png')]))
+
+        # Same results as the separate steps on the saved Textract results
+        batch_folder = f'{self.temp_dir.name}/batch'
+        os.makedirs(batch_folder)
+        for file_name in os.listdir(self.scan_folder):
+            if file_name.endswith('.json'):
+                shutil.copy(f'{self.scan_folder}/{file_name}', batch_folder)
+        form_analyzer.analyze(batch_folder, 'example.example_form', 'batch')
+
+        pipeline_rows = list(load_workbook(f'{self.temp_dir.name}/pipeline.xlsx').active.values)
+        batch_rows = list(load_workbook(f'{self.temp_dir.name}/batch.xlsx').active.values)
+        self.assertEqual(1 + 10, len(pipeline_rows))
+        self.assertEqual(batch_rows, pipeline_rows)
+
+        self.__run_pipeline(excel_file_name='pipeline_workers', analyze_workers=2, output_format='csv')
+        with open(f'{self.temp_dir.name}/pipeline_workers.csv') as f:
+            self.assertEqual(11, len(f.readlines()))
+
+    def test_pipeline_error(self):
+        def analyze_document(textract, document):
+            raise RuntimeError('Textract failed')
+
+        with mock.patch('form_analyzer.conversion.pdf2image.convert_from_path', fake_convert_from_path), \
+                mock.patch('form_analyzer.conversion.pdf2image.pdfinfo_from_path', fake_pdfinfo_from_path), \
+                mock.patch.object(AWSTextract, 'analyze_document', analyze_document):
+            with self.assertRaises(RuntimeError):
+                form_analyzer.run_pipeline(self.scan_folder, 'example.example_form', queue_size=1)
+        self.assertFalse(os.path.exists(f'{self.temp_dir.name}/results.xlsx'))
+
+    def test_pipeline_no_keywords(self):
+        with mock.patch.object(example.example_form, 'keywords_per_page', []):
+            with self.assertRaises(form_analyzer.FormDescriptionError):
+                form_analyzer.run_pipeline(self.scan_folder, 'example.example_form')
+
+    def test_form_group_tracker(self):
+        ready_groups = queue.Queue()
+        tracker = _FormGroupTracker(['a.pdf', 'b.pdf', 'c.pdf'], 2, ready_groups)
+        tracker.add_pdf(1, ['b_0.json', 'b_1.json', 'b_2.json'])
+        for file_name in ['b_0.json', 'b_1.json', 'b_2.json']:
+            tracker.page_analyzed(file_name)
+        # The pages of a.pdf are sorted before those of b.pdf
+        self.assertTrue(ready_groups.empty())
+
+        tracker.add_pdf(0, ['a_0.json'])
+        tracker.page_analyzed('a_0.json')
+        self.assertEqual(['a_0.json', 'b_0.json'], ready_groups.get_nowait())
+        self.assertEqual(['b_1.json', 'b_2.json'], ready_groups.get_nowait())
+        self.assertTrue(ready_groups.empty())
+
+        tracker.add_pdf(2, ['c_0.json'])
+        tracker.page_analyzed('c_0.json')
+        self.assertEqual(['c_0.json'], ready_groups.get_nowait())
+        self.assertIsNone(ready_groups.get_nowait())
+
@@ -0,0 +1,358 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase, mock
+
+from botocore.exceptions import ClientError
+from openpyxl import load_workbook
+
+import form_analyzer
+from form_analyzer.form_parser import FormPages, get_form_file_groups, parse_form
+from form_analyzer.response_cache import ResponseCache
+from form_analyzer.textract import AWSTextract
+from form_analyzer.throttling import AdaptiveConcurrency, Throttler, TokenBucket
+from form_analyzer.writers import ExcelWriter, UncertainField
+
+
+class FakeTextract:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.documents = []
+
+    def analyze_document(self, _, document):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.documents.append(document['Bytes'])
+        time.sleep(.01)
+        with self.lock:
+            self.in_flight -= 1
+        return {'Blocks': [], 'Document': document['Bytes'].decode()}
+
+
+class ThrottlingTextractClient:
+    """
+    Stand-in for the boto3 Textract client that throttles every first request of a document.
+    """
+    def __init__(self, error_code: str = 'ProvisionedThroughputExceededException'):
+        self.error_code = error_code
+        self.lock = threading.Lock()
+        self.throttled = set()
+
+    def analyze_document(self, Document, FeatureTypes):
+        with self.lock:
+            if Document['Bytes'] not in self.throttled:
+                self.throttled.add(Document['Bytes'])
+                raise ClientError({'Error': {'Code': self.error_code, 'Message': 'Rate exceeded'}}, 'AnalyzeDocument')
+        return {'Blocks': [], 'Document': Document['Bytes'].decode()}
+
+
+class FakeS3Client:
+    """
+    Stand-in for the boto3 S3 and Textract clients in S3 mode.
+    """
+    def __init__(self, keys):
+        self.lock = threading.Lock()
+        self.keys = set(keys)
+        self.listings = 0
+        self.uploads = []
+        self.connections = 0
+        self.max_connections = 0
+
+    def get_paginator(self, operation_name):
+        fake = self
+
+        class Paginator:
+            @staticmethod
+            def paginate(Bucket, Prefix):
+                fake.listings += 1
+                keys = sorted(key for key in fake.keys if key.startswith(Prefix))
+                for start in range(0, len(keys), 3):
+                    yield {'Contents': [{'Key': key} for key in keys[start:start + 3]]}
+
+        return Paginator()
+
+    def upload_file(self, file_name, bucket, key, Config):
+        connections = 1 if os.path.getsize(file_name) < Config.multipart_threshold else Config.max_concurrency
+        with self.lock:
+            self.connections += connections
+            self.max_connections = max(self.max_connections, self.connections)
+        time.sleep(.01)
+        with self.lock:
+            self.connections -= connections
+            self.uploads.append(key)
+            self.keys.add(key)
+
+    def analyze_document(self, Document, FeatureTypes):
+        with self.lock:
+            assert Document['S3Object']['Name'] in self.keys
+        return {'Blocks': [], 'Document': Document['S3Object']['Name']}
+
+
+class FakeTextractJobsClient(FakeS3Client):
+    """
+    Stand-in for the boto3 S3 and Textract clients with asynchronous jobs that are finished on the second poll.
+    """
+    def __init__(self, keys, pages, failing_keys=(), invalid_keys=()):
+        super(FakeTextractJobsClient, self).__init__(keys)
+        self.pages = pages
+        self.failing_keys = failing_keys
+        self.invalid_keys = invalid_keys
+        self.jobs = {}
+        self.polls = []
+
+    def start_document_analysis(self, DocumentLocation, FeatureTypes):
+        if DocumentLocation['S3Object']['Name'] in self.invalid_keys:
+            raise ClientError({'Error': {'Code': 'InvalidS3ObjectException'}}, 'StartDocumentAnalysis')
+        with self.lock:
+            job_id = f'job {len(self.jobs)}'
+            self.jobs[job_id] = DocumentLocation['S3Object']['Name']
+        return {'JobId': job_id}
+
+    def get_document_analysis(self, JobId, NextToken=None):
+        self.polls.append((JobId, NextToken))
+        if self.polls.count((JobId, None)) == 1:
+            return {'JobStatus': 'IN_PROGRESS'}
+        if self.jobs[JobId] in self.failing_keys:
+            return {'JobStatus': 'FAILED', 'StatusMessage': 'Unsupported document'}
+
+        # One page per response
+        page = int(NextToken or 1)
+        blocks = [{'BlockType': 'PAGE', 'Id': f'page {page}', 'Page': page},
+                  {'BlockType': 'LINE', 'Id': f'line {page}', 'Text': f'{self.jobs[JobId]} {page}', 'Page': page}]
+        response = {'JobStatus': 'SUCCEEDED', 'Blocks': blocks}
+        if page < self.pages:
+            response['NextToken'] = str(page + 1)
+        return response
+
+
+class TestTextract(TestCase):
+    def setUp(self) -> None:
+        form_analyzer.form_analyzer_logger.setLevel(logging.ERROR)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        for i in range(20):
+            with open(f'{self.temp_dir.name}/page_{i:02}.png', 'wb') as f:
+                f.write(f'page {i}'.encode())
+        with open(f'{self.temp_dir.name}/page_00.png.json', 'w') as f:
+            json.dump({'Blocks': []}, f)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def __check_results(self, fake: FakeTextract):
+        self.assertEqual(19, len(fake.documents))
+        for i in range(1, 20):
+            with open(f'{self.temp_dir.name}/page_{i:02}.png.json') as f:
+                self.assertEqual(f'page {i}', json.load(f)['Document'])
+        with open(f'{self.temp_dir.name}/page_00.png.json') as f:
+            self.assertNotIn('Document', json.load(f))
+
+    def test_run_textract(self):
+        fake = FakeTextract()
+        with mock.patch.object(AWSTextract, 'analyze_document', lambda textract, document: fake.analyze_document(textract, document)):
+            form_analyzer.run_textract(self.temp_dir.name)
+        self.__check_results(fake)
+        self.assertLessEqual(fake.max_in_flight, 4)
+
+    def test_run_textract_image_types(self):
+        for extension in ['jpg', 'JPEG', 'txt']:
+            with open(f'{self.temp_dir.name}/scan.{extension}', 'wb') as f:
+                f.write(extension.encode())
+        fake = FakeTextract()
+        with mock.patch.object(AWSTextract, 'analyze_document', lambda textract, document: fake.analyze_document(textract, document)):
+            form_analyzer.run_textract(self.temp_dir.name)
+        self.assertEqual(21, len(fake.documents))
+        self.assertTrue(os.path.exists(f'{self.temp_dir.name}/scan.JPEG.json'))
+        self.assertFalse(os.path.exists(f'{self.temp_dir.name}/scan.txt.json'))
+
+    def test_run_textract_async(self):
+        fake = FakeTextract()
+        with mock.patch.object(AWSTextract, 'analyze_document', lambda textract, document: fake.analyze_document(textract, document)):
+            form_analyzer.run_textract(self.temp_dir.name, max_in_flight=6)
+        self.__check_results(fake)
+        self.assertLessEqual(fake.max_in_flight, 6)
+        self.assertGreater(fake.max_in_flight, 1)
+
+    def test_run_textract_async_reads(self):
+        fake = FakeTextract()
+        with mock.patch.object(AWSTextract, 'analyze_document', lambda textract, document: fake.analyze_document(textract, document)):
+            form_analyzer.run_textract(self.temp_dir.name, max_in_flight=6, max_reads=2)
+        self.__check_results(fake)
+        # Each request holds its image file in memory
+        self.assertLessEqual(fake.max_in_flight, 2)
+
+    def test_run_textract_throttled(self):
+        client = ThrottlingTextractClient()
+        with mock.patch('form_analyzer.textract.boto3.client', return_value=client) as client_factory, \
+                mock.patch('form_analyzer.throttling.time.sleep') as sleep:
+            statistics = form_analyzer.run_textract(self.temp_dir.name)
+        client_factory.assert_called_once()
+        self.assertEqual(4, client_factory.call_args.kwargs['config'].max_pool_connections)
+        self.assertEqual(19, sleep.call_count)
+        self.assertEqual('38 requests, 19 throttled, 19 retries, 0 failed', str(statistics))
+        for i in range(1, 20):
+            with open(f'{self.temp_dir.name}/page_{i:02}.png.json') as f:
+                self.assertEqual(f'page {i}', json.load(f)['Document'])
+
+    def test_run_textract_s3(self):
+        # page_02.png.old shares the prefix of page_02.png, but page_02.png is not on S3 yet
+        client = FakeS3Client(['forms/page_01.png', 'forms/page_02.png.old', 'forms/page_05.png', 'other/page_03.png'])
+        with mock.patch('form_analyzer.textract.boto3.client', return_value=client):
+            form_analyzer.run_textract(self.temp_dir.name, s3_bucket_name='bucket', s3_folder='forms/')
+        self.assertEqual(1, client.listings)
+        self.assertEqual(sorted(f'forms/page_{i:02}.png' for i in range(2, 20) if i != 5), sorted(client.uploads))
+        # The single-part uploads use the whole connection pool, but not more
+        self.assertEqual(4, client.max_connections)
+        for i in range(1, 20):
+            with open(f'{self.temp_dir.name}/page_{i:02}.png.json') as f:
+                self.assertEqual(f'forms/page_{i:02}.png', json.load(f)['Document'])
+
+    def test_run_textract_s3_multipart(self):
+        for i in range(4):
+            with open(f'{self.temp_dir.name}/large_{i}.png', 'wb') as f:
+                f.truncate(8 * 1024 * 1024)
+        client = FakeS3Client([])
+        with mock.patch('form_analyzer.textract.boto3.client', return_value=client):
+            form_analyzer.run_textract(self.temp_dir.name, s3_bucket_name='bucket')
+        self.assertEqual(23, len(client.uploads))
+        # Each multipart upload uses two connections, so only two of them run at the same time
+        self.assertEqual(4, client.max_connections)
+
+    def test_run_textract_jobs(self):
+        client = FakeTextractJobsClient(['forms/a.pdf', 'forms/b.PDF', 'forms/c.pdf', 'forms/c.png'], 12)
+        target_folder = f'{self.temp_dir.name}/jobs'
+        os.makedirs(target_folder)
+        with open(f'{target_folder}/c_0001.json', 'w') as f:
+            json.dump({'Blocks': []}, f)
+
+        with mock.patch('form_analyzer.textract.boto3.client', return_value=client), \
+                mock.patch('form_analyzer.textract.time.sleep') as sleep:
+            form_analyzer.run_textract_jobs(target_folder, 'bucket', 'forms/', max_jobs=1)
+
+        self.assertEqual({'job 0': 'forms/a.pdf', 'job 1': 'forms/b.PDF'}, client.jobs)
+        self.assertEqual(1 + 12 + 1 + 12, len(client.polls))
+        self.assertEqual(4, sleep.call_count)
+
+        form_pages = FormPages(12, [])
+        file_groups = get_form_file_groups(target_folder, form_pages)
+        self.assertEqual([[f'{target_folder}/a_{page:04}.json' for page in range(1, 13)],
+                          [f'{target_folder}/b_{page:04}.json' for page in range(1, 13)],
+                          [f'{target_folder}/c_0001.json']], file_groups)
+        form_pages.words_on_page = [[f'forms/b.PDF {page}'] for page in range(1, 13)]
+        self.assertEqual([f'b_{page:04}' for page in range(1, 13)], parse_form(file_groups[1], form_pages).page_files)
+
+        # There are no images of the pages to link to
+        for link_pages, hyperlinks in [(True, ['b_0001', 'b_0002']), (False, [None, None])]:
+            excel_writer = ExcelWriter(f'{self.temp_dir.name}/jobs.xlsx', link_pages=link_pages)
+            excel_writer.open(['', 'Field'])
+            excel_writer.write(['b_0001, b_0002', ''], [UncertainField(1, 'b_0002')])
+            excel_writer.close()
+            row = next(load_workbook(f'{self.temp_dir.name}/jobs.xlsx').active.iter_rows(min_row=2))
+            self.assertEqual(['b_0001, b_0002', '???'], [cell.value for cell in row])
+            self.assertEqual(hyperlinks, [cell.hyperlink.target if cell.hyperlink else None for cell in row])
+
+    def test_run_textract_jobs_subfolders(self):
+        client = FakeTextractJobsClient(['forms/a.pdf', 'forms/2021/a.pdf', 'forms/2022/a.pdf'], 1)
+        target_folder = f'{self.temp_dir.name}/jobs'
+
+        with mock.patch('form_analyzer.textract.boto3.client', return_value=client), \
+                mock.patch('form_analyzer.textract.time.sleep'):
+            form_analyzer.run_textract_jobs(target_folder, 'bucket', 'forms/')
+
+        self.assertEqual(['2021_a_0001.json', '2022_a_0001.json', 'a_0001.json'], sorted(os.listdir(target_folder)))
+
+        # A PDF in a subfolder must not overwrite the results of another PDF
+        client = FakeTextractJobsClient(['forms/2021/a.pdf', 'forms/2021_a.pdf'], 1)
+        with mock.patch('form_analyzer.textract.boto3.client', return_value=client):
+            with self.assertRaisesRegex(ValueError, 'forms/2021/a.pdf and forms/2021_a.pdf'):
+                form_analyzer.run_textract_jobs(f'{self.temp_dir.name}/other_jobs', 'bucket', 'forms/')
+        self.assertEqual({}, client.jobs)
+
+    def test_run_textract_jobs_failed(self):
+        client = FakeTextractJobsClient(['forms/a.pdf', 'forms/b.pdf', 'forms/c.pdf'], 2, ['forms/b.pdf'])
+        target_folder = f'{self.temp_dir.name}/jobs'
+
+        with mock.patch('form_analyzer.textract.boto3.client', return_value=client), \
+                mock.patch('form_analyzer.textract.time.sleep'):
+            with self.assertRaisesRegex(RuntimeError, 'forms/b.pdf'):
+                form_analyzer.run_textract_jobs(target_folder, 'bucket', 'forms/', max_jobs=2)
+
+        # The other jobs are finished and saved
+        self.assertEqual(['a_0001.json', 'a_0002.json', 'c_0001.json', 'c_0002.json'], sorted(os.listdir(target_folder)))
+
+    def test_run_textract_jobs_not_started(self):
+        client = FakeTextractJobsClient(['forms/a.pdf', 'forms/b.pdf', 'forms/c.pdf'], 2, invalid_keys=['forms/a.pdf'])
+        target_folder = f'{self.temp_dir.name}/jobs'
+
+        with mock.patch('form_analyzer.textract.boto3.client', return_value=client), \
+                mock.patch('form_analyzer.textract.time.sleep'):
+            with self.assertRaisesRegex(RuntimeError, 'forms/a.pdf'):
+                form_analyzer.run_textract_jobs(target_folder, 'bucket', 'forms/', max_jobs=1)
+
+        # The jobs of the other PDFs are still started, finished and saved
+        self.assertEqual(['b_0001.json', 'b_0002.json', 'c_0001.json', 'c_0002.json'], sorted(os.listdir(target_folder)))
+
+    def test_run_textract_cache(self):
+        fake = FakeTextract()
+        cache_directory = f'{self.temp_dir.name}/cache'
+        rescanned_folder = f'{self.temp_dir.name}/rescanned'
+        os.makedirs(rescanned_folder)
+        for i in range(1, 21):
+            with open(f'{rescanned_folder}/scan_{i:02}.png', 'wb') as f:
+                f.write(f'page {i}'.encode())
+
+        with mock.patch.object(AWSTextract, 'analyze_document', lambda textract, document: fake.analyze_document(textract, document)):
+            form_analyzer.run_textract(self.temp_dir.name, cache_directory=cache_directory)
+            self.assertEqual(19, len(fake.documents))
+            form_analyzer.run_textract(rescanned_folder, cache_directory=cache_directory, max_in_flight=4)
+
+        self.assertEqual(20, len(fake.documents))
+        self.assertEqual(b'page 20', fake.documents[-1])
+        for i in range(1, 21):
+            with open(f'{rescanned_folder}/scan_{i:02}.png.json') as f:
+                self.assertEqual(f'page {i}', json.load(f)['Document'])
+
+        response_cache = ResponseCache(cache_directory)
+        self.assertIsNotNone(response_cache.get(f'{rescanned_folder}/scan_20.png'))
+        self.assertIsNone(response_cache.get(f'{self.temp_dir.name}/page_00.png'))
+        self.assertEqual('1 hits, 1 misses, estimated savings $0.05', str(response_cache.statistics))
+
+    def test_throttler_retries(self):
+        client = ThrottlingTextractClient('ThrottlingException')
+        throttler = Throttler(2, max_retries=0, base_delay=0)
+        with self.assertRaises(ClientError):
+            throttler.call(lambda: client.analyze_document(Document={'Bytes': b'1'}, FeatureTypes=[]))
+        self.assertEqual({'Document': '1', 'Blocks': []},
+                         throttler.call(lambda: client.analyze_document(Document={'Bytes': b'1'}, FeatureTypes=[])))
+        self.assertEqual('2 requests, 1 throttled, 0 retries, 1 failed', str(throttler.statistics))
+
+        with self.assertRaises(ValueError):
+            throttler.call(lambda: int('no number'))
+        self.assertEqual(2, throttler.statistics.failures)
+
+    def test_adaptive_concurrency(self):
+        concurrency = AdaptiveConcurrency(8)
+        for _ in range(3):
+            concurrency.acquire()
+        concurrency.release(True)
+        self.assertEqual(4, concurrency.limit)
+        concurrency.release(True)
+        concurrency.release(True)
+        self.assertEqual(1, concurrency.limit)
+        for _ in range(10):
+            concurrency.acquire()
+            concurrency.release(False)
+        self.assertGreater(concurrency.limit, 4)
+        self.assertLessEqual(concurrency.limit, 8)
+
+    def test_token_bucket(self):
+        token_bucket = TokenBucket(200)
+        start = time.monotonic()
+        for _ in range(11):
+            token_bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, .045)